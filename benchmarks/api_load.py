@@ -0,0 +1,243 @@
+"""
+Benchmark de charge de l'API de prédiction.
+
+L'application FastAPI est exécutée dans le processus (httpx.ASGITransport, lifespan
+compris) sur une base SQLite temporaire. Open-Meteo est remplacé par un bouchon local
+(httpx.MockTransport) avec une latence configurable. Chaque scénario est joué à des
+niveaux de concurrence fixes ; débit et latences p50/p95/p99 sont écrits dans un
+fichier JSON.
+
+Avec --baseline, les résultats sont comparés à un fichier de référence : le script
+sort en erreur si le débit baisse ou si le p95 augmente de plus de --max-regression.
+
+Usage :
+    python benchmarks/api_load.py --synthetic
+    python benchmarks/api_load.py --model models/50_80_90_models_quantiles.pkl \\
+        --concurrency 1,8,32 --requests 500 --output benchmarks/results/api_load.json
+    python benchmarks/api_load.py --synthetic --baseline benchmarks/results/api_load.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "services" / "api"))
+
+SCENARIOS = {
+    "predict": "/predict",
+    "predict_batch": "/predict/batch",
+    "predict_route": "/predict/route",
+}
+
+
+def weather_day(date_str: str) -> dict:
+    """Réponse Open-Meteo d'une journée, déterministe pour une date donnée."""
+    rng = np.random.default_rng(int(date_str.replace("-", "")))
+    temperature = rng.normal(2.0, 6.0) + 4 * np.sin(np.arange(24) / 24 * 2 * np.pi)
+    return {
+        "hourly": {
+            "temperature_2m": temperature.round(1).tolist(),
+            "precipitation": rng.exponential(0.3, 24).round(1).tolist(),
+            "rain": rng.exponential(0.2, 24).round(1).tolist(),
+            "snowfall": [0.0] * 24,
+            "weather_code": rng.choice([0, 1, 2, 3, 61, 71], 24).tolist(),
+            "cloud_cover": rng.integers(0, 101, 24).tolist(),
+            "dew_point_2m": (temperature - 3).round(1).tolist(),
+            "wind_speed_10m": rng.uniform(0, 30, 24).round(1).tolist(),
+            "wind_gusts_10m": rng.uniform(10, 50, 24).round(1).tolist(),
+            "wind_direction_10m": rng.integers(0, 360, 24).tolist(),
+        },
+        "daily": {"sunrise": [f"{date_str}T08:00"], "sunset": [f"{date_str}T16:00"]},
+    }
+
+
+def weather_transport(latency_ms: float):
+    """Bouchon Open-Meteo : latence fixe puis réponse synthétique."""
+    import httpx
+
+    async def handler(request):
+        await asyncio.sleep(latency_ms / 1000)
+        return httpx.Response(200, json=weather_day(request.url.params["start_date"]))
+
+    return httpx.MockTransport(handler)
+
+
+def departure(rng, days: list[date]) -> dict:
+    day = days[rng.integers(len(days))]
+    return {"month": day.month, "day": day.day, "hour": int(rng.integers(24)), "day_of_week": day.weekday(),
+            "direction_id": int(rng.integers(2))}
+
+
+def payload(scenario: str, rng, days: list[date], batch_size: int) -> dict:
+    if scenario == "predict":
+        return {**departure(rng, days), "stop_sequence": int(rng.integers(1, 41))}
+    if scenario == "predict_batch":
+        return {"inputs": [{**departure(rng, days), "stop_sequence": int(rng.integers(1, 41))}
+                           for _ in range(batch_size)]}
+    return departure(rng, days)
+
+
+def percentiles(latencies: list[float]) -> dict:
+    ms = np.asarray(latencies) * 1000
+    if not len(ms):
+        return {"mean_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"mean_ms": round(float(ms.mean()), 3), "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3), "max_ms": round(float(ms.max()), 3)}
+
+
+async def run_level(client, scenario: str, concurrency: int, n_requests: int, rng, days, batch_size) -> dict:
+    path = SCENARIOS[scenario]
+    latencies, errors = [], 0
+    remaining = n_requests
+    rows = 0
+
+    async def worker():
+        nonlocal remaining, errors, rows
+        while remaining > 0:
+            remaining -= 1
+            body = payload(scenario, rng, days, batch_size)
+            start = time.perf_counter()
+            response = await client.post(path, json=body)
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                errors += 1
+                continue
+            latencies.append(elapsed)
+            rows += len(body["inputs"]) if scenario == "predict_batch" else (
+                len(response.json()["stops"]) if scenario == "predict_route" else 1)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "rows_per_s": round(rows / elapsed, 2),
+        **percentiles(latencies),
+    }
+
+
+async def run(args, model_path: str, db_path: str) -> list[dict]:
+    # Configuration lue à l'import des modules de l'API
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}?check_same_thread=false"
+    os.environ["MODEL_PATH"] = model_path
+    os.environ["MODEL_WATCH_INTERVAL"] = "0"
+
+    import httpx
+    from app.main import app
+    from app.weather_utils import weather_client
+
+    weather_client.transport = weather_transport(args.weather_latency_ms)
+    rng = np.random.default_rng(args.seed)
+    today = date.today()
+    days = [today - timedelta(days=k) for k in range(args.days)]
+
+    results = []
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for scenario in args.scenarios.split(","):
+                # Échauffement : caches météo, allocations, premiers appels aux modèles
+                await run_level(client, scenario, 4, 20, rng, days, args.batch_size)
+                for concurrency in map(int, args.concurrency.split(",")):
+                    n_requests = max(args.requests // (args.batch_size if scenario == "predict_batch" else 1), concurrency)
+                    res = await run_level(client, scenario, concurrency, n_requests, rng, days, args.batch_size)
+                    print(f"{scenario:>14} c={concurrency:<4} {res['throughput_rps']:>9.1f} req/s "
+                          f"{res['rows_per_s']:>10.1f} lignes/s  p50 {res['p50_ms']:.2f} ms  "
+                          f"p95 {res['p95_ms']:.2f} ms  p99 {res['p99_ms']:.2f} ms  erreurs {res['errors']}",
+                          file=sys.stderr)
+                    results.append(res)
+    return results
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    """Régressions par rapport à une référence : baisse de débit ou hausse du p95 au-delà de la tolérance."""
+    reference = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for res in results:
+        ref = reference.get((res["scenario"], res["concurrency"]))
+        if ref is None:
+            continue
+        if res["throughput_rps"] < ref["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{res['scenario']} c={res['concurrency']} : débit "
+                               f"{res['throughput_rps']} < {ref['throughput_rps']} req/s")
+        if ref["p95_ms"] and res["p95_ms"] > ref["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{res['scenario']} c={res['concurrency']} : p95 "
+                               f"{res['p95_ms']} > {ref['p95_ms']} ms")
+    return regressions
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="Chemin du pack .pkl (ou répertoire exporté)")
+    parser.add_argument("--synthetic", action="store_true", help="Génère un pack aléatoire (300 arbres par quantile)")
+    parser.add_argument("--scenarios", default="predict,predict_batch,predict_route")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=500, help="Lignes prédites par niveau de concurrence")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--days", type=int, default=7, help="Nombre de jours distincts demandés")
+    parser.add_argument("--weather-latency-ms", type=float, default=50.0, help="Latence simulée d'Open-Meteo")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=str(ROOT / "benchmarks" / "results" / "api_load.json"))
+    parser.add_argument("--baseline", help="Fichier de résultats de référence")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model
+        if model_path is None:
+            if not args.synthetic:
+                parser.error("--model ou --synthetic requis")
+            from model_startup import synthetic_bundle
+            model_path = os.path.join(tmp, "synthetic.pkl")
+            synthetic_bundle(model_path, 300)
+
+        # Les print de l'API sont conservés (leur coût fait partie de la mesure) mais pas affichés
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = asyncio.run(run(args, model_path, os.path.join(tmp, "bench.db")))
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats écrits dans {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"RÉGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
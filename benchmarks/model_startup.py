@@ -0,0 +1,153 @@
+"""
+Benchmark de démarrage des workers de l'API : temps de chargement et mémoire par worker
+selon le format du pack de modèles.
+
+Modes comparés :
+  - joblib  : chaque worker désérialise le .pkl (comportement historique)
+  - mmap    : chaque worker projette en mémoire le répertoire exporté (model_store.export_bundle)
+  - preload : le processus maître charge le .pkl avant le fork (gunicorn --preload)
+
+Pour chaque worker : durée d'import de app.model (chargement du pack compris), RSS,
+PSS (mémoire partagée répartie entre processus) et mémoire privée, lues dans
+/proc/self/smaps_rollup (Linux) après une première prédiction.
+
+Usage :
+    python benchmarks/model_startup.py --model models/50_80_90_models_quantiles.pkl --workers 4
+    python benchmarks/model_startup.py --synthetic --workers 4 --output benchmarks/results/startup.json
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "services" / "api"))
+
+
+def memory_usage() -> dict:
+    """RSS, PSS et mémoire privée du processus courant, en Mo."""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[0].endswith(":"):
+                fields[parts[0][:-1]] = int(parts[1]) / 1024
+    return {
+        "rss_mb": round(fields.get("Rss", 0.0), 1),
+        "pss_mb": round(fields.get("Pss", 0.0), 1),
+        "private_mb": round(fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0), 1),
+    }
+
+
+def _touch_model(model_instance):
+    """Une prédiction par lot : toutes les pages des tableaux d'arbres sont lues."""
+    rows = [{"direction_id": i % 2, "month": 1 + i % 12, "day": 1, "hour": i % 24, "day_of_week": i % 7}
+            for i in range(64)]
+    model_instance.predict_batch(rows)
+
+
+def worker(model_path: str, barrier, results):
+    start = time.perf_counter()
+    os.environ["MODEL_PATH"] = model_path
+    from app.model import model_instance
+    startup_s = time.perf_counter() - start
+
+    _touch_model(model_instance)
+    # Mesure après le chargement de tous les workers : les pages partagées sont comptées une fois
+    barrier.wait()
+    results.put({"pid": os.getpid(), "startup_s": round(startup_s, 3), **memory_usage()})
+    barrier.wait()
+
+
+def run_mode(mode: str, pkl_path: str, mmap_dir: str, n_workers: int) -> dict:
+    ctx = mp.get_context("fork" if mode == "preload" else "spawn")
+    path = mmap_dir if mode == "mmap" else pkl_path
+
+    if mode == "preload":
+        # Chargement dans le maître : les workers héritent des pages (copy-on-write)
+        os.environ["MODEL_PATH"] = pkl_path
+        from app.model import model_instance
+        _touch_model(model_instance)
+
+    barrier = ctx.Barrier(n_workers)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(path, barrier, results)) for _ in range(n_workers)]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    workers = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    return {
+        "mode": mode,
+        "workers": workers,
+        "wall_s": round(time.perf_counter() - start, 3),
+        "total_pss_mb": round(sum(w["pss_mb"] for w in workers), 1),
+    }
+
+
+def synthetic_bundle(path: str, n_estimators: int):
+    """Pack de même forme que train_model.py (3 quantiles), entraîné sur des données aléatoires."""
+    import joblib
+    import numpy as np
+    import pandas as pd
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    rng = np.random.default_rng(0)
+    columns = ["direction_id_1", "stop_sequence", "hour_sin", "hour_cos", "day_sin", "day_cos",
+               "month_sin", "month_cos", "temperature_2m", "precipitation", "wind_speed_10m"]
+    X = pd.DataFrame(rng.normal(size=(5000, len(columns))), columns=columns)
+    y = X["hour_sin"] * 60 + rng.normal(scale=30, size=len(X))
+    models = {
+        name: GradientBoostingRegressor(loss="quantile", alpha=alpha, n_estimators=n_estimators, max_depth=5).fit(X, y)
+        for name, alpha in [("P50_Median", 0.5), ("P80_Pessimist", 0.8), ("P90_Extreme", 0.9)]
+    }
+    joblib.dump(models, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="Chemin du pack .pkl")
+    parser.add_argument("--synthetic", action="store_true", help="Génère un pack aléatoire (300 arbres par quantile)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", default="joblib,mmap,preload")
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    from app.model_store import export_bundle
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pkl_path = args.model
+        if pkl_path is None:
+            if not args.synthetic:
+                parser.error("--model ou --synthetic requis")
+            pkl_path = os.path.join(tmp, "synthetic.pkl")
+            synthetic_bundle(pkl_path, 300)
+
+        mmap_dir = os.path.join(tmp, "fused")
+        export_bundle(pkl_path, mmap_dir)
+
+        # preload en dernier : le maître garde ensuite le pack en mémoire
+        modes = sorted(args.modes.split(","), key=lambda m: m == "preload")
+        report = {"model": pkl_path, "workers": args.workers,
+                  "results": [run_mode(m, pkl_path, mmap_dir, args.workers) for m in modes]}
+
+    for res in report["results"]:
+        startup = max(w["startup_s"] for w in res["workers"])
+        rss = sum(w["rss_mb"] for w in res["workers"]) / len(res["workers"])
+        print(f"{res['mode']:>8} : démarrage max {startup:.3f}s, RSS moyen {rss:.1f} Mo/worker, "
+              f"PSS total {res['total_pss_mb']:.1f} Mo")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
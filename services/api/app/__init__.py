@@ -1 +1,6 @@
-# Permet de traiter le folder 'api'comme un package python
\ No newline at end of file
+# Permet de traiter le folder 'api'comme un package python
+from dotenv import load_dotenv
+
+# Charger le fichier .env avant tout sous-module : leurs réglages (MODEL_PATH,
+# PREDICTION_CACHE_SIZE, MODEL_LINES_DIR...) sont lus à l'import
+load_dotenv()
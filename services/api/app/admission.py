@@ -0,0 +1,195 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request
+
+# Requêtes de prédiction traitées simultanément (0 = pas de limite), file d'attente bornée au-delà
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "64"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))
+# Attente maximale dans la file (secondes) avant un refus 503
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+# Limite par client (seau à jetons) : requêtes par seconde (0 = désactivée) et rafale autorisée
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "0"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "20"))
+# Le client est identifié par son adresse IP. Option : en-tête posé par un proxy de
+# confiance (ex. X-Real-IP), jamais un en-tête que le client choisit librement
+RATE_LIMIT_CLIENT_HEADER = os.getenv("RATE_LIMIT_CLIENT_HEADER", "")
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Limite le nombre de requêtes traitées simultanément.
+
+    Au-delà de `max_concurrency`, les requêtes attendent dans une file bornée à
+    `max_queue` places, au plus `queue_timeout` secondes. Une requête qui ne
+    trouve pas de place, ou qui attend trop, est refusée immédiatement : les
+    requêtes admises gardent une latence prévisible au lieu de s'accumuler.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float, retry_after: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = None
+        self._loop = None
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Sémaphore propre à la boucle d'événements courante
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+            self.active = 0
+            self.waiting = 0
+        return self._semaphore
+
+    async def acquire(self):
+        semaphore = self._get_semaphore()
+        if semaphore.locked():
+            if self.waiting >= self.max_queue:
+                self.rejected["queue_full"] += 1
+                raise AdmissionRejected("queue_full", self.retry_after)
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected["queue_timeout"] += 1
+                raise AdmissionRejected("queue_timeout", self.retry_after)
+            finally:
+                self.waiting -= 1
+        else:
+            await semaphore.acquire()
+        self.active += 1
+        self.admitted += 1
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.waiting,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+class TokenBucketLimiter:
+    """
+    Limite de débit par client : un seau de `burst` jetons par client, rechargé
+    à `rate` jetons par seconde. Les seaux des clients les moins récents sont
+    oubliés au-delà de `max_clients`.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self, client: str) -> float:
+        """Consomme un jeton. Renvoie 0 si la requête passe, sinon le délai avant le prochain jeton."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+                self.allowed += 1
+            else:
+                wait = (1 - tokens) / self.rate
+                self.rejected += 1
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "rate": self.rate,
+            "burst": self.burst,
+            "clients": len(self._buckets),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
+
+
+admission_controller = AdmissionController(
+    max_concurrency=ADMISSION_MAX_CONCURRENCY,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    retry_after=ADMISSION_RETRY_AFTER,
+)
+rate_limiter = TokenBucketLimiter(
+    rate=RATE_LIMIT_RATE,
+    burst=RATE_LIMIT_BURST,
+    max_clients=RATE_LIMIT_MAX_CLIENTS,
+)
+
+
+def client_id(request: Request) -> str:
+    if RATE_LIMIT_CLIENT_HEADER and (value := request.headers.get(RATE_LIMIT_CLIENT_HEADER)):
+        return value
+    return request.client.host if request.client else "inconnu"
+
+
+async def admit(request: Request):
+    """
+    Dépendance des routes de prédiction : limite par client (429), puis place
+    dans la limite de concurrence (503 si la file est pleine ou l'attente trop longue).
+    """
+    if rate_limiter.enabled:
+        wait = rate_limiter.acquire(client_id(request))
+        if wait > 0:
+            raise HTTPException(status_code=429, detail="Trop de requêtes pour ce client",
+                                headers={"Retry-After": str(math.ceil(wait))})
+
+    if not admission_controller.enabled:
+        yield
+        return
+
+    try:
+        await admission_controller.acquire()
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=f"Service saturé ({e.reason})",
+                            headers={"Retry-After": str(math.ceil(e.retry_after))})
+    try:
+        yield
+    finally:
+        admission_controller.release()
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import time
+
+from .model import model_instance
+
+# Micro-batching des requêtes /predict unitaires (fenêtre en millisecondes, 0 = désactivé)
+PREDICT_BATCH_WINDOW_MS = float(os.getenv("PREDICT_BATCH_WINDOW_MS", "0"))
+PREDICT_BATCH_MAX_ROWS = int(os.getenv("PREDICT_BATCH_MAX_ROWS", "64"))
+
+# Bornes supérieures des classes de l'histogramme des tailles de lot
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+
+class InferenceBatcher:
+    """
+    Regroupe les prédictions unitaires concurrentes en un seul appel vectorisé.
+
+    Chaque requête dépose ses features et attend un futur. Le lot est évalué dès
+    que `max_rows` lignes sont en attente, ou `window` secondes après l'arrivée
+    de la première : un seul MLModel.predict_batch dans un thread de travail,
+    puis chaque futur reçoit sa ligne de résultats.
+    """
+
+    def __init__(self, model, window: float, max_rows: int):
+        self.model = model
+        self.window = window
+        self.max_rows = max_rows
+        self._pending = []
+        self._timer = None
+        # Références des lots en cours (une tâche non référencée peut être collectée)
+        self._running = set()
+
+        self.batches = 0
+        self.rows = 0
+        self.batch_sizes = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    async def submit(self, features: dict) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((features, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_rows:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: list):
+        started = time.perf_counter()
+        self._record(len(batch), [started - enqueued for _, _, enqueued in batch])
+        try:
+            results = await asyncio.to_thread(self.model.predict_batch, [features for features, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            # L'appelant a pu être annulé (client déconnecté) pendant l'évaluation
+            if not future.done():
+                future.set_result(result)
+
+    def _record(self, size: int, delays: list[float]):
+        self.batches += 1
+        self.rows += size
+        bucket = next((i for i, bound in enumerate(BATCH_SIZE_BUCKETS) if size <= bound), len(BATCH_SIZE_BUCKETS))
+        self.batch_sizes[bucket] += 1
+        self.queue_delay_total += sum(delays)
+        self.queue_delay_max = max(self.queue_delay_max, max(delays))
+
+    def stats(self) -> dict:
+        labels = [str(bound) for bound in BATCH_SIZE_BUCKETS] + ["+Inf"]
+        return {
+            "enabled": self.enabled,
+            "window_ms": self.window * 1000,
+            "max_rows": self.max_rows,
+            "pending": len(self._pending),
+            "running": len(self._running),
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "batch_size_histogram": dict(zip(labels, self.batch_sizes)),
+            "mean_queue_delay_ms": 1000 * self.queue_delay_total / self.rows if self.rows else 0.0,
+            "max_queue_delay_ms": 1000 * self.queue_delay_max,
+        }
+
+
+predict_batcher = InferenceBatcher(
+    model_instance,
+    window=PREDICT_BATCH_WINDOW_MS / 1000,
+    max_rows=PREDICT_BATCH_MAX_ROWS,
+)
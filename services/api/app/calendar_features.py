@@ -0,0 +1,57 @@
+import os
+from datetime import date, datetime
+
+import numpy as np
+
+try:
+    # Image Docker : le module de l'ETL est copié dans app/ au build (cf. services/api/Dockerfile)
+    from .calendar_sweden import build_calendar_table
+except ImportError:
+    # Dépôt : source unique des règles, partagée avec l'ETL météo
+    import importlib.util
+    from pathlib import Path
+
+    _source = Path(__file__).resolve().parents[3] / "src" / "pipeline" / "weather" / "utils" / "calendar_sweden.py"
+    _spec = importlib.util.spec_from_file_location("calendar_sweden", _source)
+    _module = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(_module)
+    build_calendar_table = _module.build_calendar_table
+
+
+class CalendarTable:
+    """
+    Table calendaire suédoise précalculée, une ligne par jour sur une plage d'années.
+
+    Les features (est_weekend, est_jour_ferie, vacances_scolaires) sont lues par
+    simple accès à l'index du jour au lieu d'être recalculées à chaque requête.
+    """
+
+    def __init__(self, start_year: int, end_year: int):
+        self.start = date(start_year, 1, 1)
+        # Mêmes règles que la table de l'ETL météo (build_calendar_table)
+        table = build_calendar_table(start_year, end_year)
+
+        self.est_weekend = table["est_weekend"].to_numpy(np.int8)
+        self.est_jour_ferie = table["est_jour_ferie"].to_numpy(np.int8)
+        self.vacances_scolaires = table["vacances_scolaires"].to_numpy(np.int8)
+
+    def __len__(self):
+        return len(self.est_weekend)
+
+    def lookup(self, day: date) -> dict:
+        i = (day - self.start).days
+        if not 0 <= i < len(self):
+            # Hors plage : on calcule l'année demandée à la volée
+            return CalendarTable(day.year, day.year).lookup(day)
+        return {
+            "est_weekend": int(self.est_weekend[i]),
+            "est_jour_ferie": int(self.est_jour_ferie[i]),
+            "vacances_scolaires": int(self.vacances_scolaires[i]),
+        }
+
+
+_current_year = datetime.now().year
+calendar_table = CalendarTable(
+    int(os.getenv("CALENDAR_START_YEAR") or _current_year - 1),
+    int(os.getenv("CALENDAR_END_YEAR") or _current_year + 1),
+)
@@ -0,0 +1,72 @@
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """Appel refusé : le disjoncteur est ouvert."""
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur autour d'un service externe.
+
+    Après `failure_threshold` échecs consécutifs, le disjoncteur s'ouvre : les
+    appels sont refusés immédiatement pendant `reset_timeout` secondes. Ensuite
+    un seul appel d'essai est autorisé (semi-ouvert) : son succès referme le
+    disjoncteur, son échec le rouvre pour un nouveau délai.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self.opens = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """Vrai si l'appel peut être tenté."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout and not self._trial:
+                self._trial = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            # Échec de l'essai (semi-ouvert) ou seuil atteint : ouverture pour un nouveau délai
+            if self._trial or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self.opens += 1
+            self._trial = False
+
+    def reset(self):
+        self.record_success()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "opens": self.opens,
+            "rejected": self.rejected,
+        }
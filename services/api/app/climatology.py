@@ -0,0 +1,128 @@
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .weather_store import WEATHER_FEATURES, INTEGER_FEATURES
+
+# Demi-largeur (en jours) de la fenêtre glissante autour de chaque jour de l'année
+CLIMATOLOGY_WINDOW_DAYS = int(os.getenv("CLIMATOLOGY_WINDOW_DAYS", "7"))
+
+DAYS_IN_YEAR = 366
+CONTINUOUS = [i for i, name in enumerate(WEATHER_FEATURES) if name not in INTEGER_FEATURES]
+DISCRETE = [i for i, name in enumerate(WEATHER_FEATURES) if name in INTEGER_FEATURES]
+
+
+class Climatology:
+    """
+    Météo typique calculée sur les archives du feature store (stg_weather_archive).
+
+    Deux tables compactes :
+      - par (jour de l'année, heure) : moyenne des variables continues sur une
+        fenêtre glissante de ±CLIMATOLOGY_WINDOW_DAYS jours (366 x 24 x n_features) ;
+      - par (mois, heure) : valeur la plus fréquente des variables entières (code
+        météo, indicateurs), qui n'ont pas de moyenne, et repli si un jour manque.
+
+    Sert aux dates au-delà de l'horizon des prévisions (aucun appel réseau) et
+    de météo de repli quand Open-Meteo est indisponible.
+    """
+
+    def __init__(self, window_days: int = CLIMATOLOGY_WINDOW_DAYS):
+        self.window_days = window_days
+        self._lock = threading.Lock()
+        # (table jour de l'année (366, 24, n_features), table mois (12, 24, n_features)), NaN si vide
+        self._tables = None
+        self.built_at = None
+        self.hits = 0
+        self.misses = 0
+
+    def build(self, store) -> int:
+        """Recalcule les tables à partir des archives du feature store. Renvoie le nombre de cases (jour, heure)."""
+        timestamps, values = store.history(observed_only=True)
+        tables = None
+        if len(values):
+            ts = pd.DatetimeIndex(timestamps)
+            tables = (self._by_day_of_year(ts, values), self._by_month(ts, values))
+
+        with self._lock:
+            self._tables = tables
+            self.built_at = datetime.now()
+        return self.cells
+
+    def _by_day_of_year(self, ts: pd.DatetimeIndex, values: np.ndarray) -> np.ndarray:
+        doy = ts.dayofyear.to_numpy() - 1
+        hour = ts.hour.to_numpy()
+        sums = np.zeros((DAYS_IN_YEAR, 24, len(CONTINUOUS)))
+        counts = np.zeros((DAYS_IN_YEAR, 24, 1))
+        np.add.at(sums, (doy, hour), values[:, CONTINUOUS])
+        np.add.at(counts, (doy, hour), 1)
+
+        # Fenêtre glissante circulaire (le 31 décembre est voisin du 1er janvier)
+        window_sums, window_counts = sums.copy(), counts.copy()
+        for shift in range(1, self.window_days + 1):
+            for direction in (shift, -shift):
+                window_sums += np.roll(sums, direction, axis=0)
+                window_counts += np.roll(counts, direction, axis=0)
+
+        table = np.full((DAYS_IN_YEAR, 24, len(WEATHER_FEATURES)), np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            table[:, :, CONTINUOUS] = np.where(window_counts > 0, window_sums / window_counts, np.nan)
+        return table
+
+    def _by_month(self, ts: pd.DatetimeIndex, values: np.ndarray) -> np.ndarray:
+        df = pd.DataFrame(values, columns=WEATHER_FEATURES)
+        df["month"], df["hour"] = ts.month, ts.hour
+        agg = {name: (lambda s: s.mode().iloc[0]) if name in INTEGER_FEATURES else "median" for name in WEATHER_FEATURES}
+        grouped = df.groupby(["month", "hour"]).agg(agg)
+
+        table = np.full((12, 24, len(WEATHER_FEATURES)), np.nan)
+        months = grouped.index.get_level_values("month").to_numpy() - 1
+        hours = grouped.index.get_level_values("hour").to_numpy()
+        table[months, hours] = grouped[WEATHER_FEATURES].to_numpy(dtype=np.float64)
+        return table
+
+    @property
+    def cells(self) -> int:
+        tables = self._tables
+        return 0 if tables is None else int((~np.isnan(tables[0][:, :, CONTINUOUS[0]])).sum())
+
+    def _row(self, target_date: datetime) -> np.ndarray | None:
+        tables = self._tables
+        if tables is None:
+            return None
+        by_day, by_month = tables
+        row = by_month[target_date.month - 1, target_date.hour].copy()
+        day_row = by_day[target_date.timetuple().tm_yday - 1, target_date.hour]
+        # Variables continues : valeur du jour de l'année si disponible, sinon celle du mois
+        if not np.isnan(day_row[CONTINUOUS]).any():
+            row[CONTINUOUS] = day_row[CONTINUOUS]
+        return None if np.isnan(row).any() else row
+
+    def has_data(self, target_date: datetime) -> bool:
+        """Météo typique disponible pour cette heure, sans effet sur les compteurs."""
+        return self._row(target_date) is not None
+
+    def lookup(self, target_date: datetime) -> dict | None:
+        row = self._row(target_date)
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {
+            name: int(v) if name in INTEGER_FEATURES else float(v)
+            for name, v in zip(WEATHER_FEATURES, row)
+        }
+
+    def stats(self) -> dict:
+        return {
+            "cells": self.cells,
+            "window_days": self.window_days,
+            "built_at": self.built_at.isoformat() if self.built_at else None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+climatology = Climatology()
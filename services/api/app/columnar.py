@@ -0,0 +1,169 @@
+import io
+import json
+import os
+from datetime import date, datetime
+
+import numpy as np
+
+from .schemas import PredictionInput
+
+# Nombre maximal de lignes d'une requête en colonnes
+COLUMNAR_MAX_ROWS = int(os.getenv("COLUMNAR_MAX_ROWS", "1000000"))
+
+JSON = "application/json"
+ARROW = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+MEDIA_TYPES = (JSON, ARROW, PARQUET)
+
+# Mêmes colonnes, mêmes valeurs par défaut que PredictionInput
+INPUT_FIELDS = PredictionInput.model_fields
+RANGES = {"month": (1, 12), "day": (1, 31), "hour": (0, 23), "day_of_week": (0, 6)}
+
+
+class ColumnarError(ValueError):
+    """Corps de requête en colonnes invalide (422)."""
+
+
+class UnsupportedFormat(ValueError):
+    """Format non pris en charge, ou pyarrow absent pour Arrow / Parquet (415)."""
+
+
+def media_type(content_type: str | None) -> str:
+    """Format d'une requête d'après son Content-Type (JSON par défaut)."""
+    value = (content_type or JSON).split(";")[0].strip().lower()
+    if value not in MEDIA_TYPES:
+        raise UnsupportedFormat(f"Content-Type {value} non pris en charge ({', '.join(MEDIA_TYPES)})")
+    return value
+
+
+def _pyarrow():
+    # Import différé : pyarrow n'est requis que pour les formats Arrow et Parquet
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise UnsupportedFormat("pyarrow n'est pas installé : seul le format JSON est disponible")
+    return pyarrow
+
+
+def read_columns(body: bytes, fmt: str) -> dict:
+    """Décode le corps d'une requête en {colonne: valeurs}."""
+    if fmt == JSON:
+        try:
+            columns = json.loads(body)
+        except ValueError as e:
+            raise ColumnarError(f"JSON invalide : {e}")
+        if not isinstance(columns, dict):
+            raise ColumnarError("Le corps doit être un objet {colonne: [valeurs]}")
+        return columns
+
+    pa = _pyarrow()
+    try:
+        if fmt == ARROW:
+            table = pa.ipc.open_stream(body).read_all()
+        else:
+            table = pa.parquet.read_table(pa.BufferReader(body))
+    except pa.ArrowException as e:
+        raise ColumnarError(f"Corps {fmt} illisible : {e}")
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+def write_columns(columns: dict, fmt: str) -> bytes:
+    """Encode les colonnes de la réponse dans le format de la requête."""
+    if fmt == JSON:
+        return json.dumps({name: values.tolist() for name, values in columns.items()}).encode()
+
+    pa = _pyarrow()
+    table = pa.table(columns)
+    sink = io.BytesIO()
+    if fmt == ARROW:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pa.parquet.write_table(table, sink)
+    return sink.getvalue()
+
+
+def _int_column(name: str, values) -> np.ndarray:
+    array = np.asarray(values)
+    if array.ndim == 1 and array.dtype.kind in "iu":
+        return array.astype(np.int64, copy=False)
+    if array.ndim == 1 and array.dtype.kind == "f":
+        valid = np.isfinite(array) & (array == np.round(array))
+        if valid.all():
+            return array.astype(np.int64)
+        bad = int(np.flatnonzero(~valid)[0])
+        raise ColumnarError(f"{name}[{bad}] = {array[bad]} n'est pas un entier")
+    raise ColumnarError(f"{name} doit être un tableau d'entiers")
+
+
+def _str_column(name: str, values) -> np.ndarray:
+    array = np.asarray(values)
+    if array.ndim != 1 or (array.dtype.kind == "O" and any(v is None for v in array)):
+        raise ColumnarError(f"{name} doit être un tableau de valeurs non nulles")
+    return array.astype(str)
+
+
+def validate_columns(columns: dict) -> tuple[dict, int]:
+    """
+    Valide les colonnes en une passe vectorisée par colonne (types, bornes, dates)
+    et complète les colonnes optionnelles. Renvoie ({colonne: tableau NumPy}, nombre de lignes).
+    """
+    missing = [name for name, field in INPUT_FIELDS.items() if field.is_required() and name not in columns]
+    if missing:
+        raise ColumnarError(f"Colonnes manquantes : {', '.join(missing)}")
+    not_arrays = [name for name in INPUT_FIELDS if name in columns and not isinstance(columns[name], (list, np.ndarray))]
+    if not_arrays:
+        raise ColumnarError(f"Colonnes qui ne sont pas des tableaux : {', '.join(not_arrays)}")
+    lengths = {name: len(columns[name]) for name in INPUT_FIELDS if name in columns}
+    if len(set(lengths.values())) != 1:
+        raise ColumnarError(f"Les colonnes doivent avoir la même longueur : {lengths}")
+    n = next(iter(lengths.values()))
+    if not 1 <= n <= COLUMNAR_MAX_ROWS:
+        raise ColumnarError(f"Entre 1 et {COLUMNAR_MAX_ROWS} lignes attendues ({n} reçues)")
+
+    out = {}
+    for name, field in INPUT_FIELDS.items():
+        if name not in columns:
+            out[name] = np.full(n, field.default)
+        elif field.annotation is int:
+            out[name] = _int_column(name, columns[name])
+        else:
+            out[name] = _str_column(name, columns[name])
+
+    for name, (low, high) in RANGES.items():
+        bad = np.flatnonzero((out[name] < low) | (out[name] > high))
+        if bad.size:
+            raise ColumnarError(f"{name}[{bad[0]}] = {out[name][bad[0]]} hors de [{low}, {high}]")
+
+    # Dates vérifiées une fois par (mois, jour) distincts, pour l'année en cours comme la météo
+    year = datetime.now().year
+    for key in np.unique(out["month"] * 100 + out["day"]):
+        try:
+            date(year, int(key) // 100, int(key) % 100)
+        except ValueError:
+            bad = int(np.flatnonzero(out["month"] * 100 + out["day"] == key)[0])
+            raise ColumnarError(f"Date invalide à la ligne {bad} : {int(key) % 100}/{int(key) // 100}")
+
+    return out, n
+
+
+def distinct(*arrays: np.ndarray) -> tuple[list[tuple], np.ndarray]:
+    """
+    Combinaisons distinctes de plusieurs colonnes d'entiers positifs (validées), et
+    indice de la combinaison de chaque ligne. Chaque combinaison est codée en un
+    seul entier : bien plus rapide qu'un np.unique ligne par ligne.
+    """
+    dims = [int(a.max()) + 1 for a in arrays]
+    codes, inverse = np.unique(np.ravel_multi_index(arrays, dims), return_inverse=True)
+    return list(zip(*(c.tolist() for c in np.unravel_index(codes, dims)))), inverse.ravel()
+
+
+def expand(values: list[dict], inverse: np.ndarray) -> dict:
+    """Colonnes {nom: tableau} des lignes, à partir des valeurs calculées par combinaison distincte."""
+    names = dict.fromkeys(name for d in values for name in d)
+    return {
+        name: np.array([0 if (v := d.get(name)) is None else v for d in values], dtype=np.float64)[inverse]
+        for name in names
+    }
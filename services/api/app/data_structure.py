@@ -41,3 +41,31 @@ class PredictionLog(Base):
     prediction_P80 = Column(Float)
     prediction_P90 = Column(Float)
     timestamp = Column(DateTime, default=datetime.utcnow)
+
+
+# Évaluation fantôme : prédictions du pack principal (servies) et du pack candidat, côte à côte
+class ShadowPredictionLog(Base):
+    __tablename__ = "shadow_prediction_logs"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    bus_nbr = Column(String)
+    direction_id = Column(Integer)
+    stop_sequence = Column(Integer)
+    month = Column(Integer)
+    day = Column(Integer)
+    hour = Column(Integer)
+    day_of_week = Column(Integer)
+    weather_code = Column(Integer)
+    temperature_2m = Column(Float)
+
+    primary_version = Column(String)
+    prediction_P50 = Column(Float)
+    prediction_P80 = Column(Float)
+    prediction_P90 = Column(Float)
+
+    shadow_version = Column(String)
+    shadow_P50 = Column(Float)
+    shadow_P80 = Column(Float)
+    shadow_P90 = Column(Float)
+    timestamp = Column(DateTime, default=datetime.utcnow)
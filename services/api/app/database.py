@@ -1,27 +1,108 @@
 import os
-from dotenv import load_dotenv
+import time
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 
-# Charger les variables d'environnement depuis le fichier .env
-load_dotenv()
+from .metrics import DB_POOL_WAIT_SECONDS, DB_CONNECT_SECONDS
+
+# Les variables du fichier .env sont chargées à l'import du package (app/__init__.py)
 
 # URL de connexion NeonDB
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
 # On retire les guillemets si présents
 if SQLALCHEMY_DATABASE_URL:
-    
+
     SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.strip("'\"")
 
 if SQLALCHEMY_DATABASE_URL is None:
     raise ValueError("DATABASE_URL n'est pas renseigné. Veuillez renseigner l'URL dans le fichier .env")
 
+# Réglages du pool de connexions (ignorés pour SQLite)
+# Neon ferme les connexions inactives : pre-ping et recyclage évitent de servir une connexion morte
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Moteur asynchrone (asyncpg) en plus du moteur synchrone
+DATABASE_ASYNC = os.getenv("DATABASE_ASYNC", "false").lower() in ("1", "true", "yes")
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool qui mesure l'attente d'une connexion et la durée d'ouverture des nouvelles connexions."""
+
+    pool_label = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start, engine=self.pool_label)
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            DB_CONNECT_SECONDS.observe(time.perf_counter() - start, engine=self.pool_label)
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    pool_label = "async"
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """Options de create_engine : pool instrumenté et configurable, sauf pour SQLite."""
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def async_database_url(url: str) -> tuple[str, dict]:
+    """
+    Convertit l'URL synchrone en URL asynchrone (asyncpg, aiosqlite).
+    asyncpg ne connaît pas les paramètres libpq sslmode / channel_binding des URL Neon :
+    le SSL est passé dans connect_args.
+    """
+    parsed = make_url(url)
+    connect_args = {}
+    if parsed.get_backend_name() == "postgresql":
+        sslmode = parsed.query.get("sslmode")
+        parsed = parsed.set(drivername="postgresql+asyncpg").difference_update_query(["sslmode", "channel_binding"])
+        if sslmode and sslmode != "disable":
+            connect_args["ssl"] = "require" if sslmode in ("require", "prefer", "allow") else True
+    elif parsed.get_backend_name() == "sqlite":
+        parsed = parsed.set(drivername="sqlite+aiosqlite")
+    return parsed.render_as_string(hide_password=False), connect_args
+
+
 # Création de l'engine et de la session
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = None
+AsyncSessionLocal = None
+if DATABASE_ASYNC:
+    # Import différé : sqlalchemy[asyncio] (greenlet) et asyncpg ne sont requis qu'avec DATABASE_ASYNC
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    _async_url, _connect_args = async_database_url(SQLALCHEMY_DATABASE_URL)
+    async_engine = create_async_engine(_async_url, connect_args=_connect_args, **engine_options(_async_url, is_async=True))
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
 # Schéma de base de BDD
 Base = declarative_base()
 
@@ -0,0 +1,146 @@
+import numpy as np
+
+# Features cycliques : (colonne source, période, colonne sin, colonne cos)
+# Identiques au Feature Engineering de preprocess dans train_model.py
+CYCLIC_FEATURES = [
+    ("hour", 24, "hour_sin", "hour_cos"),
+    ("day_of_week", 7, "day_sin", "day_cos"),
+    ("month", 12, "month_sin", "month_cos"),
+]
+
+# Colonnes catégorielles dummifiées (drop_first) à l'entraînement : direction_id_1, weather_code_X...
+CATEGORICAL_FEATURES = ["bus_nbr", "direction_id", "weather_code"]
+
+
+def _category(value) -> str | None:
+    """Reproduit le astype(str) de l'entraînement (les codes numériques sont des entiers)."""
+    if value is None:
+        return None
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        value = int(value)
+    return str(value)
+
+
+class FeatureBuilder:
+    """
+    Construit la matrice de features attendue par les modèles quantiles.
+
+    La correspondance nom de colonne -> index est calculée une seule fois à partir
+    de `feature_names_in_` au chargement du modèle. Chaque requête remplit ensuite
+    directement un tableau float64 préalloué, sans DataFrame intermédiaire.
+    """
+
+    def __init__(self, feature_names):
+        self.feature_names = np.asarray(feature_names, dtype=object)
+        self.n_features = len(self.feature_names)
+        self.index = {name: i for i, name in enumerate(self.feature_names)}
+
+        # Colonnes dérivées (cycliques + One-Hot) : tout le reste est recopié tel quel
+        derived = set()
+        self.cyclic = []
+        for source, period, sin_col, cos_col in CYCLIC_FEATURES:
+            sin_idx, cos_idx = self.index.get(sin_col), self.index.get(cos_col)
+            derived.update((sin_col, cos_col))
+            if sin_idx is not None or cos_idx is not None:
+                self.cyclic.append((source, 2 * np.pi / period, sin_idx, cos_idx))
+
+        # Mapping catégorie -> index de la colonne One-Hot (ex: "1" -> index de direction_id_1)
+        self.one_hot = {}
+        for source in CATEGORICAL_FEATURES:
+            prefix = f"{source}_"
+            mapping = {
+                name[len(prefix):]: i for name, i in self.index.items() if name.startswith(prefix)
+            }
+            derived.update(prefix + category for category in mapping)
+            self.one_hot[source] = mapping
+
+        self.passthrough = [(name, i) for name, i in self.index.items() if name not in derived]
+
+    def build_row(self, features: dict) -> np.ndarray:
+        """Construit la matrice (1, n_features) d'une requête unitaire."""
+        row = np.zeros((1, self.n_features), dtype=np.float64)
+        x = row[0]
+
+        for name, i in self.passthrough:
+            value = features.get(name)
+            if value is not None:
+                x[i] = value
+
+        for source, factor, sin_idx, cos_idx in self.cyclic:
+            value = features.get(source)
+            if value is None:
+                continue
+            angle = factor * value
+            if sin_idx is not None:
+                x[sin_idx] = np.sin(angle)
+            if cos_idx is not None:
+                x[cos_idx] = np.cos(angle)
+
+        for source, mapping in self.one_hot.items():
+            i = mapping.get(_category(features.get(source)))
+            if i is not None:
+                x[i] = 1
+
+        return row
+
+    def build_matrix(self, rows: list[dict]) -> np.ndarray:
+        """Construit la matrice (n, n_features) d'un lot, colonne par colonne."""
+        n = len(rows)
+        X = np.zeros((n, self.n_features), dtype=np.float64)
+        if n == 0:
+            return X
+
+        for name, i in self.passthrough:
+            X[:, i] = [0 if (v := r.get(name)) is None else v for r in rows]
+
+        for source, factor, sin_idx, cos_idx in self.cyclic:
+            values = [r.get(source) for r in rows]
+            present = np.array([v is not None for v in values])
+            angle = factor * np.array([0 if v is None else v for v in values], dtype=np.float64)
+            if sin_idx is not None:
+                X[:, sin_idx] = np.where(present, np.sin(angle), 0.0)
+            if cos_idx is not None:
+                X[:, cos_idx] = np.where(present, np.cos(angle), 0.0)
+
+        for source, mapping in self.one_hot.items():
+            if not mapping:
+                continue
+            cols = np.array([mapping.get(_category(r.get(source)), -1) for r in rows])
+            hit = cols >= 0
+            X[np.nonzero(hit)[0], cols[hit]] = 1
+
+        return X
+
+    def build_columns(self, columns: dict, n: int) -> np.ndarray:
+        """
+        Construit la matrice (n, n_features) d'un lot fourni en colonnes
+        ({nom: tableau NumPy}) : opérations vectorisées, sans dictionnaire par ligne.
+        Les catégories sont converties une fois par valeur distincte.
+        """
+        X = np.zeros((n, self.n_features), dtype=np.float64)
+
+        for name, i in self.passthrough:
+            values = columns.get(name)
+            if values is not None:
+                X[:, i] = values
+
+        for source, factor, sin_idx, cos_idx in self.cyclic:
+            values = columns.get(source)
+            if values is None:
+                continue
+            angle = factor * np.asarray(values, dtype=np.float64)
+            if sin_idx is not None:
+                X[:, sin_idx] = np.sin(angle)
+            if cos_idx is not None:
+                X[:, cos_idx] = np.cos(angle)
+
+        for source, mapping in self.one_hot.items():
+            values = columns.get(source)
+            if not mapping or values is None:
+                continue
+            categories, inverse = np.unique(np.asarray(values), return_inverse=True)
+            cols = np.array([mapping.get(_category(c), -1) for c in categories.tolist()])[inverse.ravel()]
+            hit = cols >= 0
+            X[np.nonzero(hit)[0], cols[hit]] = 1
+
+        return X
@@ -0,0 +1,228 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# Ordre des quantiles dans le pack de modèles (cf. train_quantile_models dans train_model.py)
+QUANTILE_NAMES = ["P50_Median", "P80_Pessimist", "P90_Extreme"]
+
+# Tableaux sauvegardés par save() : un fichier .npy chacun, projetables en mémoire (mmap)
+ARRAY_NAMES = ["feature", "threshold", "children", "value", "roots", "tree_offsets", "baseline"]
+META_FILENAME = "meta.json"
+
+# Nombre de lignes évaluées à la fois : garde la matrice (lignes x arbres) dans le cache CPU
+CHUNK_SIZE = 32
+
+
+class FusedQuantileEnsemble:
+    """
+    Moteur d'inférence des trois GradientBoostingRegressor quantiles.
+
+    Tous les arbres (3 x 300) sont aplatis au chargement dans des tableaux NumPy
+    contigus (feature, threshold, left, right, value). Un lot est ensuite évalué
+    en une seule passe vectorisée sur tous les arbres à la fois : à chaque niveau
+    de profondeur, chaque couple (ligne, arbre) descend d'un nœud. Les feuilles
+    pointent sur elles-mêmes, ce qui rend la descente idempotente une fois atteintes.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, tree_offsets,
+                 baseline, max_depth, quantile_names, feature_names, children=None):
+        self.feature = feature
+        self.threshold = threshold
+        # Enfants entrelacés (gauche, droite) : l'enfant du nœud i est children[2 * i + va_a_droite]
+        if children is None:
+            children = np.stack([left, right], axis=1).ravel()
+        self.children = children
+        self.left = children[0::2] if left is None else left
+        self.right = children[1::2] if right is None else right
+        self.value = value
+        self.roots = roots
+        self.tree_offsets = tree_offsets
+        self.baseline = baseline
+        self.max_depth = int(max_depth)
+        self.quantile_names = list(quantile_names)
+        self.feature_names = np.asarray(feature_names, dtype=object)
+
+    @classmethod
+    def from_models(cls, models: dict, quantile_names=QUANTILE_NAMES):
+        """Aplatit les arbres d'un pack {nom_quantile: GradientBoostingRegressor}."""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        tree_offsets, baseline = [0], []
+        max_depth, offset = 0, 0
+
+        for name in quantile_names:
+            model = models[name]
+            n_features = model.n_features_in_
+
+            # Prédiction initiale (DummyRegressor quantile) avant les arbres
+            if model.init_ == "zero":
+                baseline.append(0.0)
+            else:
+                baseline.append(float(np.ravel(model.init_.predict(np.zeros((1, n_features))))[0]))
+
+            for estimator in model.estimators_[:, 0]:
+                tree = estimator.tree_
+                node_ids = np.arange(tree.node_count)
+                is_leaf = tree.children_left == -1
+
+                roots.append(offset)
+                features.append(np.where(is_leaf, 0, tree.feature))
+                thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+                lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+                rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+                # Le learning_rate est appliqué une fois pour toutes aux valeurs des feuilles
+                values.append(model.learning_rate * tree.value[:, 0, 0])
+
+                max_depth = max(max_depth, tree.max_depth)
+                offset += tree.node_count
+
+            tree_offsets.append(len(roots))
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+            right=np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            tree_offsets=np.asarray(tree_offsets, dtype=np.intp),
+            baseline=np.asarray(baseline, dtype=np.float64),
+            max_depth=max_depth,
+            quantile_names=quantile_names,
+            feature_names=models[quantile_names[0]].feature_names_in_,
+        )
+
+    def save(self, directory: str, **meta):
+        """
+        Écrit les tableaux aplatis dans un répertoire (un .npy par tableau + meta.json).
+        Les métadonnées supplémentaires (ex. version du pack source) sont ajoutées au meta.json.
+
+        Les workers gardent les .npy d'un export projetés en mémoire : réécrire ces
+        fichiers sur place les tronquerait sous leurs pieds (SIGBUS). L'export est
+        donc écrit dans un répertoire versionné caché voisin (.<nom>.v-*), puis
+        `directory` devient un lien symbolique basculé atomiquement vers ce répertoire.
+        """
+        directory = os.path.normpath(os.path.abspath(directory))
+        parent, name = os.path.split(directory)
+        os.makedirs(parent, exist_ok=True)
+        target = tempfile.mkdtemp(prefix=f".{name}.v-", dir=parent)
+        os.chmod(target, 0o755)
+        for array_name in ARRAY_NAMES:
+            np.save(os.path.join(target, f"{array_name}.npy"), np.ascontiguousarray(getattr(self, array_name)))
+        meta.update({
+            "max_depth": self.max_depth,
+            "quantile_names": self.quantile_names,
+            "feature_names": [str(feature) for feature in self.feature_names],
+        })
+        # meta.json est écrit en dernier : sa présence signale un export complet
+        with open(os.path.join(target, META_FILENAME), "w") as f:
+            json.dump(meta, f, indent=2)
+        _switch_link(directory, target)
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: str | None = "r"):
+        """
+        Recharge un moteur sauvegardé par save(). Avec mmap_mode="r", les tableaux
+        sont projetés en lecture seule depuis le disque : les pages sont partagées
+        (cache de pages du noyau) entre tous les workers qui ouvrent le même répertoire.
+        Le lien d'un export est résolu une fois : meta.json et tableaux viennent du même export.
+        """
+        directory = os.path.realpath(directory)
+        meta = read_meta(directory)
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode) for name in ARRAY_NAMES}
+        return cls(
+            left=None,
+            right=None,
+            max_depth=meta["max_depth"],
+            quantile_names=meta["quantile_names"],
+            feature_names=meta["feature_names"],
+            **arrays,
+        )
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def nbytes(self) -> int:
+        """Taille des tableaux aplatis (projetés ou non en mémoire)."""
+        return sum(getattr(self, name).nbytes for name in ARRAY_NAMES)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Renvoie la matrice (n, nb_quantiles) des prédictions pour un lot."""
+        # Comme sklearn, les seuils sont comparés à X converti en float32
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        out = np.empty((X.shape[0], len(self.quantile_names)), dtype=np.float64)
+        for start in range(0, X.shape[0], CHUNK_SIZE):
+            out[start:start + CHUNK_SIZE] = self._predict_chunk(X[start:start + CHUNK_SIZE])
+        return out
+
+    def _predict_chunk(self, X: np.ndarray) -> np.ndarray:
+        n, n_features = X.shape
+        X_flat = X.ravel()
+        row_offsets = (np.arange(n, dtype=np.intp) * n_features)[:, None]
+
+        # Buffers réutilisés à chaque niveau de profondeur (np.take avec out=)
+        node = np.empty((n, self.n_trees), dtype=np.intp)
+        node[:] = self.roots
+        idx = np.empty_like(node)
+        x_val = np.empty(node.shape, dtype=np.float32)
+        thr = np.empty(node.shape, dtype=np.float64)
+        go_right = np.empty(node.shape, dtype=bool)
+
+        for _ in range(self.max_depth):
+            np.take(self.feature, node, out=idx)
+            idx += row_offsets
+            np.take(X_flat, idx, out=x_val)
+            np.take(self.threshold, node, out=thr)
+            np.greater(x_val, thr, out=go_right)
+            node *= 2
+            node += go_right
+            np.take(self.children, node, out=node)
+
+        # Somme des feuilles atteintes, arbre par arbre, pour chaque quantile
+        leaf_sum = np.add.reduceat(np.take(self.value, node), self.tree_offsets[:-1], axis=1)
+        return leaf_sum + self.baseline
+
+
+def read_meta(directory: str) -> dict:
+    with open(os.path.join(directory, META_FILENAME)) as f:
+        return json.load(f)
+
+
+def _switch_link(directory: str, target: str):
+    """
+    Fait pointer le lien `directory` vers `target` (rename atomique d'un lien temporaire).
+    L'ancienne version reste en place pour les workers qui la projettent encore ;
+    les versions plus anciennes sont supprimées (les fichiers déjà projetés
+    restent valides tant qu'ils sont ouverts).
+    """
+    parent, name = os.path.split(directory)
+    previous = None
+    if os.path.islink(directory):
+        previous = os.path.join(parent, os.readlink(directory))
+    elif os.path.isdir(directory):
+        # Export d'un format antérieur (répertoire réel) : déplacé sans réécrire ses fichiers
+        if os.listdir(directory):
+            previous = tempfile.mkdtemp(prefix=f".{name}.v-", dir=parent)
+            os.rmdir(previous)
+            os.rename(directory, previous)
+        else:
+            os.rmdir(directory)
+
+    link = os.path.join(parent, f".{name}.link-{os.getpid()}")
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(target), link)
+    os.replace(link, directory)
+
+    keep = {os.path.normpath(target), os.path.normpath(previous or target)}
+    for entry in os.listdir(parent):
+        path = os.path.join(parent, entry)
+        if entry.startswith(f".{name}.v-") and os.path.normpath(path) not in keep:
+            shutil.rmtree(path, ignore_errors=True)
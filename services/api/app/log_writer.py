@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from .data_structure import PredictionLog, ShadowPredictionLog
+from .database import SessionLocal, AsyncSessionLocal
+from .metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def log_columns(table) -> set:
+    return {c.name for c in table.__table__.columns} - {"id"}
+
+
+class PredictionLogWriter:
+    """
+    Écriture asynchrone et groupée des prediction_logs.
+
+    Les routes déposent les lignes dans une file bornée en mémoire et répondent
+    sans attendre la base. Une tâche de fond vide la file par INSERT multi-lignes,
+    toutes les `flush_interval` secondes ou dès que `batch_size` lignes sont en
+    attente. Si la file est pleine, les nouvelles lignes sont écartées et comptées.
+
+    Avec une fabrique de sessions asynchrones (DATABASE_ASYNC), la tâche de fond
+    écrit directement depuis la boucle d'événements au lieu d'un thread de travail.
+    `table` permet d'écrire dans une autre table de logs (ex. shadow_prediction_logs).
+    """
+
+    def __init__(self, session_factory, max_queue: int, batch_size: int, flush_interval: float,
+                 async_session_factory=None, table=PredictionLog):
+        self.session_factory = session_factory
+        self.async_session_factory = async_session_factory
+        self.table = table
+        self.columns = log_columns(table)
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = deque()
+        self._queue_lock = threading.Lock()
+        # Un seul vidage à la fois (tâche de fond, arrêt, appels explicites)
+        self._flush_lock = threading.Lock()
+        self._wakeup = None
+        self._task = None
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+
+    def submit(self, rows: list[dict]) -> bool:
+        """Met en file des lignes de log. Renvoie False si la file est pleine (lignes écartées)."""
+        timestamp = datetime.utcnow()
+        with self._queue_lock:
+            if len(self._queue) + len(rows) > self.max_queue:
+                self.dropped += len(rows)
+                return False
+            for row in rows:
+                log = {k: v for k, v in row.items() if k in self.columns}
+                log.setdefault("timestamp", timestamp)
+                self._queue.append(log)
+            pending = len(self._queue)
+
+        if pending >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    def _take_batch(self) -> list[dict]:
+        with self._queue_lock:
+            return [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+    def flush(self) -> int:
+        """Écrit en base toutes les lignes en attente, par lots de `batch_size`. Bloquant."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    break
+
+                db = self.session_factory()
+                try:
+                    with STAGE_SECONDS.time(stage="db_log"):
+                        db.execute(insert(self.table), batch)
+                        db.commit()
+                    written += len(batch)
+                except Exception as e:
+                    db.rollback()
+                    self.failed += len(batch)
+                    logger.error(f"Échec de l'écriture de {len(batch)} {self.table.__tablename__} : {e}")
+                finally:
+                    db.close()
+            self.written += written
+            if written:
+                self.flushes += 1
+        return written
+
+    async def flush_async(self) -> int:
+        """Équivalent non bloquant de flush(), avec la fabrique de sessions asynchrones."""
+        written = 0
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                break
+
+            async with self.async_session_factory() as db:
+                try:
+                    with STAGE_SECONDS.time(stage="db_log"):
+                        await db.execute(insert(self.table), batch)
+                        await db.commit()
+                    written += len(batch)
+                except Exception as e:
+                    await db.rollback()
+                    self.failed += len(batch)
+                    logger.error(f"Échec de l'écriture de {len(batch)} {self.table.__tablename__} : {e}")
+        self.written += written
+        if written:
+            self.flushes += 1
+        return written
+
+    async def _flush_in_background(self):
+        if self.async_session_factory is not None:
+            await self.flush_async()
+        else:
+            await asyncio.to_thread(self.flush)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._flush_in_background()
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Arrête la tâche de fond puis vide la file."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._wakeup = None
+        await self._flush_in_background()
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "max_queue": self.max_queue,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes,
+        }
+
+
+log_writer = PredictionLogWriter(
+    SessionLocal,
+    max_queue=int(os.getenv("LOG_QUEUE_MAX", "10000")),
+    batch_size=int(os.getenv("LOG_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", "1.0")),
+    async_session_factory=AsyncSessionLocal,
+)
+
+# Prédictions du pack fantôme, à côté de celles du pack principal (cf. shadow.py)
+shadow_log_writer = PredictionLogWriter(
+    SessionLocal,
+    max_queue=int(os.getenv("SHADOW_LOG_QUEUE_MAX", "10000")),
+    batch_size=int(os.getenv("LOG_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", "1.0")),
+    async_session_factory=AsyncSessionLocal,
+    table=ShadowPredictionLog,
+)
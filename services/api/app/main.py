@@ -1,17 +1,95 @@
+import asyncio
+import json
+import hmac
 import logging
+import os
+import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from .schemas import PredictionInput, PredictionOutput
-from .model import model_instance
-from .database import SessionLocal, engine, get_db
+from datetime import datetime, timedelta
+import numpy as np
+from fastapi import FastAPI, HTTPException, Header, Request, Depends
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response
+from .schemas import (
+    PredictionInput, PredictionOutput, BatchPredictionInput, BatchPredictionOutput,
+    RoutePredictionInput, RoutePredictionOutput, StopPredictionOutput,
+    HorizonPredictionInput, HorizonPredictionOutput, HourPredictionOutput,
+)
+from .model import model_instance, OUTPUT_KEYS
+from .database import SessionLocal, engine, async_engine
 from . import data_structure
-from .weather_utils import get_weather_features, get_calendar_features
+from .weather_utils import (
+    get_weather_features, get_calendar_features, weather_client, weather_cache, weather_single_flight, weather_breaker,
+    get_weather_range, get_calendar_features_for_date,
+)
+from .climatology import climatology
+from .weather_store import weather_store, WEATHER_STORE_REFRESH
+from .log_writer import log_writer, shadow_log_writer
+from .shadow import shadow_evaluator, SHADOW_MODEL_PATH
+from .prediction_grid import prediction_grid, PREDICTION_GRID_MAX_STOP
+from .batcher import predict_batcher
+from .admission import admit, admission_controller, rate_limiter
+from . import columnar
+from .metrics import REGISTRY, REQUEST_SECONDS, REQUESTS_IN_FLIGHT, STAGE_SECONDS
 
 # Configuration des logs
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+async def refresh_weather_store():
+    """Charge les tables météo de Neon dans le feature store en mémoire."""
+    try:
+        hours = await asyncio.to_thread(weather_store.refresh, engine)
+        logger.info(f"Feature store météo chargé : {hours} heures disponibles.")
+        # Climatologie de repli, recalculée sur l'historique à jour
+        await asyncio.to_thread(climatology.build, weather_store)
+        # Les prédictions en cache ont pu être calculées avec l'ancienne météo
+        model_instance.clear_prediction_cache()
+    except Exception as e:
+        logger.warning(f"Feature store météo non chargé (repli sur Open-Meteo) : {e}")
+    await rebuild_prediction_grid()
+
+async def rebuild_prediction_grid():
+    """Réévalue la grille de prédictions (nouvelle météo, nouveau pack ou changement de jour)."""
+    try:
+        cells = await asyncio.to_thread(prediction_grid.build)
+        if cells:
+            logger.info(f"Grille de prédictions construite : {cells} cellules en {prediction_grid.build_seconds:.2f}s.")
+    except Exception as e:
+        logger.warning(f"Grille de prédictions non construite (calcul en direct) : {e}")
+
+async def refresh_weather_store_periodically():
+    while True:
+        await asyncio.sleep(WEATHER_STORE_REFRESH)
+        await refresh_weather_store()
+
+# Surveillance du pack de modèles : rechargement automatique si le fichier change (0 = désactivé)
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "60"))
+# Jeton requis pour les routes /admin : sans jeton configuré, elles sont refusées
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+async def reload_model():
+    """Charge et teste le nouveau pack dans un thread, puis le met en service."""
+    info = await asyncio.to_thread(model_instance.reload)
+    await rebuild_prediction_grid()
+    return info
+
+async def load_line_bundles(lines):
+    """Charge dans un thread les packs par ligne absents de la mémoire (premier appel ou pack évincé)."""
+    missing = {line for line in lines if model_instance.registry.needs_load(line)}
+    if missing:
+        with STAGE_SECONDS.time(stage="model_load"):
+            for line in missing:
+                await asyncio.to_thread(model_instance.bundle_for, line)
+
+async def watch_model_file():
+    while True:
+        await asyncio.sleep(MODEL_WATCH_INTERVAL)
+        try:
+            if await asyncio.to_thread(model_instance.needs_reload):
+                await reload_model()
+        except Exception as e:
+            logger.error(f"Échec du rechargement automatique des modèles : {e}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Création des tables au démarrage de l'application
@@ -21,8 +99,39 @@ async def lifespan(app: FastAPI):
         logger.info("Tables de base de données prêtes.")
     except Exception as e:
         logger.error(f"Erreur lors de la création des tables : {e}")
+
+    # Feature store météo : chargement initial puis rafraîchissement périodique
+    await refresh_weather_store()
+    refresh_task = asyncio.create_task(refresh_weather_store_periodically())
+
+    # Écriture des prediction_logs en tâche de fond
+    log_writer.start()
+
+    # Évaluation fantôme d'un pack candidat (sans effet sur les réponses)
+    if SHADOW_MODEL_PATH:
+        try:
+            info = await asyncio.to_thread(shadow_evaluator.load, SHADOW_MODEL_PATH)
+            logger.info(f"Pack fantôme {info['version']} chargé depuis {SHADOW_MODEL_PATH}.")
+        except Exception as e:
+            logger.error(f"Pack fantôme non chargé, évaluation fantôme désactivée : {e}")
+    shadow_log_writer.start()
+    shadow_evaluator.start()
+
+    # Rechargement à chaud du pack de modèles
+    watch_task = asyncio.create_task(watch_model_file()) if MODEL_WATCH_INTERVAL > 0 else None
+
     yield
 
+    refresh_task.cancel()
+    if watch_task:
+        watch_task.cancel()
+    await shadow_evaluator.stop()
+    await log_writer.stop()
+    await shadow_log_writer.stop()
+    await weather_client.aclose()
+    if async_engine is not None:
+        await async_engine.dispose()
+
 
 app = FastAPI(
     title="API Delay Forecast",
@@ -31,12 +140,150 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+def collect_component_stats():
+    """Compteurs internes des composants (leurs stats()) au format Prometheus."""
+    info = model_instance.info()
+    yield ("delay_forecast_model_info", "gauge", "Pack de modèles actif.",
+           [({"version": info["version"] or "none", "format": info.get("format", "")}, 1)])
+
+    registry = model_instance.registry.stats()
+    yield ("delay_forecast_model_registry_loads_total", "counter", "Packs par ligne chargés depuis le disque.",
+           [({}, registry["loads"])])
+    yield ("delay_forecast_model_registry_evictions_total", "counter", "Packs par ligne évincés de la mémoire (LRU).",
+           [({}, registry["evictions"])])
+    yield ("delay_forecast_model_registry_resident_bytes", "gauge", "Mémoire estimée des packs par ligne résidents.",
+           [({}, registry["resident_bytes"])])
+
+    caches = {
+        "prediction": model_instance.prediction_cache.stats(),
+        "weather_day": weather_cache.stats(),
+        "weather_store": weather_store.stats(),
+        "climatology": climatology.stats(),
+        "prediction_grid": prediction_grid.stats(),
+    }
+    yield ("delay_forecast_cache_hits_total", "counter", "Succès des caches et tables en mémoire.",
+           [({"cache": name}, st["hits"]) for name, st in caches.items()])
+    yield ("delay_forecast_cache_misses_total", "counter", "Échecs des caches et tables en mémoire.",
+           [({"cache": name}, st["misses"]) for name, st in caches.items()])
+
+    yield ("delay_forecast_weather_breaker_open", "gauge", "Disjoncteur Open-Meteo ouvert (1) ou fermé (0).",
+           [({}, int(weather_breaker.state != "closed"))])
+    yield ("delay_forecast_weather_breaker_rejected_total", "counter", "Appels Open-Meteo refusés par le disjoncteur.",
+           [({}, weather_breaker.rejected)])
+
+    pools = {"sync": engine.pool}
+    if async_engine is not None:
+        pools["async"] = async_engine.pool
+    pools = {name: pool for name, pool in pools.items() if hasattr(pool, "checkedout")}
+    yield ("delay_forecast_db_pool_checked_out", "gauge", "Connexions du pool en cours d'utilisation.",
+           [({"engine": name}, pool.checkedout()) for name, pool in pools.items()])
+    yield ("delay_forecast_db_pool_idle", "gauge", "Connexions du pool disponibles.",
+           [({"engine": name}, pool.checkedin()) for name, pool in pools.items()])
+
+    single_flight = weather_single_flight.stats()
+    yield ("delay_forecast_weather_fetches_coalesced_total", "counter", "Appels Open-Meteo regroupés avec un appel en cours.",
+           [({}, single_flight["coalesced"])])
+    yield ("delay_forecast_weather_fetches_in_flight", "gauge", "Appels Open-Meteo en cours.",
+           [({}, single_flight["in_flight"])])
+
+    logs = log_writer.stats()
+    yield ("delay_forecast_prediction_logs_total", "counter", "Lignes de prediction_logs par issue.",
+           [({"result": result}, logs[result]) for result in ("written", "dropped", "failed")])
+    yield ("delay_forecast_prediction_logs_queued", "gauge", "Lignes de prediction_logs en attente d'écriture.",
+           [({}, logs["queued"])])
+
+    batcher = predict_batcher.stats()
+    yield ("delay_forecast_microbatches_total", "counter", "Lots formés par le micro-batching de /predict.",
+           [({}, batcher["batches"])])
+    yield ("delay_forecast_microbatch_rows_total", "counter", "Lignes évaluées par le micro-batching de /predict.",
+           [({}, batcher["rows"])])
+
+    shadow = shadow_evaluator.stats()
+    yield ("delay_forecast_shadow_rows_total", "counter", "Lignes de l'évaluation fantôme par issue.",
+           [({"result": result}, shadow[result]) for result in ("scored", "dropped_load", "dropped_full", "failed")])
+    yield ("delay_forecast_shadow_queued", "gauge", "Lignes en attente d'évaluation fantôme.",
+           [({}, shadow["queued"])])
+
+    admission = admission_controller.stats()
+    yield ("delay_forecast_admission_active", "gauge", "Requêtes de prédiction en cours de traitement.",
+           [({}, admission["active"])])
+    yield ("delay_forecast_admission_queued", "gauge", "Requêtes de prédiction en attente d'admission.",
+           [({}, admission["queued"])])
+    yield ("delay_forecast_admission_rejected_total", "counter", "Requêtes de prédiction refusées (503 saturation, 429 limite client).",
+           [({"reason": reason}, n) for reason, n in admission["rejected"].items()]
+           + [({"reason": "rate_limited"}, rate_limiter.rejected)])
+
+REGISTRY.add_collector(collect_component_stats)
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """Durée et nombre de requêtes en cours, par route."""
+    routes = {route.path for route in app.routes}
+    path = request.url.path if request.url.path in routes else "other"
+    REQUESTS_IN_FLIGHT.inc(path=path)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REQUESTS_IN_FLIGHT.dec(path=path)
+        REQUEST_SECONDS.observe(time.perf_counter() - start, path=path, method=request.method, status=status)
+
 @app.get("/")
 async def root():
     return {"message": "Bienvenue sur l'API de prédiction de retard des transports Stockholm Delay Forecast"}
 
-@app.post("/predict", response_model=PredictionOutput)
-async def predict(data: PredictionInput, db: Session = Depends(get_db)):
+@app.get("/model")
+async def model_info():
+    """Version du pack de modèles actif."""
+    return model_instance.info()
+
+@app.post("/admin/reload")
+async def admin_reload(x_admin_token: str | None = Header(default=None)):
+    """
+    Recharge le pack de modèles sans interruption : le nouveau pack est chargé et
+    testé en arrière-plan, puis substitué ; les requêtes en cours finissent sur l'ancien.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Route d'administration désactivée (ADMIN_TOKEN non renseigné)")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Jeton d'administration invalide")
+    try:
+        return await reload_model()
+    except Exception as e:
+        logger.error(f"Échec du rechargement des modèles : {e}")
+        raise HTTPException(status_code=500, detail=f"Rechargement impossible, version {model_instance.version} conservée : {e}")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métriques au format texte Prometheus (latences par étape, compteurs, requêtes en cours)."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+async def stats():
+    """Statistiques des caches et files internes (taux de succès, tailles, débordements)."""
+    return {
+        "model_version": model_instance.version,
+        "model_registry": model_instance.registry.stats(),
+        "prediction_cache": model_instance.prediction_cache.stats(),
+        "weather_cache": weather_cache.stats(),
+        "weather_single_flight": weather_single_flight.stats(),
+        "weather_store": weather_store.stats(),
+        "weather_breaker": weather_breaker.stats(),
+        "climatology": climatology.stats(),
+        "prediction_grid": prediction_grid.stats(),
+        "predict_batcher": predict_batcher.stats(),
+        "admission": admission_controller.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "prediction_logs": log_writer.stats(),
+        "shadow": shadow_evaluator.stats(),
+        "shadow_prediction_logs": shadow_log_writer.stats(),
+    }
+
+@app.post("/predict", response_model=PredictionOutput, dependencies=[Depends(admit)])
+async def predict(data: PredictionInput):
     
     # On transforme l'objet Pydantic en dictionnaire
     features = data.model_dump()
@@ -46,35 +293,282 @@ async def predict(data: PredictionInput, db: Session = Depends(get_db)):
     
     # Complétion automatique des features manquantes
     # 1. Calendrier
-    cal_feats = get_calendar_features(data.month, data.day, data.day_of_week)
+    with STAGE_SECONDS.time(stage="calendar"):
+        cal_feats = get_calendar_features(data.month, data.day, data.day_of_week)
     features.update(cal_feats)
         
     # 2. Météo - Récupération systématique
     print("Récupération des données météo...")
     try:
-        meteo_feats = get_weather_features(data.month, data.day, data.hour)
+        with STAGE_SECONDS.time(stage="weather"):
+            meteo_feats = await get_weather_features(data.month, data.day, data.hour)
+        weather_degraded = meteo_feats.pop("weather_degraded", False)
         features.update(meteo_feats)
     except Exception as e:
         print(f"Erreur météo : {e}")
         raise HTTPException(status_code=503, detail=str(e))
     
-    # 3. Prédiction
+    # 3. Prédiction : grille précalculée, sinon calcul en direct
+    # (regroupé avec les requêtes concurrentes si le micro-batching est activé)
     try:
-        predictions = model_instance.predict(features)
+        await load_line_bundles([data.bus_nbr])
+        with STAGE_SECONDS.time(stage="predict"):
+            predictions = prediction_grid.lookup(features)
+            if predictions is None:
+                if predict_batcher.enabled:
+                    predictions = await predict_batcher.submit(features)
+                else:
+                    predictions = model_instance.predict(features)
         print(f"Prédictions calculées: {predictions}")
     except Exception as e:
         print(f"Erreur lors de la prédiction : {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
-    # 4. Log en DB
-    db_log = data_structure.PredictionLog(**features, **predictions)
-    db.add(db_log)
-    db.commit()
-    db.refresh(db_log)
-    print(f"Log enregistré en base de données (ID: {db_log.id})")
+    # 4. Log en DB (écriture groupée en tâche de fond, hors du chemin de la requête)
+    with STAGE_SECONDS.time(stage="log_submit"):
+        log_writer.submit([{**features, **predictions}])
+        shadow_evaluator.submit([features], [predictions])
     print(f"-------------------------------")
     
-    return PredictionOutput(**predictions)
+    return PredictionOutput(**predictions, weather_degraded=weather_degraded)
+
+@app.post("/predict/batch", response_model=BatchPredictionOutput, dependencies=[Depends(admit)])
+async def predict_batch(data: BatchPredictionInput):
+
+    print(f"--- Nouvelle requête batch reçue ({len(data.inputs)} lignes) ---")
+
+    # Les features calendaires et météo ne dépendent que de la date :
+    # on ne les calcule qu'une fois par (mois, jour, heure) distincts du lot
+    calendar_cache = {}
+    for item in data.inputs:
+        cal_key = (item.month, item.day, item.day_of_week)
+        if cal_key not in calendar_cache:
+            calendar_cache[cal_key] = get_calendar_features(*cal_key)
+
+    # Les recherches météo distinctes sont lancées en parallèle
+    meteo_keys = list(dict.fromkeys((item.month, item.day, item.hour) for item in data.inputs))
+    try:
+        meteo = await asyncio.gather(*(get_weather_features(*key) for key in meteo_keys))
+    except Exception as e:
+        print(f"Erreur météo : {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    meteo_by_key = {key: (feats, feats.pop("weather_degraded", False)) for key, feats in zip(meteo_keys, meteo)}
+
+    rows = []
+    degraded = []
+    for item in data.inputs:
+        features = item.model_dump()
+        features.update(calendar_cache[(item.month, item.day, item.day_of_week)])
+        meteo_feats, weather_degraded = meteo_by_key[(item.month, item.day, item.hour)]
+        features.update(meteo_feats)
+        rows.append(features)
+        degraded.append(weather_degraded)
+
+    # Prédiction vectorisée : un seul appel par modèle quantile pour tout le lot,
+    # dans un thread pour ne pas bloquer la boucle d'événements
+    try:
+        await load_line_bundles({item.bus_nbr for item in data.inputs})
+        predictions = await asyncio.to_thread(model_instance.predict_batch, rows)
+    except Exception as e:
+        print(f"Erreur lors de la prédiction : {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Log en DB (écriture groupée en tâche de fond, hors du chemin de la requête)
+    log_writer.submit([{**features, **preds} for features, preds in zip(rows, predictions)])
+    shadow_evaluator.submit(rows, predictions)
+    print("-------------------------------")
+
+    return BatchPredictionOutput(predictions=[
+        PredictionOutput(**p, weather_degraded=d) for p, d in zip(predictions, degraded)
+    ])
+
+@app.post("/predict/columnar", dependencies=[Depends(admit)])
+async def predict_columnar(request: Request):
+    """
+    Scoring de gros lots en colonnes : un objet JSON de tableaux de même longueur
+    ({"direction_id": [...], "month": [...], ...}), ou un corps Arrow IPC / Parquet
+    selon le Content-Type. La validation est vectorisée par colonne et les colonnes
+    remplissent directement la matrice de features. La réponse est renvoyée dans
+    le même format : prediction_P50, prediction_P80, prediction_P90, weather_degraded.
+    Les lignes ne sont pas écrites dans prediction_logs (scoring hors ligne).
+    """
+    def decode(body: bytes, fmt: str):
+        with STAGE_SECONDS.time(stage="decode"):
+            return columnar.validate_columns(columnar.read_columns(body, fmt))
+
+    def predict_and_encode(columns: dict, n: int, degraded: np.ndarray, fmt: str) -> bytes:
+        with STAGE_SECONDS.time(stage="predict"):
+            predictions = model_instance.predict_columns(columns, n)
+        with STAGE_SECONDS.time(stage="encode"):
+            return columnar.write_columns({
+                **{key: predictions[:, i] for i, key in enumerate(OUTPUT_KEYS)},
+                "weather_degraded": degraded,
+            }, fmt)
+
+    # Décodage, validation, prédiction et encodage (json, NumPy) dans des threads :
+    # seule la lecture du corps reste sur la boucle d'événements
+    try:
+        fmt = columnar.media_type(request.headers.get("content-type"))
+        body = await request.body()
+        columns, n = await asyncio.to_thread(decode, body, fmt)
+    except columnar.UnsupportedFormat as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except columnar.ColumnarError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    print(f"--- Nouvelle requête en colonnes reçue ({n} lignes) ---")
+
+    # Calendrier et météo calculés une fois par combinaison distincte, puis diffusés aux lignes
+    with STAGE_SECONDS.time(stage="calendar"):
+        keys, inverse = columnar.distinct(columns["month"], columns["day"], columns["day_of_week"])
+        columns.update(columnar.expand([get_calendar_features(*key) for key in keys], inverse))
+    try:
+        with STAGE_SECONDS.time(stage="weather"):
+            keys, inverse = columnar.distinct(columns["month"], columns["day"], columns["hour"])
+            meteo = await asyncio.gather(*(get_weather_features(*key) for key in keys))
+            degraded = np.array([m.get("weather_degraded", False) for m in meteo], dtype=bool)[inverse]
+            columns.update(columnar.expand(
+                [{k: v for k, v in m.items() if k != "weather_degraded"} for m in meteo], inverse))
+    except Exception as e:
+        print(f"Erreur météo : {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+    try:
+        await load_line_bundles(np.unique(columns["bus_nbr"]).tolist())
+        body = await asyncio.to_thread(predict_and_encode, columns, n, degraded, fmt)
+    except Exception as e:
+        print(f"Erreur lors de la prédiction : {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return Response(content=body, media_type=fmt)
+
+@app.post("/predict/route", response_model=RoutePredictionOutput, dependencies=[Depends(admit)])
+async def predict_route(data: RoutePredictionInput, accept: str | None = Header(default=None)):
+    """
+    Prédit les retards de tous les arrêts d'un trajet en un seul appel : calendrier
+    et météo sont calculés une fois pour le départ puis appliqués à chaque arrêt.
+    Avec `Accept: application/x-ndjson`, la réponse est un arrêt par ligne.
+    """
+    stop_sequences = data.stop_sequences or list(range(1, PREDICTION_GRID_MAX_STOP + 1))
+    print(f"--- Nouvelle requête trajet reçue (ligne {data.bus_nbr}, {len(stop_sequences)} arrêts) ---")
+
+    base = data.model_dump(exclude={"stop_sequences"})
+    base.update(get_calendar_features(data.month, data.day, data.day_of_week))
+    try:
+        meteo_feats = await get_weather_features(data.month, data.day, data.hour)
+        weather_degraded = meteo_feats.pop("weather_degraded", False)
+        base.update(meteo_feats)
+    except Exception as e:
+        print(f"Erreur météo : {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+    # Un seul appel vectorisé pour tous les arrêts
+    rows = [{**base, "stop_sequence": stop} for stop in stop_sequences]
+    try:
+        await load_line_bundles([data.bus_nbr])
+        predictions = await asyncio.to_thread(model_instance.predict_batch, rows)
+    except Exception as e:
+        print(f"Erreur lors de la prédiction : {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    log_writer.submit([{**features, **preds} for features, preds in zip(rows, predictions)])
+    shadow_evaluator.submit(rows, predictions)
+    stops = [
+        StopPredictionOutput(stop_sequence=stop, weather_degraded=weather_degraded, **preds)
+        for stop, preds in zip(stop_sequences, predictions)
+    ]
+
+    if accept and "application/x-ndjson" in accept:
+        return StreamingResponse(
+            (json.dumps(stop.model_dump()) + "\n" for stop in stops),
+            media_type="application/x-ndjson",
+        )
+    return RoutePredictionOutput(bus_nbr=data.bus_nbr, direction_id=data.direction_id, stops=stops)
+
+@app.post("/predict/horizon", response_model=HorizonPredictionOutput, dependencies=[Depends(admit)])
+async def predict_horizon(data: HorizonPredictionInput):
+    """
+    Prédit les `hours` heures suivant un départ (heure de départ incluse) en un
+    seul appel. La météo horaire est récupérée une fois par journée couverte ; la
+    matrice de features est construite en colonnes, heures, jours de la semaine et
+    calendrier suivant le passage de minuit.
+    """
+    try:
+        start = datetime(datetime.now().year, data.month, data.day, data.hour)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Date de départ invalide : {e}")
+    print(f"--- Nouvelle requête horizon reçue ({data.hours} heures à partir de {start}) ---")
+
+    try:
+        with STAGE_SECONDS.time(stage="weather"):
+            meteo = await get_weather_range(start, data.hours)
+    except Exception as e:
+        print(f"Erreur météo : {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+    # Colonnes des N heures : date, heure et jour de la semaine de chaque heure
+    n = data.hours
+    timestamps = [start + timedelta(hours=k) for k in range(n)]
+    day_offsets = np.array([(ts.date() - start.date()).days for ts in timestamps])
+    columns = {
+        "bus_nbr": np.full(n, data.bus_nbr),
+        "direction_id": np.full(n, data.direction_id),
+        "stop_sequence": np.full(n, data.stop_sequence),
+        "month": np.array([ts.month for ts in timestamps]),
+        "day": np.array([ts.day for ts in timestamps]),
+        "hour": np.array([ts.hour for ts in timestamps]),
+        "day_of_week": (data.day_of_week + day_offsets) % 7,
+    }
+    # Calendrier une fois par journée couverte
+    with STAGE_SECONDS.time(stage="calendar"):
+        days, inverse = np.unique(day_offsets, return_inverse=True)
+        inverse = inverse.ravel()
+        calendars = [
+            get_calendar_features_for_date(start.date() + timedelta(days=int(d)), (data.day_of_week + int(d)) % 7)
+            for d in days
+        ]
+        columns.update(columnar.expand(calendars, inverse))
+    degraded = [m.get("weather_degraded", False) for m in meteo]
+    weather = [{k: v for k, v in m.items() if k != "weather_degraded"} for m in meteo]
+    columns.update(columnar.expand(weather, np.arange(n)))
+
+    try:
+        await load_line_bundles([data.bus_nbr])
+        with STAGE_SECONDS.time(stage="predict"):
+            predictions = await asyncio.to_thread(model_instance.predict_columns, columns, n)
+    except Exception as e:
+        print(f"Erreur lors de la prédiction : {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Log en DB et évaluation fantôme, ligne par ligne comme les autres routes. Les lignes
+    # sont construites depuis les dicts par heure (et non les colonnes float64) pour garder
+    # les types entiers attendus par prediction_logs (weather_code, est_weekend, ...)
+    rows = [
+        {
+            "bus_nbr": data.bus_nbr,
+            "direction_id": data.direction_id,
+            "stop_sequence": data.stop_sequence,
+            "month": ts.month,
+            "day": ts.day,
+            "hour": ts.hour,
+            "day_of_week": (data.day_of_week + int(offset)) % 7,
+            **calendars[i],
+            **weather[k],
+        }
+        for k, (ts, offset, i) in enumerate(zip(timestamps, day_offsets, inverse))
+    ]
+    preds = [dict(zip(OUTPUT_KEYS, values)) for values in predictions.tolist()]
+    log_writer.submit([{**features, **p} for features, p in zip(rows, preds)])
+    shadow_evaluator.submit(rows, preds)
+
+    return HorizonPredictionOutput(
+        bus_nbr=data.bus_nbr,
+        direction_id=data.direction_id,
+        stop_sequence=data.stop_sequence,
+        predictions=[
+            HourPredictionOutput(month=row["month"], day=row["day"], hour=row["hour"], day_of_week=row["day_of_week"],
+                                 weather_degraded=d, **p)
+            for row, p, d in zip(rows, preds, degraded)
+        ],
+    )
 
 if __name__ == "__main__":
     import uvicorn
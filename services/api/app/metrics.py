@@ -0,0 +1,169 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Bornes des histogrammes de latence (secondes)
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """Métrique au format texte Prometheus, une série par combinaison de labels. Thread-safe."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            series = list(self._series.items())
+        for key, value in series:
+            lines.extend(self._render_series(dict(zip(self.labelnames, key)), value))
+        return lines
+
+    def _render_series(self, labels: dict, value) -> list[str]:
+        return [f"{self.name}{format_labels(labels)} {format_value(value)}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = list(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Comptes par classe (non cumulés), somme, nombre
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_series(self, labels: dict, value) -> list[str]:
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets + [float("inf")], counts):
+            cumulative += n
+            lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': format_value(bound)})} {cumulative}")
+        lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(total)}")
+        lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    """
+    Ensemble des métriques exposées par /metrics.
+
+    En plus des métriques instrumentées, des collecteurs peuvent produire des
+    séries au moment du rendu (ex. compteurs internes exposés par les stats()).
+    Un collecteur renvoie une liste de (nom, type, aide, [(labels, valeur), ...]).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, type_, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type_}")
+                lines.extend(f"{name}{format_labels(labels)} {format_value(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Métriques partagées par les modules de l'API
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "delay_forecast_request_seconds", "Durée des requêtes HTTP par route.", ("path", "method", "status")))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "delay_forecast_requests_in_flight", "Requêtes HTTP en cours par route.", ("path",)))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "delay_forecast_stage_seconds", "Durée de chaque étape de la prédiction.", ("stage",)))
+WEATHER_SECONDS = REGISTRY.register(Histogram(
+    "delay_forecast_weather_seconds", "Durée de récupération de la météo d'une heure par source (store, climatology, cache, open_meteo).", ("source",)))
+WEATHER_ERRORS = REGISTRY.register(Counter(
+    "delay_forecast_weather_errors_total", "Échecs de récupération de la météo."))
+WEATHER_FALLBACKS = REGISTRY.register(Counter(
+    "delay_forecast_weather_fallbacks_total", "Météo de repli servie (weather_degraded) par source.", ("source",)))
+MODEL_SECONDS = REGISTRY.register(Histogram(
+    "delay_forecast_model_seconds", "Durée d'évaluation des modèles par moteur et quantile (all : trois quantiles ensemble).", ("engine", "quantile")))
+MODEL_ROWS = REGISTRY.register(Counter(
+    "delay_forecast_model_rows_total", "Lignes évaluées par les modèles (hors cache).", ("engine",)))
+DB_POOL_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "delay_forecast_db_pool_wait_seconds", "Attente d'une connexion du pool (ouverture éventuelle comprise).", ("engine",)))
+DB_CONNECT_SECONDS = REGISTRY.register(Histogram(
+    "delay_forecast_db_connect_seconds", "Durée d'ouverture des nouvelles connexions à la base.", ("engine",)))
@@ -1,98 +1,340 @@
 import os
+import hashlib
+import threading
 import joblib
 import pandas as pd
 import numpy as np
+from datetime import datetime
 
-class MLModel:
-    def __init__(self):
-        self.models = None
-        
-        # Chemin vers le pack de modèles quantiles
-        from pathlib import Path
-        
-        # 1. Tester le chemin local (développement) : 4 niveaux au dessus de services/api/app/model.py
-        local_path = Path(__file__).resolve().parent.parent.parent.parent / "models" / "50_80_90_models_quantiles.pkl"
-        
-        # 2. Tester le chemin Docker : les modèles sont généralement montés dans /app/models
-        # Si on est dans /app/app/model.py, c'est 2 niveaux au dessus
-        docker_path = Path(__file__).resolve().parent.parent / "models" / "50_80_90_models_quantiles.pkl"
-        
-        if local_path.exists():
-            model_path = str(local_path)
-        elif docker_path.exists():
-            model_path = str(docker_path)
+from .cache import TTLCache
+from .features import FeatureBuilder
+from .fused_trees import FusedQuantileEnsemble, QUANTILE_NAMES, read_meta
+from .metrics import STAGE_SECONDS, MODEL_SECONDS, MODEL_ROWS
+from .model_store import resolve_model_path, bundle_file, file_version
+from .model_registry import BundleRegistry, MODEL_LINES_DIR, MODEL_REGISTRY_MAX_MB
+
+# Clés de sortie, dans l'ordre des quantiles du pack
+OUTPUT_KEYS = ['prediction_P50', 'prediction_P80', 'prediction_P90']
+
+# Au-delà de cette taille de lot, la boucle compilée de sklearn (arbre par arbre)
+# redevient plus rapide que la descente vectorisée NumPy du moteur aplati
+FUSED_MAX_BATCH = int(os.getenv("FUSED_MAX_BATCH", "128"))
+
+# Cache des prédictions, indexé par le vecteur de features assemblé
+# (la météo ne change qu'à l'heure : les mêmes vecteurs reviennent constamment)
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "3600"))
+
+class ModelBundle:
+    """
+    Pack de modèles quantiles prêt pour l'inférence (constructeur de features + arbres aplatis).
+
+    Deux formats sur disque : le .pkl joblib produit par l'entraînement, ou un
+    répertoire exporté par model_store.export_bundle. Dans ce second cas seuls
+    les arbres aplatis sont chargés (projetés en mémoire, partagés entre workers)
+    et `models` vaut None : toute l'inférence passe par le moteur aplati.
+    """
+
+    def __init__(self, models: dict | None, version: str = "in-memory", path: str | None = None,
+                 engine: FusedQuantileEnsemble | None = None):
+        if engine is None:
+            engine = FusedQuantileEnsemble.from_models(models, QUANTILE_NAMES)
+        # Colonnes utilisées pendant l'entraînement (identiques pour les trois modèles)
+        self.feature_builder = FeatureBuilder(engine.feature_names)
+        self.engine = engine
+        self.models = models
+        self.version = version
+        self.path = path
+        self.loaded_at = datetime.now()
+        self.mtime = None
+        # Préfixe des clés du cache : une prédiction n'est jamais servie par un autre pack
+        self.cache_prefix = version.encode()
+
+    @classmethod
+    def load(cls, path: str) -> "ModelBundle":
+        # Un export est un lien basculé à chaque réexport : résolu une seule fois, pour que
+        # date, version et tableaux viennent tous du même répertoire même si le lien change
+        source = os.path.realpath(path)
+        mtime = os.path.getmtime(bundle_file(source))
+        if os.path.isdir(source):
+            engine = FusedQuantileEnsemble.load(source, mmap_mode="r")
+            version = read_meta(source).get("version") or file_version(source)
+            bundle = cls(None, version=version, path=path, engine=engine)
         else:
-            # Par défaut, on garde le chemin Docker pour la visibilité dans les logs d'erreur
-            model_path = str(docker_path)
-        
+            bundle = cls(joblib.load(source), version=file_version(source), path=path)
+        bundle.mtime = mtime
+        return bundle
+
+    @classmethod
+    def load_checked(cls, path: str) -> "ModelBundle":
+        """Charge un pack et le teste (warmup) avant sa mise en service."""
+        bundle = cls.load(path)
+        bundle.warmup()
+        return bundle
+
+    @property
+    def format(self) -> str:
+        return "joblib" if self.models is not None else "mmap"
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Mémoire estimée du pack : arbres aplatis, plus les modèles sklearn pour un
+        .pkl (estimés par la taille du fichier, faute de mieux).
+        """
+        nbytes = self.engine.nbytes
+        if self.models is not None and self.path and os.path.exists(self.path):
+            nbytes += os.path.getsize(self.path)
+        return nbytes
+
+    def warmup(self):
+        """
+        Évalue le pack sur quelques entrées types avant sa mise en service :
+        vérifie que les deux chemins d'inférence répondent et amorce les allocations.
+        """
+        rows = [
+            {"direction_id": d, "month": m, "day": 1, "hour": h, "day_of_week": h % 7,
+             "stop_sequence": 1, "weather_code": 3, "temperature_2m": 5.0}
+            for d in (0, 1) for m in (1, 7) for h in (0, 8, 17)
+        ]
+        X = self.feature_builder.build_matrix(rows)
+        fused = self.engine.predict(X)
+        if not np.all(np.isfinite(fused)):
+            raise ValueError(f"Échec du warmup du pack {self.version}")
+        if self.models is not None:
+            df = pd.DataFrame(X, columns=self.feature_builder.feature_names)
+            reference = np.column_stack([self.models[name].predict(df) for name in QUANTILE_NAMES])
+            if not np.allclose(fused, reference):
+                raise ValueError(f"Échec du warmup du pack {self.version}")
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "format": self.format,
+            "loaded_at": self.loaded_at.isoformat(),
+            "n_trees": self.engine.n_trees,
+            "n_features": self.feature_builder.n_features,
+        }
+
+
+class MLModel:
+    """
+    Pack de modèles par défaut, plus les packs dédiés à certaines lignes de bus
+    (registre chargé à la demande depuis `lines_dir`, MODEL_LINES_DIR par défaut).
+    Une ligne sans pack dédié est servie par le pack par défaut.
+    """
+
+    def __init__(self, models: dict | None = None, lines_dir: str | None = None):
+        self.bundle = None
+        self.prediction_cache = TTLCache(maxsize=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL)
+        self._reload_lock = threading.Lock()
+        if lines_dir is None and models is None:
+            lines_dir = MODEL_LINES_DIR
+        self.registry = BundleRegistry(lines_dir, MODEL_REGISTRY_MAX_MB * 1024 * 1024, loader=ModelBundle.load_checked)
+
+        if models is not None:
+            self._set_models(models)
+            return
+
+        model_path = resolve_model_path()
         try:
             print(f"Tentative de chargement des modèles depuis {model_path}...")
-            
+
             if os.path.exists(model_path):
-                self.models = joblib.load(model_path)
-                print(f"Modèles quantiles chargés depuis {model_path} ({list(self.models.keys())})")
+                self.bundle = ModelBundle.load(model_path)
+                print(f"Modèles quantiles chargés depuis {model_path} ({self.engine.quantile_names}, format {self.bundle.format}, version {self.version})")
             else:
                 print(f"ATTENTION: Fichier {model_path} introuvable.")
 
         except Exception as e:
             print(f"Erreur critique lors du chargement des modèles : {e}")
 
+    # Accès au pack actif (les requêtes en cours gardent leur propre référence)
+    @property
+    def models(self):
+        return self.bundle.models if self.bundle else None
+
+    @property
+    def feature_builder(self):
+        return self.bundle.feature_builder if self.bundle else None
+
+    @property
+    def engine(self):
+        return self.bundle.engine if self.bundle else None
+
+    @property
+    def version(self):
+        return self.bundle.version if self.bundle else None
+
+    def bundle_for(self, bus_nbr) -> ModelBundle | None:
+        """Pack qui sert une ligne : son pack dédié (chargé au besoin), sinon le pack par défaut."""
+        return self.registry.get(bus_nbr) or self.bundle
+
+    def version_for(self, bus_nbr) -> str | None:
+        """Version du pack qui sert une ligne, sans chargement (None si son pack dédié n'est pas en mémoire)."""
+        if self.registry.bundle_name(bus_nbr) is None:
+            return self.version
+        bundle = self.registry.resident(bus_nbr)
+        return bundle.version if bundle else None
+
+    def _set_models(self, models: dict):
+        """Enregistre un pack de modèles déjà en mémoire."""
+        self.swap(ModelBundle(models))
+
+    def swap(self, bundle: ModelBundle):
+        """Met en service un pack : simple remplacement de référence, atomique pour les requêtes."""
+        self.bundle = bundle
+        # Les prédictions en cache proviennent de l'ancien pack
+        self.prediction_cache.clear()
+
+    def reload(self, path: str | None = None) -> dict:
+        """
+        Charge un nouveau pack, le teste (warmup) puis le met en service.
+        En cas d'échec, le pack actif reste en place et l'erreur est propagée.
+        Bloquant : à appeler depuis un thread de travail.
+        """
+        path = path or resolve_model_path()
+        with self._reload_lock:
+            print(f"Rechargement des modèles depuis {path}...")
+            bundle = ModelBundle.load_checked(path)
+            previous = self.version
+            self.swap(bundle)
+            # Les packs par ligne sont recensés à nouveau et rechargés à leur prochaine utilisation
+            self.registry.refresh()
+            print(f"Modèles rechargés : version {previous} -> {bundle.version}")
+        return bundle.info()
+
+    def needs_reload(self, path: str | None = None) -> bool:
+        """Vrai si le fichier du pack a changé depuis le chargement du pack actif."""
+        path = path or resolve_model_path()
+        if not os.path.exists(bundle_file(path)):
+            return False
+        if self.bundle is None or self.bundle.path != path:
+            return True
+        return os.path.getmtime(bundle_file(path)) != self.bundle.mtime
+
+    def info(self) -> dict:
+        return self.bundle.info() if self.bundle else {"version": None}
+
     def predict(self, features_dict: dict):
-        if self.models is None:
+        bundle = self.bundle_for(features_dict.get("bus_nbr"))
+        if bundle is None:
+            raise ValueError("Erreur: Les modèles ne sont pas chargés.")
+
+        # Remplissage direct de la ligne de features (même ordre que l'entraînement)
+        with STAGE_SECONDS.time(stage="features"):
+            X = bundle.feature_builder.build_row(features_dict)
+        return self._predict_matrix(bundle, X)[0]
+
+    def predict_batch(self, rows: list[dict]) -> list[dict]:
+        """
+        Prédiction vectorisée d'un lot : la matrice de features est construite une
+        seule fois et chaque modèle quantile n'est appelé qu'une fois par pack
+        (une fois pour tout le lot sans packs par ligne).
+        """
+        if not self.registry.enabled:
+            return self._predict_rows(self.bundle, rows)
+
+        # Lignes regroupées par pack : un appel vectorisé par pack
+        line_bundles, groups = {}, {}
+        for i, row in enumerate(rows):
+            bus_nbr = row.get("bus_nbr")
+            if bus_nbr not in line_bundles:
+                line_bundles[bus_nbr] = self.bundle_for(bus_nbr)
+            bundle = line_bundles[bus_nbr]
+            groups.setdefault(id(bundle), (bundle, []))[1].append(i)
+        results = [None] * len(rows)
+        for bundle, indices in groups.values():
+            for i, res in zip(indices, self._predict_rows(bundle, [rows[i] for i in indices])):
+                results[i] = res
+        return results
+
+    def _predict_rows(self, bundle: ModelBundle | None, rows: list[dict]) -> list[dict]:
+        if bundle is None:
             raise ValueError("Erreur: Les modèles ne sont pas chargés.")
 
-        # Préparation des données pour correspondre exactement au pipeline d'entraînement
-        df = pd.DataFrame([features_dict])
-        
-        # 1. Feature Engineering Cyclique (Heure, Jour, Mois)
-        if 'hour' in df.columns:
-            df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24)
-            df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24)
-        
-        if 'day_of_week' in df.columns:
-            df['day_sin'] = np.sin(2 * np.pi * df['day_of_week'] / 7)
-            df['day_cos'] = np.cos(2 * np.pi * df['day_of_week'] / 7)
-            
-        if 'month' in df.columns:
-            df['month_sin'] = np.sin(2 * np.pi * df['month'] / 12)
-            df['month_cos'] = np.cos(2 * np.pi * df['month'] / 12)
-
-        # 2. One-Hot Encoding manuel (pour correspondre aux colonnes du modèle)
-        # On récupère les colonnes utilisées pendant l'entraînement depuis le premier modèle
-        first_model = list(self.models.values())[0]
-        model_features = first_model.feature_names_in_
-
-        # Colonnes catégorielles à dummifier (comme dans train_model.py)
-        # On pré-remplit avec 0 les colonnes One-Hot
-        for col in model_features:
-            if col not in df.columns:
-                df[col] = 0
-
-        # Mapping direction_id -> direction_id_1 (dans l'entraînement, direction_id était str, dummified)
-        if 'direction_id' in df.columns and 'direction_id_1' in model_features:
-             if str(df['direction_id'].iloc[0]) == '1':
-                 df['direction_id_1'] = 1
-
-        # Mapping weather_code -> weather_code_X
-        if 'weather_code' in df.columns:
-            wc = str(int(df['weather_code'].iloc[0]))
-            wc_col = f"weather_code_{wc}"
-            if wc_col in model_features:
-                df[wc_col] = 1
-
-        # 3. Sélection et réordonnancement des colonnes
-        df_final = df[model_features]
-
-        # 4. Prédictions
-        results = {}
+        with STAGE_SECONDS.time(stage="features"):
+            X = bundle.feature_builder.build_matrix(rows)
+        return self._predict_matrix(bundle, X)
+
+    def predict_columns(self, columns: dict, n: int) -> np.ndarray:
+        """
+        Prédictions (n, nb_quantiles) d'un lot en colonnes ({nom: tableau NumPy}) :
+        la matrice de features est remplie directement à partir des colonnes, sans
+        dictionnaire par ligne ni cache (lots de scoring volumineux, peu répétés).
+        """
+        bus_nbr = columns.get("bus_nbr")
+        if not self.registry.enabled or bus_nbr is None:
+            groups = [(self.bundle, None)]
+        else:
+            # Lignes regroupées par pack : un appel vectorisé par pack
+            lines, inverse = np.unique(bus_nbr, return_inverse=True)
+            by_bundle = {}
+            for k, line in enumerate(lines.tolist()):
+                bundle = self.bundle_for(line)
+                by_bundle.setdefault(id(bundle), (bundle, []))[1].append(k)
+            groups = [(bundle, np.isin(inverse.ravel(), ks)) for bundle, ks in by_bundle.values()]
+
+        out = np.empty((n, len(OUTPUT_KEYS)))
+        for bundle, mask in groups:
+            if bundle is None:
+                raise ValueError("Erreur: Les modèles ne sont pas chargés.")
+            if mask is None:
+                sub, m = columns, n
+            else:
+                sub, m = {name: values[mask] for name, values in columns.items()}, int(mask.sum())
+            with STAGE_SECONDS.time(stage="features"):
+                X = bundle.feature_builder.build_columns(sub, m)
+            if mask is None:
+                out[:] = self._evaluate(bundle, X)
+            else:
+                out[mask] = self._evaluate(bundle, X)
+        return out
+
+    def evaluate_rows(self, rows: list[dict], bundle: ModelBundle | None = None) -> np.ndarray:
+        """Matrice (n, nb_quantiles) des prédictions d'un lot, sans passer par le cache."""
+        bundle = bundle or self.bundle
+        if bundle is None:
+            raise ValueError("Erreur: Les modèles ne sont pas chargés.")
+        return self._evaluate(bundle, bundle.feature_builder.build_matrix(rows))
+
+    def _predict_matrix(self, bundle: ModelBundle, X: np.ndarray) -> list[dict]:
+        # Seules les lignes absentes du cache sont évaluées, en un seul appel
+        keys = [hashlib.blake2b(bundle.cache_prefix + row.tobytes(), digest_size=16).digest() for row in X]
+        results = [self.prediction_cache.get(key) for key in keys]
+        misses = [i for i, res in enumerate(results) if res is None]
+
+        if misses:
+            preds = self._evaluate(bundle, X[misses])
+            for i, row in zip(misses, preds):
+                results[i] = dict(zip(OUTPUT_KEYS, map(float, row)))
+                self.prediction_cache.set(keys[i], results[i])
+
+        # Copies : l'appelant peut enrichir le dictionnaire sans altérer le cache
+        return [dict(res) for res in results]
+
+    def _evaluate(self, bundle: ModelBundle, X: np.ndarray) -> np.ndarray:
         try:
-            results['prediction_P50'] = float(self.models['P50_Median'].predict(df_final)[0])
-            results['prediction_P80'] = float(self.models['P80_Pessimist'].predict(df_final)[0])
-            results['prediction_P90'] = float(self.models['P90_Extreme'].predict(df_final)[0])
-            return results
+            if X.shape[0] <= FUSED_MAX_BATCH or bundle.models is None:
+                # Les trois quantiles sont évalués ensemble, en une passe sur les arbres aplatis
+                MODEL_ROWS.inc(X.shape[0], engine="fused")
+                with MODEL_SECONDS.time(engine="fused", quantile="all"):
+                    return bundle.engine.predict(X)
+            # Les modèles ont été entraînés sur un DataFrame : on conserve les noms de colonnes
+            MODEL_ROWS.inc(X.shape[0], engine="sklearn")
+            df_final = pd.DataFrame(X, columns=bundle.feature_builder.feature_names, copy=False)
+            columns = []
+            for name in QUANTILE_NAMES:
+                with MODEL_SECONDS.time(engine="sklearn", quantile=name):
+                    columns.append(bundle.models[name].predict(df_final))
+            return np.column_stack(columns)
         except Exception as e:
             print(f"Erreur pendant la prédiction : {e}")
             raise e
 
+    def clear_prediction_cache(self):
+        self.prediction_cache.clear()
+
 # On initialise le modèle ici
 model_instance = MLModel()
@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from .fused_trees import META_FILENAME
+
+logger = logging.getLogger(__name__)
+
+# Répertoire des packs par ligne (non renseigné = un seul pack pour toutes les lignes)
+# Chaque pack est un .pkl `<nom>.pkl` ou un répertoire exporté `<nom>/` ; le nom est le
+# numéro de ligne, sauf correspondance ligne -> pack (ex. cluster de lignes) dans lines.json
+MODEL_LINES_DIR = os.getenv("MODEL_LINES_DIR")
+# Mémoire maximale occupée par les packs par ligne résidents (Mo)
+MODEL_REGISTRY_MAX_MB = float(os.getenv("MODEL_REGISTRY_MAX_MB", "512"))
+
+LINES_MAPPING_FILENAME = "lines.json"
+
+
+class BundleRegistry:
+    """
+    Packs de modèles par ligne de bus (ou groupe de lignes), chargés à la demande.
+
+    Les packs disponibles sont recensés au démarrage (aucun accès disque par
+    requête pour une ligne sans pack dédié). Un pack est chargé et testé à sa
+    première utilisation, puis gardé en mémoire tant que le total des packs
+    résidents tient dans `max_bytes` : au-delà, les moins récemment utilisés
+    sont évincés. Une ligne sans pack dédié renvoie None (pack par défaut).
+    """
+
+    def __init__(self, directory: str | None, max_bytes: float, loader):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # loader(path) -> pack chargé et testé (ModelBundle.load + warmup)
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        # nom du pack -> pack résident, du moins au plus récemment utilisé
+        self._resident = OrderedDict()
+        self._lines = {}
+        self._available = {}
+        self._failed = set()
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.failures = 0
+        self.fallbacks = 0
+        self.refresh()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def refresh(self):
+        """Recense les packs du répertoire et vide les packs résidents (rechargés à la prochaine utilisation)."""
+        lines, available = {}, {}
+        if self.enabled and os.path.isdir(self.directory):
+            mapping = os.path.join(self.directory, LINES_MAPPING_FILENAME)
+            if os.path.exists(mapping):
+                with open(mapping) as f:
+                    lines = {str(line): str(name) for line, name in json.load(f).items()}
+            for entry in os.listdir(self.directory):
+                # Versions cachées d'un export (.<ligne>.v-*) : seul le lien <ligne>/ est un pack
+                if entry.startswith("."):
+                    continue
+                path = os.path.join(self.directory, entry)
+                if entry.endswith(".pkl"):
+                    available[entry[:-len(".pkl")]] = path
+                elif os.path.exists(os.path.join(path, META_FILENAME)):
+                    available[entry] = path
+        with self._lock:
+            self._lines = lines
+            self._available = available
+            self._resident.clear()
+            self._failed.clear()
+
+    def bundle_name(self, bus_nbr) -> str | None:
+        """Nom du pack dédié à une ligne, ou None si la ligne utilise le pack par défaut."""
+        name = self._lines.get(str(bus_nbr), str(bus_nbr))
+        return name if name in self._available and name not in self._failed else None
+
+    def resident(self, bus_nbr):
+        """Pack dédié déjà en mémoire, sans chargement."""
+        name = self.bundle_name(bus_nbr)
+        return self._resident.get(name) if name else None
+
+    def needs_load(self, bus_nbr) -> bool:
+        name = self.bundle_name(bus_nbr)
+        return name is not None and name not in self._resident
+
+    def get(self, bus_nbr):
+        """
+        Pack dédié à une ligne (chargé au besoin), ou None pour le pack par défaut.
+        Bloquant au premier appel pour un pack : à appeler depuis un thread de travail.
+        """
+        if not self.enabled:
+            return None
+        name = self.bundle_name(bus_nbr)
+        if name is None:
+            self.fallbacks += 1
+            return None
+
+        with self._lock:
+            bundle = self._resident.get(name)
+            if bundle is not None:
+                self._resident.move_to_end(name)
+                self.hits += 1
+                return bundle
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Un seul chargement par pack, même si plusieurs requêtes le demandent en même temps
+        with load_lock:
+            bundle = self._resident.get(name)
+            if bundle is not None:
+                return bundle
+            try:
+                bundle = self.loader(self._available[name])
+            except Exception as e:
+                logger.error(f"Pack de la ligne {bus_nbr} ({name}) non chargé, repli sur le pack par défaut : {e}")
+                self.failures += 1
+                self._failed.add(name)
+                return None
+            with self._lock:
+                self._resident[name] = bundle
+                self.loads += 1
+                self._evict()
+        return bundle
+
+    def _evict(self):
+        # Le pack qui vient d'être chargé (le plus récent) reste résident, même s'il dépasse à lui seul le budget
+        while self.resident_bytes > self.max_bytes and len(self._resident) > 1:
+            name, _ = self._resident.popitem(last=False)
+            self.evictions += 1
+            logger.info(f"Pack {name} évincé de la mémoire")
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(bundle.nbytes for bundle in list(self._resident.values()))
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "directory": self.directory,
+            "available": len(self._available),
+            "resident": list(self._resident),
+            "resident_bytes": self.resident_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "failures": self.failures,
+            "fallbacks": self.fallbacks,
+        }
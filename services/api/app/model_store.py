@@ -0,0 +1,74 @@
+import hashlib
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import joblib
+
+from .fused_trees import FusedQuantileEnsemble, QUANTILE_NAMES, META_FILENAME
+
+MODEL_FILENAME = "50_80_90_models_quantiles.pkl"
+
+
+def resolve_model_path() -> str:
+    """
+    Chemin vers le pack de modèles quantiles (variable MODEL_PATH prioritaire).
+    MODEL_PATH peut désigner le .pkl joblib ou un répertoire exporté par export_bundle.
+    """
+    if os.getenv("MODEL_PATH"):
+        return os.getenv("MODEL_PATH")
+
+    # 1. Tester le chemin local (développement) : 4 niveaux au dessus de services/api/app/model.py
+    local_path = Path(__file__).resolve().parent.parent.parent.parent / "models" / MODEL_FILENAME
+
+    # 2. Tester le chemin Docker : les modèles sont généralement montés dans /app/models
+    # Si on est dans /app/app/model.py, c'est 2 niveaux au dessus
+    docker_path = Path(__file__).resolve().parent.parent / "models" / MODEL_FILENAME
+
+    if local_path.exists():
+        return str(local_path)
+    # Par défaut, on garde le chemin Docker pour la visibilité dans les logs d'erreur
+    return str(docker_path)
+
+
+def bundle_file(path: str) -> str:
+    """Fichier qui date un pack : le .pkl lui-même, ou le meta.json d'un répertoire exporté."""
+    return os.path.join(path, META_FILENAME) if os.path.isdir(path) else path
+
+
+def file_version(path: str) -> str:
+    """Version d'un pack : date de modification + empreinte du contenu."""
+    path = bundle_file(path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    mtime = datetime.fromtimestamp(os.path.getmtime(path))
+    return f"{mtime:%Y%m%d%H%M%S}-{digest.hexdigest()[:8]}"
+
+
+def export_bundle(pkl_path: str, directory: str) -> str:
+    """
+    Exporte les arbres aplatis d'un pack joblib dans un répertoire de fichiers .npy.
+
+    Chargé avec np.load(mmap_mode="r"), ce format évite à chaque worker de
+    désérialiser le pack : les tableaux sont projetés depuis le disque et leurs
+    pages partagées entre processus. La version du .pkl source est conservée.
+    Réexporter au même chemin est sans risque pour les workers en cours :
+    `directory` est un lien basculé vers un nouveau répertoire (cf. FusedQuantileEnsemble.save).
+    """
+    models = joblib.load(pkl_path)
+    version = file_version(pkl_path)
+    FusedQuantileEnsemble.from_models(models, QUANTILE_NAMES).save(
+        directory, version=version, source=os.path.abspath(pkl_path)
+    )
+    return version
+
+
+if __name__ == "__main__":
+    # python -m app.model_store models/50_80_90_models_quantiles.pkl models/50_80_90_fused
+    if len(sys.argv) != 3:
+        print("Usage : python -m app.model_store <pack.pkl> <répertoire_export>")
+        sys.exit(1)
+    print(f"Pack {export_bundle(sys.argv[1], sys.argv[2])} exporté dans {sys.argv[2]}")
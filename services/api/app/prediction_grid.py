@@ -0,0 +1,148 @@
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from .model import OUTPUT_KEYS, model_instance
+from .weather_store import WEATHER_FEATURES, weather_store
+from .weather_utils import get_calendar_features
+
+logger = logging.getLogger(__name__)
+
+# Horizon de la grille en jours à partir d'aujourd'hui (0 = désactivée)
+PREDICTION_GRID_DAYS = int(os.getenv("PREDICTION_GRID_DAYS", "7"))
+# Lignes de bus précalculées (séparées par des virgules) et nombre d'arrêts par direction
+PREDICTION_GRID_LINES = [line.strip() for line in os.getenv("PREDICTION_GRID_LINES", "541").split(",") if line.strip()]
+PREDICTION_GRID_MAX_STOP = int(os.getenv("PREDICTION_GRID_MAX_STOP", "40"))
+
+DIRECTIONS = (0, 1)
+
+
+class PredictionGrid:
+    """
+    Table de prédictions matérialisée pour l'horizon de prévision.
+
+    L'espace des features de /predict est fini sur quelques jours : (jour, heure,
+    ligne, direction, arrêt). Toute la grille est évaluée en un seul lot avec la
+    météo du feature store, puis rangée dans un tableau dense
+    (heures, lignes, directions, arrêts, quantiles) : une prédiction servie
+    depuis la grille est un simple accès par index.
+
+    La grille n'est valable que pour les packs de modèles (un par ligne) et la
+    génération du feature store météo avec lesquels elle a été construite ;
+    sinon, ou pour une entrée hors grille, l'API repasse par le calcul en direct.
+    """
+
+    def __init__(self, model, store, n_days: int, lines: list[str], max_stop: int):
+        self.model = model
+        self.store = store
+        self.n_days = n_days
+        self.lines = list(lines)
+        self.line_index = {line: i for i, line in enumerate(self.lines)}
+        self.max_stop = max_stop
+        # (premier jour, prédictions, version du pack de chaque ligne, génération météo)
+        self._data = None
+        self.built_at = None
+        self.build_seconds = None
+        self.hits = 0
+        self.misses = 0
+
+    def build(self, start: date | None = None) -> int:
+        """Évalue toute la grille à partir de `start` (aujourd'hui par défaut). Renvoie le nombre de cellules."""
+        bundle = self.model.bundle
+        if self.n_days <= 0 or bundle is None:
+            self._data = None
+            return 0
+
+        t0 = time.perf_counter()
+        start = start or date.today()
+        generation = self.store.generation
+        n_hours = self.n_days * 24
+        weather, present = self.store.lookup_range(datetime(start.year, start.month, start.day), n_hours)
+        hours = np.flatnonzero(present)
+
+        shape = (len(self.lines), len(DIRECTIONS), self.max_stop, len(OUTPUT_KEYS))
+        values = np.full((n_hours, *shape), np.nan)
+
+        # Chaque ligne est évaluée avec son pack (dédié ou par défaut)
+        line_bundles = [self.model.bundle_for(line) for line in self.lines]
+        if len(hours):
+            bases = []
+            for k in hours:
+                day = start + timedelta(days=int(k) // 24)
+                bases.append({
+                    "month": day.month, "day": day.day, "hour": int(k) % 24, "day_of_week": day.weekday(),
+                    **get_calendar_features(day.month, day.day, day.weekday()),
+                    **dict(zip(WEATHER_FEATURES, weather[k])),
+                })
+            for i, (line, line_bundle) in enumerate(zip(self.lines, line_bundles)):
+                # Lignes dans l'ordre (heure, direction, arrêt) : même ordre que le tableau
+                rows = [
+                    {**base, "bus_nbr": line, "direction_id": direction, "stop_sequence": stop}
+                    for base in bases for direction in DIRECTIONS for stop in range(1, self.max_stop + 1)
+                ]
+                values[hours, i] = self.model.evaluate_rows(rows, line_bundle).reshape(len(hours), *shape[1:])
+
+        self._data = (start, values, [b.version for b in line_bundles], generation)
+        self.built_at = datetime.now()
+        self.build_seconds = time.perf_counter() - t0
+        return len(hours) * int(np.prod(shape[:-1]))
+
+    def lookup(self, features: dict) -> dict | None:
+        """Prédictions d'une requête /predict complétée, ou None si elle n'est pas dans la grille."""
+        data = self._data
+        if data is not None:
+            start, values, versions, generation = data
+            if generation == self.store.generation:
+                index = self._index(start, features)
+                if (index is not None and index[0] < len(values)
+                        and versions[index[1]] == self.model.version_for(self.lines[index[1]])):
+                    row = values[index]
+                    if not np.isnan(row[0]):
+                        self.hits += 1
+                        return dict(zip(OUTPUT_KEYS, map(float, row)))
+        self.misses += 1
+        return None
+
+    def _index(self, start: date, features: dict) -> tuple | None:
+        # Comme get_weather_features et get_calendar_features : année en cours
+        try:
+            day = date(datetime.now().year, features["month"], features["day"])
+        except ValueError:
+            return None
+        offset = (day - start).days
+        # Un jour de semaine incohérent avec la date donne d'autres features : calcul en direct
+        if offset < 0 or features["day_of_week"] != day.weekday():
+            return None
+
+        line = self.line_index.get(str(features.get("bus_nbr")))
+        direction = features["direction_id"]
+        stop = features.get("stop_sequence", 1)
+        if line is None or direction not in DIRECTIONS or not 1 <= stop <= self.max_stop:
+            return None
+        return (offset * 24 + features["hour"], line, direction, stop - 1)
+
+    def stats(self) -> dict:
+        data = self._data
+        total = self.hits + self.misses
+        return {
+            "start": data[0].isoformat() if data else None,
+            "hours": int((~np.isnan(data[1][:, 0, 0, 0, 0])).sum()) if data else 0,
+            "model_versions": dict(zip(self.lines, data[2])) if data else None,
+            "built_at": self.built_at.isoformat() if self.built_at else None,
+            "build_seconds": self.build_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+prediction_grid = PredictionGrid(
+    model_instance,
+    weather_store,
+    n_days=PREDICTION_GRID_DAYS,
+    lines=PREDICTION_GRID_LINES,
+    max_stop=PREDICTION_GRID_MAX_STOP,
+)
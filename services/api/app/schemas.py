@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 
 # Structure pour les données d'entrée - Simplifiée pour l'utilisateur
@@ -19,3 +19,57 @@ class PredictionOutput(BaseModel):
     prediction_P50: float
     prediction_P80: float
     prediction_P90: float
+    # Vrai si la météo utilisée est une valeur de repli (Open-Meteo indisponible)
+    weather_degraded: bool = False
+
+# Structure pour les prédictions par lot (ex: rafraîchissement d'un tableau de départs)
+class BatchPredictionInput(BaseModel):
+    inputs: list[PredictionInput] = Field(..., min_length=1, max_length=10000)
+
+class BatchPredictionOutput(BaseModel):
+    predictions: list[PredictionOutput]
+
+# Structure pour la prédiction d'un trajet complet (tous les arrêts d'une ligne dans une direction)
+class RoutePredictionInput(BaseModel):
+    direction_id: int
+    month: int
+    day: int
+    hour: int
+    day_of_week: int
+
+    bus_nbr: str = "541"
+    # Par défaut : tous les arrêts de la ligne (1..PREDICTION_GRID_MAX_STOP)
+    stop_sequences: Optional[list[int]] = Field(default=None, min_length=1, max_length=500)
+
+class StopPredictionOutput(PredictionOutput):
+    stop_sequence: int
+
+class RoutePredictionOutput(BaseModel):
+    bus_nbr: str
+    direction_id: int
+    stops: list[StopPredictionOutput]
+
+# Structure pour la prédiction des N heures suivant un départ (planification d'un trajet)
+class HorizonPredictionInput(BaseModel):
+    direction_id: int
+    month: int
+    day: int
+    hour: int
+    day_of_week: int
+
+    bus_nbr: str = "541"
+    stop_sequence: int = 1
+    # Nombre d'heures prédites à partir de l'heure de départ (incluse)
+    hours: int = Field(default=12, ge=1, le=48)
+
+class HourPredictionOutput(PredictionOutput):
+    month: int
+    day: int
+    hour: int
+    day_of_week: int
+
+class HorizonPredictionOutput(BaseModel):
+    bus_nbr: str
+    direction_id: int
+    stop_sequence: int
+    predictions: list[HourPredictionOutput]
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import os
+from collections import deque
+
+from .admission import admission_controller
+from .log_writer import shadow_log_writer
+from .metrics import MODEL_SECONDS
+from .model import ModelBundle, model_instance
+
+logger = logging.getLogger(__name__)
+
+# Pack candidat évalué en fantôme sur le trafic /predict (non renseigné = désactivé)
+SHADOW_MODEL_PATH = os.getenv("SHADOW_MODEL_PATH")
+# Micro-lots du travail fantôme : délai maximal d'accumulation (ms) et taille maximale
+SHADOW_BATCH_WINDOW_MS = float(os.getenv("SHADOW_BATCH_WINDOW_MS", "200"))
+SHADOW_BATCH_MAX_ROWS = int(os.getenv("SHADOW_BATCH_MAX_ROWS", "256"))
+# Lignes en attente d'évaluation fantôme au-delà desquelles les nouvelles sont écartées
+SHADOW_QUEUE_MAX = int(os.getenv("SHADOW_QUEUE_MAX", "5000"))
+
+# Colonnes des prédictions du pack fantôme dans shadow_prediction_logs
+SHADOW_KEYS = ["shadow_P50", "shadow_P80", "shadow_P90"]
+
+
+def service_overloaded() -> bool:
+    """Des requêtes attendent une place dans le contrôle d'admission : le service est saturé."""
+    return admission_controller.waiting > 0
+
+
+class ShadowEvaluator:
+    """
+    Évaluation fantôme d'un pack candidat sur le trafic réel.
+
+    Les routes déposent les features complétées et les prédictions servies par le
+    pack principal, sans attendre : la réponse au client ne dépend jamais du pack
+    fantôme. Une tâche de fond évalue la file par micro-lots (dès `max_rows` lignes
+    ou toutes les `window` secondes) dans un thread de travail, puis écrit les deux
+    prédictions côte à côte dans shadow_prediction_logs.
+
+    Le travail fantôme est le premier sacrifié : les lignes sont écartées (et
+    comptées) si le service est saturé, au dépôt comme au moment de l'évaluation,
+    ou si la file dépasse `max_queue` lignes.
+    """
+
+    def __init__(self, primary, writer, window: float, max_rows: int, max_queue: int,
+                 overloaded=service_overloaded):
+        self.primary = primary
+        self.writer = writer
+        self.window = window
+        self.max_rows = max_rows
+        self.max_queue = max_queue
+        self.overloaded = overloaded
+        self.bundle = None
+
+        self._queue = deque()
+        self._wakeup = None
+        self._task = None
+
+        self.scored = 0
+        self.batches = 0
+        self.dropped_load = 0
+        self.dropped_full = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.bundle is not None
+
+    def load(self, path: str) -> dict:
+        """Charge et teste le pack candidat. Bloquant : à appeler depuis un thread de travail."""
+        bundle = ModelBundle.load_checked(path)
+        self.bundle = bundle
+        return bundle.info()
+
+    def submit(self, rows: list[dict], predictions: list[dict]):
+        """Dépose des lignes servies par le pack principal. Non bloquant."""
+        if self.bundle is None:
+            return
+        if self.overloaded():
+            self.dropped_load += len(rows)
+            return
+        if len(self._queue) + len(rows) > self.max_queue:
+            self.dropped_full += len(rows)
+            return
+
+        for features, preds in zip(rows, predictions):
+            primary_version = self.primary.version_for(features.get("bus_nbr"))
+            self._queue.append({**features, **preds, "primary_version": primary_version})
+        if len(self._queue) >= self.max_rows and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _take_batch(self) -> list[dict]:
+        return [self._queue.popleft() for _ in range(min(self.max_rows, len(self._queue)))]
+
+    def score(self, batch: list[dict]) -> list[dict]:
+        """Évalue un micro-lot avec le pack fantôme et renvoie les lignes de log. Bloquant."""
+        bundle = self.bundle
+        X = bundle.feature_builder.build_matrix(batch)
+        with MODEL_SECONDS.time(engine="shadow", quantile="all"):
+            preds = bundle.engine.predict(X)
+        return [
+            {**row, **dict(zip(SHADOW_KEYS, map(float, values))), "shadow_version": bundle.version}
+            for row, values in zip(batch, preds)
+        ]
+
+    async def drain(self):
+        """Évalue toute la file, micro-lot par micro-lot."""
+        while self._queue:
+            batch = self._take_batch()
+            # Vérifié à nouveau avant chaque lot : la charge a pu monter depuis le dépôt
+            if self.overloaded():
+                self.dropped_load += len(batch)
+                continue
+            try:
+                logs = await asyncio.to_thread(self.score, batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"Échec de l'évaluation fantôme de {len(batch)} lignes : {e}")
+                continue
+            self.batches += 1
+            self.scored += len(logs)
+            self.writer.submit(logs)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.window)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.drain()
+
+    def start(self):
+        if self.bundle is None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Arrête la tâche de fond ; les lignes encore en file sont abandonnées."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._wakeup = None
+        self._queue.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "version": self.bundle.version if self.bundle else None,
+            "queued": len(self._queue),
+            "max_queue": self.max_queue,
+            "batches": self.batches,
+            "scored": self.scored,
+            "dropped_load": self.dropped_load,
+            "dropped_full": self.dropped_full,
+            "failed": self.failed,
+        }
+
+
+shadow_evaluator = ShadowEvaluator(
+    model_instance,
+    shadow_log_writer,
+    window=SHADOW_BATCH_WINDOW_MS / 1000,
+    max_rows=SHADOW_BATCH_MAX_ROWS,
+    max_queue=SHADOW_QUEUE_MAX,
+)
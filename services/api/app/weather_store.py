@@ -0,0 +1,160 @@
+import logging
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Tables alimentées par le pipeline météo (run_archive_weather.py / run_forecast_weather.py)
+# Les archives (observations) sont chargées en dernier : elles priment sur les prévisions
+WEATHER_TABLES = ["stg_weather_forecast", "stg_weather_archive"]
+ARCHIVE_TABLE = "stg_weather_archive"
+
+# Features météo attendues par le modèle, dans l'ordre des colonnes du tableau
+WEATHER_FEATURES = [
+    "temperature_2m", "precipitation", "rain", "snowfall",
+    "weather_code", "cloud_cover", "dew_point_2m", "wind_speed_10m",
+    "wind_gusts_10m", "wind_direction_10m",
+    "soleil_leve", "risque_gel_pluie", "risque_gel_neige", "neige_fondue",
+]
+INTEGER_FEATURES = {
+    "weather_code", "cloud_cover", "wind_direction_10m",
+    "soleil_leve", "risque_gel_pluie", "risque_gel_neige", "neige_fondue",
+}
+
+# Intervalle de rechargement des tables (secondes)
+WEATHER_STORE_REFRESH = float(os.getenv("WEATHER_STORE_REFRESH", "3600"))
+
+HOUR = np.timedelta64(1, "h")
+
+
+class WeatherStore:
+    """
+    Feature store météo côté API.
+
+    Les tables stg_weather_* sont chargées en mémoire dans un tableau dense
+    (une ligne par heure depuis le premier timestamp_rounded) : la recherche
+    des features d'une heure est un simple accès par index.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (première heure, valeurs (n_heures, n_features), heures renseignées, heures observées)
+        self._data = None
+        self.loaded_at = None
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def refresh(self, engine) -> int:
+        """Recharge les tables météo depuis la base. Renvoie le nombre d'heures disponibles."""
+        frames = []
+        with engine.connect() as conn:
+            for table in WEATHER_TABLES:
+                try:
+                    query = text(f"SELECT timestamp_rounded, {', '.join(WEATHER_FEATURES)} FROM {table}")
+                    frame = pd.read_sql(query, conn)
+                    frame["observed"] = table == ARCHIVE_TABLE
+                    frames.append(frame)
+                except Exception as e:
+                    logger.warning(f"Table {table} indisponible pour le feature store météo : {e}")
+                    conn.rollback()
+
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        self.load_frame(df)
+        return self.size
+
+    def load_frame(self, df: pd.DataFrame):
+        """
+        Construit le tableau dense à partir d'un DataFrame (timestamp_rounded + features).
+        La colonne optionnelle `observed` distingue les archives des prévisions (archives par défaut).
+        """
+        if df.empty:
+            data = None
+        else:
+            ts = pd.to_datetime(df["timestamp_rounded"])
+            # Les heures sont exprimées en heure locale de Stockholm (comme les requêtes)
+            if ts.dt.tz is not None:
+                ts = ts.dt.tz_convert("Europe/Stockholm").dt.tz_localize(None)
+            ts = ts.dt.floor("h").to_numpy(dtype="datetime64[h]")
+
+            start = ts.min()
+            idx = ((ts - start) // HOUR).astype(np.int64)
+            values = np.full((int(idx.max()) + 1, len(WEATHER_FEATURES)), np.nan)
+            # En cas de doublons, la dernière ligne lue l'emporte (archives après prévisions)
+            values[idx] = df[WEATHER_FEATURES].to_numpy(dtype=np.float64)
+            present = ~np.isnan(values).any(axis=1)
+            observed = np.zeros(len(values), dtype=bool)
+            observed[idx] = df["observed"].to_numpy(dtype=bool) if "observed" in df else True
+            data = (start, values, present, present & observed)
+
+        with self._lock:
+            self._data = data
+            self.loaded_at = datetime.now()
+            self.generation += 1
+
+    @property
+    def size(self) -> int:
+        data = self._data
+        return 0 if data is None else int(data[2].sum())
+
+    def lookup(self, target_date: datetime) -> dict | None:
+        """Renvoie les features météo de l'heure demandée, ou None si elle n'est pas en mémoire."""
+        data = self._data
+        if data is not None:
+            start, values, present, _ = data
+            i = int((np.datetime64(target_date, "h") - start) // HOUR)
+            if 0 <= i < len(values) and present[i]:
+                self.hits += 1
+                row = values[i]
+                return {
+                    name: int(v) if name in INTEGER_FEATURES else float(v)
+                    for name, v in zip(WEATHER_FEATURES, row)
+                }
+        self.misses += 1
+        return None
+
+    def history(self, observed_only: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Heures renseignées du feature store : (timestamps datetime64[h], valeurs (n, n_features)).
+        Avec observed_only, seules les heures issues des archives (observations) sont renvoyées.
+        """
+        data = self._data
+        if data is None:
+            return np.array([], dtype="datetime64[h]"), np.empty((0, len(WEATHER_FEATURES)))
+        start, values, present, observed = data
+        idx = np.flatnonzero(observed if observed_only else present)
+        return start + idx.astype("timedelta64[h]"), values[idx]
+
+    def lookup_range(self, start: datetime, n_hours: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Features météo de `n_hours` heures consécutives à partir de `start`.
+        Renvoie (valeurs (n_hours, n_features), heures renseignées). Sans effet sur les compteurs.
+        """
+        values = np.full((n_hours, len(WEATHER_FEATURES)), np.nan)
+        present = np.zeros(n_hours, dtype=bool)
+        data = self._data
+        if data is not None:
+            first, stored, stored_present, _ = data
+            offset = int((np.datetime64(start, "h") - first) // HOUR)
+            lo, hi = max(offset, 0), min(offset + n_hours, len(stored))
+            if lo < hi:
+                values[lo - offset:hi - offset] = stored[lo:hi]
+                present[lo - offset:hi - offset] = stored_present[lo:hi]
+        return values, present
+
+    def stats(self) -> dict:
+        return {
+            "hours": self.size,
+            "generation": self.generation,
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+weather_store = WeatherStore()
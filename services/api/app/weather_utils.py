@@ -1,110 +1,297 @@
-import requests
-from datetime import datetime, timedelta
-import holidays
+import asyncio
+import time
+import httpx
+from datetime import date, datetime, timedelta
 import os
 
-def get_weather_features(month: int, day: int, hour: int):
+from .cache import TTLCache, SingleFlight
+from .calendar_features import calendar_table
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .climatology import climatology
+from .weather_store import weather_store
+from .metrics import WEATHER_SECONDS, WEATHER_ERRORS, WEATHER_FALLBACKS
+
+# Coordonnées Stockholm
+LAT, LON = 59.3251172, 18.0710935
+
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+HOURLY_VARIABLES = [
+    "temperature_2m", "precipitation", "rain", "snowfall",
+    "weather_code", "cloud_cover", "dew_point_2m", "wind_speed_10m",
+    "wind_gusts_10m", "wind_direction_10m"
+]
+
+# Cache des réponses Open-Meteo : une entrée = une journée complète (horaire + journalier)
+# Les prévisions sont réactualisées régulièrement, les archives ne changent plus
+WEATHER_FORECAST_TTL = float(os.getenv("WEATHER_FORECAST_TTL", "900"))
+WEATHER_ARCHIVE_TTL = float(os.getenv("WEATHER_ARCHIVE_TTL", "604800"))
+weather_cache = TTLCache(maxsize=int(os.getenv("WEATHER_CACHE_SIZE", "64")), ttl=WEATHER_FORECAST_TTL)
+
+# Les requêtes concurrentes sur une même journée partagent un seul appel Open-Meteo
+weather_single_flight = SingleFlight()
+
+# Horizon de l'API Forecast (jours) : au-delà, la météo est lue dans la climatologie
+WEATHER_FORECAST_HORIZON_DAYS = float(os.getenv("WEATHER_FORECAST_HORIZON_DAYS", "7"))
+
+# Temps d'attente maximal d'Open-Meteo dans une requête (secondes) : au-delà, la météo
+# de repli est servie et l'appel se termine en arrière-plan pour alimenter le cache
+WEATHER_FETCH_BUDGET = float(os.getenv("WEATHER_FETCH_BUDGET", "2"))
+# Sans météo de repli, la requête attend Open-Meteo jusqu'au délai HTTP (secondes)
+WEATHER_HTTP_TIMEOUT = float(os.getenv("WEATHER_HTTP_TIMEOUT", "15"))
+# Disjoncteur : échecs (ou appels plus lents que le budget) consécutifs avant ouverture, durée d'ouverture
+weather_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("WEATHER_BREAKER_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("WEATHER_BREAKER_RESET", "30")),
+)
+# Dernière réponse valide de chaque journée, conservée après expiration du cache
+weather_last_good = TTLCache(
+    maxsize=int(os.getenv("WEATHER_LAST_GOOD_SIZE", "366")),
+    ttl=float(os.getenv("WEATHER_LAST_GOOD_TTL", "604800")),
+)
+
+
+class WeatherClient:
     """
-    Récupère les données météo pour une date donnée à Stockholm via Open-Meteo.
-    On utilise l'année en cours par défaut.
+    Client HTTP asynchrone pour Open-Meteo.
+
+    Un seul pool de connexions keep-alive est partagé par toutes les requêtes et le
+    nombre d'appels simultanés vers l'API externe est borné par un sémaphore.
+    Le client est créé à la première utilisation (dans la boucle d'événements courante)
+    et fermé à l'arrêt de l'application.
     """
-    year = datetime.now().year
-    target_date = datetime(year, month, day, hour)
-    now = datetime.now()
-    
-    # Coordonnées Stockholm
-    LAT, LON = 59.3251172, 18.0710935
-    
-    # Choix de l'API (Archive vs Forecast)
-    # Open-Meteo Forecast API couvre J-2 à J+7 (ou plus selon paramètres)
-    # Archive API couvre jusqu'à J-2 environ
-    is_archive = target_date < (now - timedelta(days=2))
-    
-    if is_archive:
-        url = "https://archive-api.open-meteo.com/v1/archive"
-    else:
-        url = "https://api.open-meteo.com/v1/forecast"
-        
-    date_str = target_date.strftime("%Y-%m-%d")
-    
+
+    def __init__(self, timeout: float, connect_timeout: float, max_connections: int, max_concurrency: int,
+                 transport: httpx.AsyncBaseTransport | None = None):
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.max_concurrency = max_concurrency
+        # Transport alternatif (tests, bouchon Open-Meteo local)
+        self.transport = transport
+        self._client = None
+        self._semaphore = None
+
+    async def get_json(self, url: str, params: dict) -> dict:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, transport=self.transport)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            response = await self._client.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._semaphore = None
+
+
+weather_client = WeatherClient(
+    timeout=WEATHER_HTTP_TIMEOUT,
+    connect_timeout=float(os.getenv("WEATHER_HTTP_CONNECT_TIMEOUT", "5")),
+    max_connections=int(os.getenv("WEATHER_HTTP_MAX_CONNECTIONS", "20")),
+    max_concurrency=int(os.getenv("WEATHER_HTTP_MAX_CONCURRENCY", "10")),
+)
+
+
+async def _fetch_weather_day(date_str: str, is_archive: bool) -> dict:
+    """Appelle Open-Meteo pour une journée complète (24 valeurs horaires + lever/coucher du soleil)."""
     params = {
         "latitude": LAT,
         "longitude": LON,
         "start_date": date_str,
         "end_date": date_str,
-        "hourly": [
-            "temperature_2m", "precipitation", "rain", "snowfall",
-            "weather_code", "cloud_cover", "dew_point_2m", "wind_speed_10m", 
-            "wind_gusts_10m", "wind_direction_10m"
-        ],
+        "hourly": HOURLY_VARIABLES,
         "daily": ["sunrise", "sunset"],
         "timezone": "Europe/Stockholm"
     }
-    
+
+    return await weather_client.get_json(ARCHIVE_URL if is_archive else FORECAST_URL, params)
+
+
+async def _get_weather_day(date_str: str, is_archive: bool) -> dict:
+    """Renvoie la réponse Open-Meteo d'une journée, depuis le cache si elle est encore valide."""
+    key = (date_str, "archive" if is_archive else "forecast")
+    start = time.perf_counter()
+    data = weather_cache.get(key)
+    if data is not None:
+        WEATHER_SECONDS.observe(time.perf_counter() - start, source="cache")
+        return data
+
+    async def fetch_and_cache():
+        fetch_start = time.perf_counter()
+        try:
+            result = await _fetch_weather_day(date_str, is_archive)
+        except Exception:
+            weather_breaker.record_failure()
+            raise
+        # Un appel plus lent que le budget compte comme un échec pour le disjoncteur
+        if time.perf_counter() - fetch_start > WEATHER_FETCH_BUDGET:
+            weather_breaker.record_failure()
+        else:
+            weather_breaker.record_success()
+        weather_cache.set(key, result, ttl=WEATHER_ARCHIVE_TTL if is_archive else WEATHER_FORECAST_TTL)
+        weather_last_good.set(date_str, result)
+        return result
+
+    if not weather_breaker.allow():
+        raise CircuitOpenError("Open-Meteo indisponible (disjoncteur ouvert)")
+
+    data = await weather_single_flight.do(key, fetch_and_cache)
+    WEATHER_SECONDS.observe(time.perf_counter() - start, source="open_meteo")
+    return data
+
+
+def _fallback_weather(date_str: str, target_date: datetime) -> tuple[str, dict] | None:
+    """
+    Météo de repli (marquée weather_degraded) et sa source : dernière réponse valide
+    connue pour la journée, sinon climatologie (mois, heure) du feature store.
+    Le compteur WEATHER_FALLBACKS est incrémenté par l'appelant, quand elle est servie.
+    """
+    data = weather_last_good.get(date_str)
+    if data is not None:
+        return "last_good", {**_extract_hour_features(data, target_date), "weather_degraded": True}
+
+    typical = climatology.lookup(target_date)
+    if typical is not None:
+        return "climatology", {**typical, "weather_degraded": True}
+    return None
+
+
+def _extract_hour_features(data: dict, target_date: datetime) -> dict:
+    """Extrait les features météo d'une heure à partir de la réponse journalière."""
+    # On récupère l'index correspondant à l'heure
+    # Les données horaires commencent à 00:00
+    h_idx = target_date.hour
+
+    hourly = data.get("hourly", {})
+    res = {name: hourly.get(name)[h_idx] for name in HOURLY_VARIABLES}
+
+    # Soleil levé ?
+    sunrise = datetime.fromisoformat(data["daily"]["sunrise"][0])
+    sunset = datetime.fromisoformat(data["daily"]["sunset"][0])
+    res["soleil_leve"] = 1 if sunrise <= target_date <= sunset else 0
+
+    # Logique Risques
+    res["risque_gel_pluie"] = 1 if res["temperature_2m"] <= 0 and res["weather_code"] in [61, 63, 65] else 0
+    res["risque_gel_neige"] = 1 if res["temperature_2m"] <= 0 and res["weather_code"] in [71, 73, 75] else 0
+    res["neige_fondue"] = 1 if res["temperature_2m"] > 0 and res["weather_code"] in [71, 73, 75] else 0
+
+    return res
+
+
+async def get_weather_features(month: int, day: int, hour: int):
+    """
+    Récupère les données météo pour une date donnée à Stockholm.
+    Les tables météo chargées en mémoire sont consultées en premier ; Open-Meteo
+    n'est appelé que si l'heure demandée n'y figure pas ; au-delà de l'horizon des
+    prévisions, la climatologie est utilisée sans appel réseau. Si Open-Meteo échoue,
+    dépasse WEATHER_FETCH_BUDGET ou si son disjoncteur est ouvert, une météo de
+    repli est renvoyée avec la clé weather_degraded ; sans météo de repli, Open-Meteo
+    est attendu jusqu'à WEATHER_HTTP_TIMEOUT.
+    On utilise l'année en cours par défaut.
+    """
+    year = datetime.now().year
+    return (await _get_weather_hours([datetime(year, month, day, hour)]))[0]
+
+
+async def get_weather_range(start: datetime, n_hours: int) -> list[dict]:
+    """
+    Météo de `n_hours` heures consécutives à partir de `start`, éventuellement sur
+    plusieurs jours (passage de minuit, de fin de mois ou d'année). Même ordre de
+    recherche que get_weather_features, mais Open-Meteo est appelé au plus une fois
+    par journée ; les journées sont récupérées en parallèle.
+    """
+    hours = [start + timedelta(hours=k) for k in range(n_hours)]
+    days = {}
+    for i, target_date in enumerate(hours):
+        days.setdefault(target_date.date(), []).append(i)
+
+    results = [None] * n_hours
+    per_day = await asyncio.gather(*(_get_weather_hours([hours[i] for i in indices]) for indices in days.values()))
+    for indices, features in zip(days.values(), per_day):
+        for i, feats in zip(indices, features):
+            results[i] = feats
+    return results
+
+
+async def _get_weather_hours(hours: list[datetime]) -> list[dict]:
+    """Météo de plusieurs heures d'une même journée : au plus un appel Open-Meteo."""
+    now = datetime.now()
+    results = [None] * len(hours)
+
+    for i, target_date in enumerate(hours):
+        start = time.perf_counter()
+        stored = weather_store.lookup(target_date)
+        if stored is not None:
+            WEATHER_SECONDS.observe(time.perf_counter() - start, source="store")
+            results[i] = stored
+            continue
+
+        # Au-delà de l'horizon des prévisions : météo typique de la climatologie, sans appel réseau
+        if target_date > now + timedelta(days=WEATHER_FORECAST_HORIZON_DAYS):
+            typical = climatology.lookup(target_date)
+            if typical is not None:
+                WEATHER_SECONDS.observe(time.perf_counter() - start, source="climatology")
+                results[i] = typical
+
+    missing = [i for i, res in enumerate(results) if res is None]
+    if not missing:
+        return results
+
+    # Choix de l'API (Archive vs Forecast)
+    # Open-Meteo Forecast API couvre J-2 à J+7 (ou plus selon paramètres)
+    # Archive API couvre jusqu'à J-2 environ
+    first = hours[missing[0]]
+    is_archive = first < (now - timedelta(days=2))
+
+    date_str = first.strftime("%Y-%m-%d")
+
+    # Le budget ne s'applique que si une météo de repli existe pour chaque heure manquante :
+    # sinon mieux vaut attendre Open-Meteo (jusqu'à WEATHER_HTTP_TIMEOUT) que répondre en erreur.
+    # Simple vérification de disponibilité : la météo de repli n'est construite qu'en cas d'échec
+    has_fallback = weather_last_good.contains(date_str) or all(climatology.has_data(hours[i]) for i in missing)
+    timeout = WEATHER_FETCH_BUDGET if has_fallback else WEATHER_HTTP_TIMEOUT
+
     try:
-        response = requests.get(url, params=params, timeout=15)
-        response.raise_for_status()
-        data = response.json()
-        
-        # On récupère l'index correspondant à l'heure
-        # Les données horaires commencent à 00:00
-        h_idx = hour
-        
-        hourly = data.get("hourly", {})
-        res = {
-            "temperature_2m": hourly.get("temperature_2m")[h_idx],
-            "precipitation": hourly.get("precipitation")[h_idx],
-            "rain": hourly.get("rain")[h_idx],
-            "snowfall": hourly.get("snowfall")[h_idx],
-            "weather_code": hourly.get("weather_code")[h_idx],
-            "cloud_cover": hourly.get("cloud_cover")[h_idx],
-            "dew_point_2m": hourly.get("dew_point_2m")[h_idx],
-            "wind_speed_10m": hourly.get("wind_speed_10m")[h_idx],
-            "wind_gusts_10m": hourly.get("wind_gusts_10m")[h_idx],
-            "wind_direction_10m": hourly.get("wind_direction_10m")[h_idx],
-        }
-        
-        # Soleil levé ?
-        sunrise = datetime.fromisoformat(data["daily"]["sunrise"][0])
-        sunset = datetime.fromisoformat(data["daily"]["sunset"][0])
-        res["soleil_leve"] = 1 if sunrise <= target_date <= sunset else 0
-        
-        # Logique Risques
-        res["risque_gel_pluie"] = 1 if res["temperature_2m"] <= 0 and res["weather_code"] in [61, 63, 65] else 0
-        res["risque_gel_neige"] = 1 if res["temperature_2m"] <= 0 and res["weather_code"] in [71, 73, 75] else 0
-        res["neige_fondue"] = 1 if res["temperature_2m"] > 0 and res["weather_code"] in [71, 73, 75] else 0
-        
-        return res
+        data = await asyncio.wait_for(_get_weather_day(date_str, is_archive), timeout=timeout)
+        for i in missing:
+            results[i] = _extract_hour_features(data, hours[i])
+        return results
     except Exception as e:
-        print(f"Erreur API Météo: {e}")
-        # On propage l'erreur pour que l'API principale la gère
-        raise Exception(f"Impossible de récupérer les données météo : {str(e)}")
+        WEATHER_ERRORS.inc()
+        if isinstance(e, asyncio.TimeoutError):
+            e = TimeoutError(f"pas de réponse d'Open-Meteo en {timeout:g} s")
+        # Open-Meteo lent ou indisponible : latence bornée grâce à la météo de repli
+        fallbacks = [_fallback_weather(date_str, hours[i]) for i in missing] if has_fallback else [None]
+        if any(fallback is None for fallback in fallbacks):
+            print(f"Erreur API Météo: {e}")
+            # On propage l'erreur pour que l'API principale la gère
+            raise Exception(f"Impossible de récupérer les données météo : {str(e)}")
+        for i, (source, fallback) in zip(missing, fallbacks):
+            WEATHER_FALLBACKS.inc(source=source)
+            results[i] = fallback
+        print(f"Météo dégradée pour {date_str} ({type(e).__name__} {e})")
+        return results
 
 def get_calendar_features(month: int, day: int, day_of_week: int):
     """
     Calcule les features calendaires pour Stockholm.
+    Les jours fériés et vacances scolaires sont lus dans la table précalculée.
     """
     year = datetime.now().year
-    dt = datetime(year, month, day)
-    
-    se_holidays = holidays.CountryHoliday('SE')
-    
-    is_weekend = 1 if day_of_week in [5, 6] else 0
-    is_holiday = 1 if dt in se_holidays else 0
-    
-    # Vacances scolaires (simplifié comme dans le pipeline original)
-    def est_vacances_scolaires(date):
-        week = date.isocalendar()[1]
-        m, d = date.month, date.day
-        if week == 9: return 1 # Sportlov
-        if week == 15: return 1 # Pasklov
-        if 24 <= week <= 33: return 1 # Sommarlov
-        if week == 44: return 1 # Höstlov
-        if (m == 12 and d >= 21) or (m == 1 and d <= 8): return 1 # Jullov
-        return 0
-        
+    return get_calendar_features_for_date(date(year, month, day), day_of_week)
+
+
+def get_calendar_features_for_date(target_date: date, day_of_week: int):
+    """Features calendaires d'une date complète (année comprise, ex. horizon qui passe au 1er janvier)."""
+    cal = calendar_table.lookup(target_date)
+
     return {
-        "est_weekend": is_weekend,
-        "est_jour_ferie": is_holiday,
-        "vacances_scolaires": est_vacances_scolaires(dt)
+        "est_weekend": 1 if day_of_week in [5, 6] else 0,
+        "est_jour_ferie": cal["est_jour_ferie"],
+        "vacances_scolaires": cal["vacances_scolaires"]
     }
@@ -0,0 +1,37 @@
+import holidays
+import numpy as np
+import pandas as pd
+
+
+def est_vacances_scolaires(dates: pd.DatetimeIndex) -> np.ndarray:
+    """Vacances scolaires suédoises (simplification), calculées en une fois sur un index de dates."""
+    week = dates.isocalendar().week.to_numpy()
+    month, day = dates.month.to_numpy(), dates.day.to_numpy()
+    return (
+        (week == 9)                                                # Sportlov
+        | (week == 15)                                             # Pasklov
+        | ((week >= 24) & (week <= 33))                            # Sommarlov
+        | (week == 44)                                             # Höstlov
+        | ((month == 12) & (day >= 21)) | ((month == 1) & (day <= 8))  # Jullov
+    ).astype(int)
+
+
+def build_calendar_table(start_year: int, end_year: int) -> pd.DataFrame:
+    """
+    Table calendaire suédoise dense : une ligne par jour de start_year à end_year inclus,
+    indexée par la date (datetime normalisé à minuit).
+    Source unique des règles : l'API (app.calendar_features) en lit une copie faite au build de l'image.
+    """
+    dates = pd.date_range(f"{start_year}-01-01", f"{end_year}-12-31", freq="D", name="calendar_date")
+
+    # Comme holidays.CountryHoliday('SE') : les dimanches sont des jours fériés
+    sweden_holidays = holidays.country_holidays("SE", years=range(start_year, end_year + 1))
+
+    return pd.DataFrame(
+        {
+            "est_weekend": (dates.dayofweek >= 5).astype(int),
+            "est_jour_ferie": dates.isin(pd.to_datetime(list(sweden_holidays.keys()))).astype(int),
+            "vacances_scolaires": est_vacances_scolaires(dates),
+        },
+        index=dates,
+    )
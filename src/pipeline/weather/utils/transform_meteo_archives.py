@@ -1,10 +1,11 @@
 import pandas as pd
 import json
-import holidays
 from datetime import datetime
 import os
 import uuid
 
+from pipeline.weather.utils.calendar_sweden import build_calendar_table
+
 
 # Configuration du chemin vers le dossier data
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -58,31 +59,20 @@ def etl_weather_transformation(json_file):
 
 # FONCTION 2 - ENRICHISSEMENT CALENDRIER SUÉDOIS
 def enrich_calendar_features(df):
-    """Ajoute les spécificités du calendrier suédois."""
-    sweden_holidays = holidays.CountryHoliday('SE')
+    """Ajoute les spécificités du calendrier suédois (jointure sur la table calendaire précalculée)."""
 
-    # Bases (année, mois, jour de la semaine, weekend, jour férié)
+    # Bases (année, mois, jour de la semaine)
     df["observation_uuid"] = [str(uuid.uuid4()) for _ in range(len(df))]
     df['year'] = df['timestamp'].dt.year
     df['month'] = df['timestamp'].dt.month
     # df['day'] = df['timestamp'].dt.day
     df['day_of_week'] = df['timestamp'].dt.dayofweek
-    df['est_weekend'] = df['day_of_week'].isin([5, 6]).astype(int)
-    df['est_jour_ferie'] = df['timestamp'].dt.date.apply(lambda x: 1 if x in sweden_holidays else 0)
-    
-    # Vacances scolaires suédoises (silmplification)
-    def est_vacances_scolaires(date):
-        week = date.isocalendar()[1]
-        month, day = date.month, date.day
-        if week == 9: return 1 # Sportlov
-        if week == 15: return 1 # Pasklov
-        if 24 <= week <= 33: return 1 # Sommarlov
-        if week == 44: return 1 # Höstlov
-        if (month == 12 and day >= 21) or (month == 1 and day <= 8): return 1 # Jullov
-        return 0
-
-    df['vacances_scolaires'] = df['timestamp'].apply(est_vacances_scolaires)
 
+    # Weekend, jour férié, vacances scolaires : une ligne de table par jour couvert
+    calendar = build_calendar_table(df['year'].min(), df['year'].max())
+    df['calendar_date'] = df['timestamp'].dt.normalize()
+    df = df.merge(calendar, left_on='calendar_date', right_index=True, how='left')
+    df = df.drop(columns=['calendar_date'])
 
     return df
 
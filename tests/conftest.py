@@ -1,6 +1,8 @@
 import pytest
 import sys
 import os
+import numpy as np
+import pandas as pd
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
@@ -8,9 +10,10 @@ from fastapi.testclient import TestClient
 # Add services/api to sys.path to allow imports from app
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../services/api')))
 
-from app.main import app as fastapi_app, get_db
-from app.database import Base
+from app.main import app as fastapi_app
+from app.database import Base, get_db
 import app.data_structure 
+from app.log_writer import log_writer
 
 # Setup de la base de test
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -44,6 +47,71 @@ def client(db_session):
             pass
     
     fastapi_app.dependency_overrides[get_db] = override_get_db
+    # Les prediction_logs sont écrits dans la base de test
+    log_writer.session_factory = TestingSessionLocal
     with TestClient(fastapi_app) as c:
         yield c
     fastapi_app.dependency_overrides.clear()
+
+# Colonnes de la matrice d'entraînement (cf. input_example.json des artefacts MLflow)
+MODEL_FEATURES = [
+    "hour", "stop_sequence", "cloud_cover", "day_of_week", "dew_point_2m", "est_jour_ferie",
+    "est_weekend", "month", "neige_fondue", "precipitation", "rain", "risque_gel_neige",
+    "risque_gel_pluie", "snowfall", "soleil_leve", "temperature_2m", "vacances_scolaires",
+    "wind_direction_10m", "wind_gusts_10m", "wind_speed_10m", "hour_sin", "hour_cos",
+    "day_sin", "day_cos", "month_sin", "month_cos", "direction_id_1", "weather_code_1",
+    "weather_code_2", "weather_code_3", "weather_code_51", "weather_code_53", "weather_code_55",
+    "weather_code_61", "weather_code_63", "weather_code_65", "weather_code_71",
+    "weather_code_73", "weather_code_75",
+]
+
+# Reproduit le preprocessing de train_model.py pour une ligne de features
+def reference_frame(features_dict):
+    row = {col: 0 for col in MODEL_FEATURES}
+    for col in MODEL_FEATURES:
+        if col in features_dict:
+            row[col] = features_dict[col]
+    row["hour_sin"] = np.sin(2 * np.pi * features_dict["hour"] / 24)
+    row["hour_cos"] = np.cos(2 * np.pi * features_dict["hour"] / 24)
+    row["day_sin"] = np.sin(2 * np.pi * features_dict["day_of_week"] / 7)
+    row["day_cos"] = np.cos(2 * np.pi * features_dict["day_of_week"] / 7)
+    row["month_sin"] = np.sin(2 * np.pi * features_dict["month"] / 12)
+    row["month_cos"] = np.cos(2 * np.pi * features_dict["month"] / 12)
+    row["direction_id_1"] = int(features_dict["direction_id"] == 1)
+    wc_col = f"weather_code_{features_dict['weather_code']}"
+    if wc_col in row:
+        row[wc_col] = 1
+    return pd.DataFrame([row], columns=MODEL_FEATURES)
+
+
+# Fixture d'un pack de modèles quantiles réduit, entraîné sur des données synthétiques
+@pytest.fixture(scope="session")
+def quantile_models():
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    rng = np.random.default_rng(42)
+    X = pd.DataFrame(rng.normal(size=(300, len(MODEL_FEATURES))), columns=MODEL_FEATURES)
+    X["direction_id_1"] = rng.integers(0, 2, size=300)
+    X["weather_code_3"] = rng.integers(0, 2, size=300)
+    y = 60 * X["hour"] + 30 * X["direction_id_1"] + 20 * X["weather_code_3"] + rng.normal(scale=10, size=300)
+
+    models = {}
+    for alpha, name in zip([0.5, 0.8, 0.9], ["P50_Median", "P80_Pessimist", "P90_Extreme"]):
+        model = GradientBoostingRegressor(
+            loss="quantile", alpha=alpha, n_estimators=20, max_depth=3, learning_rate=0.1, random_state=42
+        )
+        models[name] = model.fit(X, y)
+    return models
+
+# Exemple de features complètes (utilisateur + calendrier + météo) telles que reçues par MLModel
+@pytest.fixture
+def sample_features():
+    return {
+        "direction_id": 1, "month": 1, "day": 8, "hour": 20, "day_of_week": 4,
+        "bus_nbr": "541", "stop_sequence": 3,
+        "est_weekend": 0, "est_jour_ferie": 0, "vacances_scolaires": 1,
+        "temperature_2m": -2.5, "precipitation": 0.4, "rain": 0.0, "snowfall": 0.3,
+        "weather_code": 71, "cloud_cover": 100, "dew_point_2m": -4.0, "wind_speed_10m": 12.0,
+        "wind_gusts_10m": 25.0, "wind_direction_10m": 180,
+        "soleil_leve": 0, "risque_gel_pluie": 0, "risque_gel_neige": 1, "neige_fondue": 0,
+    }
@@ -0,0 +1,73 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.admission import AdmissionController, AdmissionRejected, TokenBucketLimiter
+
+
+def test_requests_beyond_queue_are_rejected():
+    """Au-delà des places actives et de la file, le refus est immédiat."""
+    controller = AdmissionController(max_concurrency=2, max_queue=1, queue_timeout=5, retry_after=1)
+
+    async def run():
+        await controller.acquire()
+        await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        assert controller.stats()["queued"] == 1
+
+        with pytest.raises(AdmissionRejected) as exc:
+            await controller.acquire()
+        assert exc.value.reason == "queue_full"
+
+        # Une place libérée admet la requête en attente
+        controller.release()
+        await asyncio.wait_for(waiter, timeout=1)
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert stats["active"] == 2
+    assert stats["queued"] == 0
+    assert stats["admitted"] == 3
+    assert stats["rejected"] == {"queue_full": 1, "queue_timeout": 0}
+
+
+def test_queue_timeout():
+    controller = AdmissionController(max_concurrency=1, max_queue=10, queue_timeout=0.01, retry_after=1)
+
+    async def run():
+        await controller.acquire()
+        with pytest.raises(AdmissionRejected) as exc:
+            await controller.acquire()
+        return exc.value.reason
+
+    assert asyncio.run(run()) == "queue_timeout"
+    assert controller.stats()["queued"] == 0
+
+
+def test_token_bucket_per_client():
+    limiter = TokenBucketLimiter(rate=1, burst=2, max_clients=100)
+
+    with patch("app.admission.time.monotonic", return_value=100.0):
+        assert limiter.acquire("a") == 0
+        assert limiter.acquire("a") == 0
+        # Seau vide : un jeton dans une seconde
+        assert limiter.acquire("a") == pytest.approx(1.0)
+        # Les autres clients ont leur propre seau
+        assert limiter.acquire("b") == 0
+
+    with patch("app.admission.time.monotonic", return_value=101.5):
+        assert limiter.acquire("a") == 0
+
+    assert limiter.stats()["rejected"] == 1
+    assert limiter.stats()["clients"] == 2
+
+
+def test_token_bucket_forgets_oldest_clients():
+    limiter = TokenBucketLimiter(rate=1, burst=1, max_clients=2)
+    for client in ("a", "b", "c"):
+        limiter.acquire(client)
+    assert limiter.stats()["clients"] == 2
+    # "a" a été oublié : son seau repart plein
+    assert limiter.acquire("a") == 0
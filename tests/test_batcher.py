@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from app.batcher import InferenceBatcher
+from app.model import MLModel
+
+
+def test_concurrent_requests_share_one_call(quantile_models, sample_features):
+    """Les requêtes arrivées dans la même fenêtre sont évaluées en un seul appel."""
+    model = MLModel(models=quantile_models)
+    calls = []
+    predict_batch = model.predict_batch
+    model.predict_batch = lambda rows: calls.append(len(rows)) or predict_batch(rows)
+    batcher = InferenceBatcher(model, window=0.05, max_rows=64)
+
+    rows = [{**sample_features, "hour": h} for h in range(10)]
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(dict(r)) for r in rows))
+
+    results = asyncio.run(run())
+
+    assert calls == [10]
+    expected = MLModel(models=quantile_models).predict_batch([dict(r) for r in rows])
+    for res, ref in zip(results, expected):
+        assert res == pytest.approx(ref)
+    stats = batcher.stats()
+    assert stats["batches"] == 1
+    assert stats["batch_size_histogram"]["16"] == 1
+    assert stats["max_queue_delay_ms"] > 0
+
+
+def test_max_rows_dispatches_immediately(quantile_models, sample_features):
+    model = MLModel(models=quantile_models)
+    batcher = InferenceBatcher(model, window=10.0, max_rows=4)
+
+    async def run():
+        # La fenêtre (10 s) n'est jamais atteinte : les lots partent à 4 lignes
+        return await asyncio.wait_for(
+            asyncio.gather(*(batcher.submit({**sample_features, "hour": h}) for h in range(8))), timeout=5
+        )
+
+    assert len(asyncio.run(run())) == 8
+    assert batcher.stats()["batches"] == 2
+
+
+def test_errors_propagate_to_every_request(sample_features):
+    class Broken:
+        def predict_batch(self, rows):
+            raise ValueError("Erreur: Les modèles ne sont pas chargés.")
+
+    batcher = InferenceBatcher(Broken(), window=0.01, max_rows=64)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(dict(sample_features)) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(r, ValueError) for r in asyncio.run(run()))
@@ -0,0 +1,53 @@
+from datetime import date, timedelta
+from pathlib import Path
+
+import holidays
+import pytest
+
+from app.calendar_features import CalendarTable
+from app.weather_utils import get_calendar_features
+
+
+def reference_day(day: date) -> dict:
+    """Calcul historique, jour par jour (avant la table précalculée)."""
+    week = day.isocalendar()[1]
+    m, d = day.month, day.day
+    vacances = int(
+        week in (9, 15, 44) or 24 <= week <= 33 or (m == 12 and d >= 21) or (m == 1 and d <= 8)
+    )
+    return {
+        "est_weekend": int(day.weekday() in [5, 6]),
+        "est_jour_ferie": int(day in holidays.country_holidays("SE")),
+        "vacances_scolaires": vacances,
+    }
+
+
+@pytest.fixture(scope="module")
+def table():
+    return CalendarTable(2024, 2026)
+
+
+def test_table_matches_per_day_rules(table):
+    day = date(2024, 1, 1)
+    while day <= date(2026, 12, 31):
+        assert table.lookup(day) == reference_day(day), day
+        day += timedelta(days=1)
+
+
+def test_lookup_outside_range(table):
+    assert table.lookup(date(2030, 12, 25)) == reference_day(date(2030, 12, 25))
+
+
+def test_api_uses_etl_calendar_rules():
+    """L'API lit les règles du module de l'ETL (copié dans l'image au build), sans copie dans le dépôt."""
+    from app import calendar_features
+    from src.pipeline.weather.utils import calendar_sweden
+    source = calendar_features.build_calendar_table.__code__.co_filename
+    assert Path(source).resolve() == Path(calendar_sweden.__file__).resolve()
+
+
+def test_get_calendar_features_uses_requested_day_of_week():
+    # Le 25 décembre est férié et en vacances scolaires ; le weekend suit le day_of_week fourni
+    feats = get_calendar_features(12, 25, 5)
+    assert feats == {"est_weekend": 1, "est_jour_ferie": 1, "vacances_scolaires": 1}
+    assert get_calendar_features(12, 25, 2)["est_weekend"] == 0
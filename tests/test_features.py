@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from app.features import FeatureBuilder
+from tests.conftest import MODEL_FEATURES, reference_frame
+
+
+@pytest.fixture
+def builder():
+    return FeatureBuilder(MODEL_FEATURES)
+
+
+def test_build_row_matches_training_preprocessing(builder, sample_features):
+    """La ligne construite doit être identique au preprocessing de train_model.py."""
+    row = builder.build_row(sample_features)
+
+    assert row.shape == (1, len(MODEL_FEATURES))
+    assert row.dtype == np.float64
+    np.testing.assert_allclose(row, reference_frame(sample_features).to_numpy(dtype=np.float64))
+
+
+def test_build_row_one_hot_slots(builder, sample_features):
+    """direction_id=0 et un weather_code inconnu ne doivent activer aucune colonne One-Hot."""
+    row = builder.build_row({**sample_features, "direction_id": 0, "weather_code": 99})[0]
+
+    assert row[builder.index["direction_id_1"]] == 0
+    assert all(row[builder.index[c]] == 0 for c in MODEL_FEATURES if c.startswith("weather_code_"))
+
+    row = builder.build_row({**sample_features, "weather_code": 3.0})[0]
+    assert row[builder.index["weather_code_3"]] == 1
+
+
+def test_build_matrix_matches_build_row(builder, sample_features):
+    rows = [
+        {**sample_features, "hour": h, "direction_id": h % 2, "weather_code": code}
+        for h, code in zip(range(0, 24, 4), [1, 2, 3, 61, 71, 0])
+    ]
+    X = builder.build_matrix(rows)
+    expected = np.vstack([builder.build_row(r) for r in rows])
+
+    np.testing.assert_allclose(X, expected)
+
+
+def test_missing_features_default_to_zero(builder):
+    """Les features absentes valent 0, comme les colonnes ajoutées à 0 avant la sélection."""
+    np.testing.assert_array_equal(builder.build_row({}), np.zeros((1, len(MODEL_FEATURES))))
+    np.testing.assert_array_equal(builder.build_matrix([{}, {}]), np.zeros((2, len(MODEL_FEATURES))))
+
+
+def test_build_columns_matches_build_matrix(builder, sample_features):
+    """Le lot en colonnes (tableaux NumPy) donne la même matrice que le lot de dictionnaires."""
+    rows = [
+        {**sample_features, "hour": h, "direction_id": h % 2, "weather_code": code}
+        for h, code in zip(range(0, 24, 4), [1, 2, 3, 61, 71.0, 0])
+    ]
+    columns = {name: np.array([r[name] for r in rows]) for name in sample_features}
+    X = builder.build_columns(columns, len(rows))
+
+    np.testing.assert_allclose(X, builder.build_matrix(rows))
+    np.testing.assert_array_equal(builder.build_columns({}, 2), np.zeros((2, len(MODEL_FEATURES))))
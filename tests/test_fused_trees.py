@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.fused_trees import FusedQuantileEnsemble, QUANTILE_NAMES
+from tests.conftest import MODEL_FEATURES
+
+
+@pytest.fixture(scope="module")
+def batch():
+    rng = np.random.default_rng(7)
+    X = rng.normal(size=(2500, len(MODEL_FEATURES)))
+    X[:, MODEL_FEATURES.index("direction_id_1")] = rng.integers(0, 2, size=2500)
+    return X
+
+
+def test_parity_with_sklearn(quantile_models, batch):
+    """Le moteur aplati doit reproduire les prédictions sklearn de chaque quantile."""
+    engine = FusedQuantileEnsemble.from_models(quantile_models)
+    preds = engine.predict(batch)
+
+    assert preds.shape == (len(batch), len(QUANTILE_NAMES))
+    df = pd.DataFrame(batch, columns=MODEL_FEATURES)
+    for j, name in enumerate(QUANTILE_NAMES):
+        np.testing.assert_allclose(preds[:, j], quantile_models[name].predict(df), rtol=1e-9, atol=1e-9)
+
+
+def test_flattened_layout(quantile_models):
+    engine = FusedQuantileEnsemble.from_models(quantile_models)
+    n_trees = sum(len(quantile_models[name].estimators_) for name in QUANTILE_NAMES)
+    n_nodes = sum(e.tree_.node_count for name in QUANTILE_NAMES for e in quantile_models[name].estimators_[:, 0])
+
+    assert engine.n_trees == n_trees
+    for arr in (engine.feature, engine.threshold, engine.left, engine.right, engine.value):
+        assert arr.shape == (n_nodes,)
+        assert arr.flags["C_CONTIGUOUS"]
+    assert list(engine.tree_offsets) == [0, 20, 40, 60]
+
+
+def test_single_row(quantile_models, batch):
+    engine = FusedQuantileEnsemble.from_models(quantile_models)
+    np.testing.assert_allclose(engine.predict(batch[0]), engine.predict(batch[:1]))
+
+
+def test_save_and_mmap_load(quantile_models, batch, tmp_path):
+    """Le répertoire exporté est rechargé en mémoire projetée, avec des prédictions identiques."""
+    engine = FusedQuantileEnsemble.from_models(quantile_models)
+    engine.save(str(tmp_path), version="v1")
+
+    loaded = FusedQuantileEnsemble.load(str(tmp_path), mmap_mode="r")
+    assert isinstance(loaded.threshold, np.memmap)
+    assert not loaded.children.flags["WRITEABLE"]
+    assert list(loaded.feature_names) == MODEL_FEATURES
+    np.testing.assert_array_equal(loaded.predict(batch), engine.predict(batch))
+
+
+def test_reexport_keeps_mapped_files(quantile_models, batch, tmp_path):
+    """Réexporter au même chemin ne réécrit pas les .npy projetés par un worker déjà chargé."""
+    engine = FusedQuantileEnsemble.from_models(quantile_models)
+    export = tmp_path / "fused"
+    engine.save(str(export), version="v1")
+    mapped = FusedQuantileEnsemble.load(str(export), mmap_mode="r")
+    first = export.resolve()
+
+    engine.save(str(export), version="v2")
+    assert export.is_symlink()
+    assert export.resolve() != first
+    assert first.exists()
+    np.testing.assert_array_equal(mapped.predict(batch), engine.predict(batch))
+
+    # Seule la version précédente est conservée
+    engine.save(str(export), version="v3")
+    assert not first.exists()
+    assert len([p for p in tmp_path.iterdir() if p.name.startswith(".fused.v-")]) == 2
+
+
+def test_load_reads_a_single_export(quantile_models, batch, tmp_path, monkeypatch):
+    """Un réexport pendant le chargement ne mélange pas meta.json et tableaux de deux exports."""
+    from app import fused_trees
+
+    engine = FusedQuantileEnsemble.from_models(quantile_models)
+    other = FusedQuantileEnsemble.from_models(quantile_models)
+    other.value = other.value * 2
+    export = tmp_path / "fused"
+    engine.save(str(export), version="v1")
+
+    read_meta = fused_trees.read_meta
+
+    def read_meta_then_reexport(directory):
+        meta = read_meta(directory)
+        other.save(str(export), version="v2")
+        return meta
+
+    monkeypatch.setattr(fused_trees, "read_meta", read_meta_then_reexport)
+    loaded = FusedQuantileEnsemble.load(str(export), mmap_mode="r")
+    np.testing.assert_array_equal(loaded.predict(batch), engine.predict(batch))
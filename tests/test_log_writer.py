@@ -0,0 +1,106 @@
+import asyncio
+
+from app.data_structure import PredictionLog
+from app.log_writer import PredictionLogWriter
+from tests.conftest import TestingSessionLocal
+
+
+def make_row(i):
+    return {
+        "bus_nbr": "541", "direction_id": 1, "stop_sequence": i, "month": 1, "day": 8,
+        "hour": 20, "day_of_week": 4, "temperature_2m": -2.0,
+        "prediction_P50": 10.0, "prediction_P80": 20.0, "prediction_P90": 30.0,
+        "weather_degraded": False,  # clé inconnue de la table : ignorée
+    }
+
+
+def test_flush_writes_in_batches(db_session):
+    writer = PredictionLogWriter(TestingSessionLocal, max_queue=100, batch_size=4, flush_interval=60)
+    assert writer.submit([make_row(i) for i in range(10)])
+
+    assert writer.flush() == 10
+    assert db_session.query(PredictionLog).count() == 10
+    assert writer.stats()["queued"] == 0
+    assert writer.stats()["written"] == 10
+
+
+def test_overflow_is_dropped_and_counted(db_session):
+    writer = PredictionLogWriter(TestingSessionLocal, max_queue=5, batch_size=5, flush_interval=60)
+    assert writer.submit([make_row(i) for i in range(4)])
+    assert not writer.submit([make_row(i) for i in range(2)])
+
+    assert writer.stats()["dropped"] == 2
+    assert writer.flush() == 4
+
+
+def test_failed_batches_are_counted():
+    class BrokenSession:
+        def execute(self, *args):
+            raise RuntimeError("Neon indisponible")
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            pass
+
+    writer = PredictionLogWriter(BrokenSession, max_queue=10, batch_size=10, flush_interval=60)
+    writer.submit([make_row(1)])
+
+    assert writer.flush() == 0
+    assert writer.stats()["failed"] == 1
+
+
+def test_background_task_flushes_and_stop_drains(db_session):
+    writer = PredictionLogWriter(TestingSessionLocal, max_queue=100, batch_size=3, flush_interval=60)
+
+    async def run():
+        writer.start()
+        writer.submit([make_row(i) for i in range(3)])  # batch_size atteint : réveil immédiat
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if writer.stats()["written"] == 3:
+                break
+        written_by_task = writer.stats()["written"]
+        writer.submit([make_row(9)])
+        await writer.stop()
+        return written_by_task
+
+    assert asyncio.run(run()) == 3
+    assert db_session.query(PredictionLog).count() == 4
+
+
+class FakeAsyncSession:
+    """Session asynchrone minimale adossée à la base de test (le pilote asyncpg n'est pas requis)."""
+
+    def __init__(self):
+        self.db = TestingSessionLocal()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.db.close()
+
+    async def execute(self, statement, params):
+        return self.db.execute(statement, params)
+
+    async def commit(self):
+        self.db.commit()
+
+    async def rollback(self):
+        self.db.rollback()
+
+
+def test_background_task_uses_async_sessions(db_session):
+    writer = PredictionLogWriter(TestingSessionLocal, max_queue=100, batch_size=4, flush_interval=60,
+                                 async_session_factory=FakeAsyncSession)
+
+    async def run():
+        writer.start()
+        writer.submit([make_row(i) for i in range(6)])
+        await writer.stop()
+
+    asyncio.run(run())
+    assert db_session.query(PredictionLog).count() == 6
+    assert writer.stats()["written"] == 6
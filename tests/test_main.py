@@ -1,3 +1,5 @@
+import json
+import os
 import pytest
 from unittest.mock import patch, MagicMock
 from fastapi.testclient import TestClient
@@ -151,8 +153,10 @@ def test_predict_saves_log_to_db(mock_calendar, mock_weather, mock_predict, clie
     response = client.post("/predict", json=payload)
     assert response.status_code == 200
     
-    # Vérification DB
+    # Vérification DB (après vidage de la file d'écriture)
     from app.data_structure import PredictionLog
+    from app.log_writer import log_writer
+    log_writer.flush()
     log = db_session.query(PredictionLog).order_by(PredictionLog.id.desc()).first()
     
     assert log is not None
@@ -184,3 +188,406 @@ def test_predict_weather_api_failure(mock_calendar, mock_weather, client):
     response = client.post("/predict", json=payload)
     assert response.status_code == 503
     assert "Service Unavailable" in response.json()["detail"]
+
+@patch("app.main.model_instance.predict_batch")
+@patch("app.main.get_weather_features")
+@patch("app.main.get_calendar_features")
+def test_predict_batch_success(mock_calendar, mock_weather, mock_predict_batch, client, db_session):
+    """
+    Teste la prédiction par lot : un seul appel au modèle pour tout le lot,
+    et une seule récupération météo par (mois, jour, heure) distincts.
+    """
+    mock_calendar.return_value = {"est_weekend": 0}
+    mock_weather.return_value = {"temperature_2m": 8.0}
+    mock_predict_batch.side_effect = lambda rows: [
+        {"prediction_P50": 10.0 * r["stop_sequence"], "prediction_P80": 20.0, "prediction_P90": 30.0}
+        for r in rows
+    ]
+
+    inputs = [
+        {"direction_id": 1, "month": 6, "day": 20, "hour": 14, "day_of_week": 4, "stop_sequence": s}
+        for s in range(1, 4)
+    ]
+    inputs.append({"direction_id": 0, "month": 6, "day": 20, "hour": 15, "day_of_week": 4})
+
+    response = client.post("/predict/batch", json={"inputs": inputs})
+
+    assert response.status_code == 200
+    predictions = response.json()["predictions"]
+    assert [p["prediction_P50"] for p in predictions] == [10.0, 20.0, 30.0, 10.0]
+
+    mock_predict_batch.assert_called_once()
+    assert mock_weather.call_count == 2
+    assert mock_calendar.call_count == 1
+
+    from app.data_structure import PredictionLog
+    from app.log_writer import log_writer
+    log_writer.flush()
+    assert db_session.query(PredictionLog).count() == 4
+
+def test_predict_batch_empty_rejected(client):
+    """Un lot vide est refusé par la validation."""
+    response = client.post("/predict/batch", json={"inputs": []})
+    assert response.status_code == 422
+
+@patch("app.main.model_instance.predict_batch")
+@patch("app.main.get_weather_features")
+@patch("app.main.get_calendar_features")
+def test_predict_route(mock_calendar, mock_weather, mock_predict_batch, client, db_session):
+    """Un trajet complet : calendrier et météo une seule fois, un seul appel au modèle."""
+    mock_calendar.return_value = {"est_weekend": 0}
+    mock_weather.return_value = {"temperature_2m": 8.0}
+    mock_predict_batch.side_effect = lambda rows: [
+        {"prediction_P50": 10.0 * r["stop_sequence"], "prediction_P80": 20.0, "prediction_P90": 30.0}
+        for r in rows
+    ]
+    payload = {"direction_id": 1, "month": 6, "day": 20, "hour": 14, "day_of_week": 4, "stop_sequences": [1, 2, 5]}
+
+    response = client.post("/predict/route", json=payload)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["bus_nbr"] == "541"
+    assert [(s["stop_sequence"], s["prediction_P50"]) for s in data["stops"]] == [(1, 10.0), (2, 20.0), (5, 50.0)]
+    mock_predict_batch.assert_called_once()
+    mock_weather.assert_called_once_with(6, 20, 14)
+    mock_calendar.assert_called_once()
+
+    from app.data_structure import PredictionLog
+    from app.log_writer import log_writer
+    log_writer.flush()
+    assert db_session.query(PredictionLog).count() == 3
+
+    # Flux NDJSON : un arrêt par ligne
+    response = client.post("/predict/route", json=payload, headers={"Accept": "application/x-ndjson"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["stop_sequence"] for line in lines] == [1, 2, 5]
+
+@patch("app.main.model_instance.predict_batch")
+@patch("app.main.get_weather_features")
+@patch("app.main.get_calendar_features")
+def test_predict_route_defaults_to_all_stops(mock_calendar, mock_weather, mock_predict_batch, client):
+    from app.main import PREDICTION_GRID_MAX_STOP
+    mock_calendar.return_value = {}
+    mock_weather.return_value = {}
+    mock_predict_batch.side_effect = lambda rows: [
+        {"prediction_P50": 1.0, "prediction_P80": 2.0, "prediction_P90": 3.0} for _ in rows
+    ]
+
+    response = client.post("/predict/route", json={"direction_id": 0, "month": 6, "day": 20, "hour": 8, "day_of_week": 4})
+    assert len(response.json()["stops"]) == PREDICTION_GRID_MAX_STOP
+
+@patch("app.main.model_instance.predict")
+@patch("app.main.get_weather_features")
+def test_predict_weather_degraded_flag(mock_weather, mock_predict, client, db_session):
+    """Une météo de repli est signalée dans la réponse et n'empêche pas le log."""
+    mock_weather.return_value = {"temperature_2m": 2.0, "weather_degraded": True}
+    mock_predict.return_value = {"prediction_P50": 1.0, "prediction_P80": 2.0, "prediction_P90": 3.0}
+
+    response = client.post("/predict", json={"direction_id": 1, "month": 6, "day": 20, "hour": 14, "day_of_week": 4})
+
+    assert response.status_code == 200
+    assert response.json()["weather_degraded"] is True
+    assert "weather_degraded" not in mock_predict.call_args[0][0]
+
+    from app.data_structure import PredictionLog
+    from app.log_writer import log_writer
+    log_writer.flush()
+    assert db_session.query(PredictionLog).count() == 1
+
+def test_stats(client):
+    """Les statistiques internes exposent notamment le taux de succès du cache de prédictions."""
+    response = client.get("/stats")
+    assert response.status_code == 200
+    data = response.json()
+    assert "hit_ratio" in data["prediction_cache"]
+    assert "coalesced" in data["weather_single_flight"]
+    assert "dropped" in data["prediction_logs"]
+
+def test_admin_reload_swaps_bundle(client, quantile_models, tmp_path, monkeypatch):
+    """Le rechargement charge le nouveau pack, le teste puis le met en service."""
+    import joblib
+    from app.main import model_instance
+
+    path = tmp_path / "50_80_90_models_quantiles.pkl"
+    joblib.dump(quantile_models, path)
+    monkeypatch.setenv("MODEL_PATH", str(path))
+    previous = model_instance.bundle
+
+    monkeypatch.setattr("app.main.ADMIN_TOKEN", "secret")
+
+    try:
+        assert model_instance.needs_reload()
+        response = client.post("/admin/reload", headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 200
+        version = response.json()["version"]
+        assert client.get("/model").json()["version"] == version
+        assert not model_instance.needs_reload()
+    finally:
+        model_instance.bundle = previous
+
+def test_admin_reload_failure_keeps_bundle(client, tmp_path, monkeypatch):
+    from app.main import model_instance
+
+    path = tmp_path / "broken.pkl"
+    path.write_bytes(b"pas un pickle")
+    monkeypatch.setenv("MODEL_PATH", str(path))
+    monkeypatch.setattr("app.main.ADMIN_TOKEN", "secret")
+    previous = model_instance.bundle
+
+    response = client.post("/admin/reload", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 500
+    assert model_instance.bundle is previous
+
+def test_admin_reload_requires_token(client, monkeypatch):
+    monkeypatch.setattr("app.main.ADMIN_TOKEN", "secret")
+    assert client.post("/admin/reload").status_code == 403
+    assert client.post("/admin/reload", headers={"X-Admin-Token": "autre"}).status_code == 403
+
+def test_admin_reload_disabled_without_token(client, monkeypatch):
+    """Sans ADMIN_TOKEN configuré, la route est refusée à tous."""
+    monkeypatch.setattr("app.main.ADMIN_TOKEN", None)
+    assert client.post("/admin/reload").status_code == 403
+    assert client.post("/admin/reload", headers={"X-Admin-Token": ""}).status_code == 403
+
+@patch("app.main.model_instance.predict")
+@patch("app.main.get_weather_features")
+def test_metrics(mock_weather, mock_predict, client):
+    """/metrics expose les latences par étape et les compteurs internes au format Prometheus."""
+    mock_weather.return_value = {"temperature_2m": 8.0}
+    mock_predict.return_value = {"prediction_P50": 1.0, "prediction_P80": 2.0, "prediction_P90": 3.0}
+    client.post("/predict", json={"direction_id": 1, "month": 6, "day": 20, "hour": 14, "day_of_week": 4})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert "# TYPE delay_forecast_stage_seconds histogram" in text
+    for stage in ("calendar", "weather", "predict", "log_submit"):
+        assert f'delay_forecast_stage_seconds_count{{stage="{stage}"}}' in text
+    assert 'delay_forecast_stage_seconds_bucket{stage="weather",le="+Inf"}' in text
+    assert 'delay_forecast_request_seconds_count{path="/predict",method="POST",status="200"}' in text
+    assert 'delay_forecast_requests_in_flight{path="/metrics"} 1' in text
+    assert "delay_forecast_model_info{" in text
+    assert 'delay_forecast_cache_hits_total{cache="prediction"}' in text
+
+@patch("app.main.model_instance.predict")
+@patch("app.main.get_weather_features")
+def test_predict_rate_limited_per_client(mock_weather, mock_predict, client, monkeypatch):
+    """Au-delà de sa rafale, un client reçoit un 429 avec Retry-After ; les autres clients passent."""
+    from app.admission import TokenBucketLimiter
+    monkeypatch.setattr("app.admission.rate_limiter", TokenBucketLimiter(rate=0.01, burst=2, max_clients=100))
+    mock_weather.return_value = {"temperature_2m": 8.0}
+    mock_predict.return_value = {"prediction_P50": 1.0, "prediction_P80": 2.0, "prediction_P90": 3.0}
+    payload = {"direction_id": 1, "month": 6, "day": 20, "hour": 14, "day_of_week": 4}
+
+    # Par défaut, le seau dépend de l'adresse IP : changer d'en-tête à chaque requête ne contourne pas la limite
+    statuses = [client.post("/predict", json=payload, headers={"X-Client-Id": str(i)}).status_code for i in range(3)]
+    assert statuses == [200, 200, 429]
+
+    response = client.post("/predict", json=payload)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+    # En-tête posé par un proxy de confiance, sur option
+    monkeypatch.setattr("app.admission.RATE_LIMIT_CLIENT_HEADER", "X-Real-IP")
+    assert client.post("/predict", json=payload, headers={"X-Real-IP": "10.0.0.2"}).status_code == 200
+
+def test_predict_saturated_returns_503(client, monkeypatch):
+    """File d'admission pleine : refus immédiat en 503 avec Retry-After."""
+    from app.admission import AdmissionController, AdmissionRejected
+
+    class Saturated(AdmissionController):
+        async def acquire(self):
+            self.rejected["queue_full"] += 1
+            raise AdmissionRejected("queue_full", self.retry_after)
+
+    monkeypatch.setattr("app.admission.admission_controller", Saturated(1, 0, 1, 2))
+    response = client.post("/predict", json={"direction_id": 1, "month": 6, "day": 20, "hour": 14, "day_of_week": 4})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "2"
+
+COLUMNAR_PAYLOAD = {
+    "direction_id": [1, 1, 0, 1],
+    "month": [6, 6, 6, 6],
+    "day": [20, 20, 20, 21],
+    "hour": [14, 14, 15, 8],
+    "day_of_week": [4, 4, 4, 5],
+    "stop_sequence": [1, 2, 3, 4],
+}
+
+@pytest.fixture
+def loaded_model(quantile_models):
+    """Pack de test mis en service le temps d'un test."""
+    from app.main import model_instance
+    from app.model import ModelBundle
+    previous = model_instance.bundle
+    model_instance.swap(ModelBundle(quantile_models))
+    yield model_instance
+    model_instance.swap(previous)
+
+@patch("app.main.get_weather_features")
+def test_predict_columnar_matches_batch(mock_weather, client, loaded_model):
+    """Les prédictions en colonnes sont celles de /predict/batch, météo récupérée une fois par heure distincte."""
+    mock_weather.return_value = {"temperature_2m": 8.0, "weather_code": 3}
+
+    response = client.post("/predict/columnar", json=COLUMNAR_PAYLOAD)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/json")
+    data = response.json()
+    assert mock_weather.call_count == 3
+
+    inputs = [dict(zip(COLUMNAR_PAYLOAD, values)) for values in zip(*COLUMNAR_PAYLOAD.values())]
+    expected = client.post("/predict/batch", json={"inputs": inputs}).json()["predictions"]
+    for key in ("prediction_P50", "prediction_P80", "prediction_P90"):
+        assert data[key] == pytest.approx([p[key] for p in expected])
+    assert data["weather_degraded"] == [False] * 4
+
+@pytest.mark.parametrize("fmt", ["application/vnd.apache.arrow.stream", "application/vnd.apache.parquet"])
+@patch("app.main.get_weather_features")
+def test_predict_columnar_arrow_and_parquet(mock_weather, fmt, client, loaded_model):
+    """Corps Arrow IPC ou Parquet : réponse dans le même format."""
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+    import io
+
+    mock_weather.return_value = {"temperature_2m": 8.0, "weather_degraded": True}
+    table = pa.table({**COLUMNAR_PAYLOAD, "bus_nbr": ["541"] * 4})
+    sink = io.BytesIO()
+    if fmt.endswith("arrow.stream"):
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, sink)
+
+    response = client.post("/predict/columnar", content=sink.getvalue(), headers={"Content-Type": fmt})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(fmt)
+
+    body = pa.BufferReader(response.content)
+    result = pa.ipc.open_stream(body).read_all() if fmt.endswith("arrow.stream") else pq.read_table(body)
+    assert result.num_rows == 4
+    assert result.column_names == ["prediction_P50", "prediction_P80", "prediction_P90", "weather_degraded"]
+    assert result.column("weather_degraded").to_pylist() == [True] * 4
+
+@pytest.mark.parametrize("payload, message", [
+    ({**COLUMNAR_PAYLOAD, "hour": [14, 14, 15]}, "même longueur"),
+    ({**COLUMNAR_PAYLOAD, "month": [6, 13, 6, 6]}, "month[1]"),
+    ({**COLUMNAR_PAYLOAD, "hour": [14, 14.5, 15, 8]}, "hour[1]"),
+    ({**COLUMNAR_PAYLOAD, "day": [20, 20, 31, 21]}, "ligne 2"),
+    ({k: v for k, v in COLUMNAR_PAYLOAD.items() if k != "hour"}, "hour"),
+])
+def test_predict_columnar_validation(payload, message, client):
+    response = client.post("/predict/columnar", json=payload)
+    assert response.status_code == 422
+    assert message in response.json()["detail"]
+
+def test_predict_columnar_unsupported_format(client):
+    response = client.post("/predict/columnar", content=b"a,b", headers={"Content-Type": "text/csv"})
+    assert response.status_code == 415
+
+@patch("app.main.model_instance.predict")
+@patch("app.main.get_weather_features")
+def test_predict_feeds_shadow_without_changing_response(mock_weather, mock_predict, client, quantile_models, monkeypatch):
+    """La réponse vient du pack principal ; la ligne est seulement déposée pour l'évaluation fantôme."""
+    from app.main import shadow_evaluator
+    from app.model import ModelBundle
+    monkeypatch.setattr(shadow_evaluator, "bundle", ModelBundle(quantile_models, version="candidat"))
+    mock_weather.return_value = {"temperature_2m": 8.0}
+    mock_predict.return_value = {"prediction_P50": 1.0, "prediction_P80": 2.0, "prediction_P90": 3.0}
+
+    response = client.post("/predict", json={"direction_id": 1, "month": 6, "day": 20, "hour": 14, "day_of_week": 4})
+
+    assert response.json()["prediction_P50"] == 1.0
+    assert client.get("/stats").json()["shadow"]["queued"] == 1
+    shadow_evaluator._queue.clear()
+
+@patch("app.main.get_weather_range")
+def test_predict_horizon_across_midnight(mock_range, client, loaded_model):
+    """Heures, jours et jours de la semaine suivent le passage de minuit (et de fin de mois)."""
+    weather = {"temperature_2m": 8.0, "weather_code": 3}
+    mock_range.side_effect = lambda start, n: [dict(weather) for _ in range(n)]
+
+    with patch("app.main.log_writer.submit") as mock_submit:
+        response = client.post("/predict/horizon", json={
+            "direction_id": 1, "month": 6, "day": 30, "hour": 22, "day_of_week": 1, "stop_sequence": 5, "hours": 4,
+        })
+
+    assert response.status_code == 200
+    data = response.json()
+    mock_range.assert_called_once()
+    # Colonnes Integer de prediction_logs : pas de float dans les lignes journalisées
+    logged = mock_submit.call_args.args[0]
+    assert [row["day_of_week"] for row in logged] == [1, 1, 2, 2]
+    for name in ("weather_code", "est_weekend", "est_jour_ferie", "hour", "stop_sequence"):
+        assert all(type(row[name]) is int for row in logged), name
+    hours = data["predictions"]
+    assert [(h["month"], h["day"], h["hour"], h["day_of_week"]) for h in hours] == [
+        (6, 30, 22, 1), (6, 30, 23, 1), (7, 1, 0, 2), (7, 1, 1, 2),
+    ]
+
+    # Mêmes prédictions que les lignes équivalentes de /predict/batch
+    with patch("app.main.get_weather_features", return_value=dict(weather)):
+        inputs = [{k: h[k] for k in ("month", "day", "hour", "day_of_week")} | {"direction_id": 1, "stop_sequence": 5}
+                  for h in hours]
+        expected = client.post("/predict/batch", json={"inputs": inputs}).json()["predictions"]
+    for h, e in zip(hours, expected):
+        assert h["prediction_P50"] == pytest.approx(e["prediction_P50"])
+        assert h["prediction_P90"] == pytest.approx(e["prediction_P90"])
+
+def test_predict_horizon_validation(client):
+    base = {"direction_id": 1, "month": 6, "day": 20, "hour": 8, "day_of_week": 4}
+    assert client.post("/predict/horizon", json={**base, "hours": 0}).status_code == 422
+    assert client.post("/predict/horizon", json={**base, "hours": 49}).status_code == 422
+    assert client.post("/predict/horizon", json={**base, "day": 31}).status_code == 422
+
+def startup_with_dotenv(tmp_path, settings: dict, expression: str) -> str:
+    """
+    Importe app.main dans un nouveau processus dont les réglages ne sont que dans
+    un .env (répertoire courant) et renvoie la valeur de `expression` après l'import.
+    """
+    import subprocess
+    import sys
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../services/api"))
+    dotenv = {"DATABASE_URL": f"sqlite:///{tmp_path / 'startup.db'}", **settings}
+    (tmp_path / ".env").write_text("".join(f"{k}={v}\n" for k, v in dotenv.items()))
+    env = {k: v for k, v in os.environ.items() if k not in dotenv}
+    env["PYTHONPATH"] = api_dir
+    result = subprocess.run(
+        [sys.executable, "-c", f"import app.main as main; print({expression})"],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip().splitlines()[-1]
+
+def test_dotenv_model_path_loaded_at_startup(quantile_models, tmp_path):
+    """Un MODEL_PATH du .env désigne le pack chargé au démarrage (et non après le premier rechargement)."""
+    import joblib
+    path = tmp_path / "env_models.pkl"
+    joblib.dump(quantile_models, path)
+
+    assert startup_with_dotenv(tmp_path, {"MODEL_PATH": path}, "main.model_instance.bundle.path") == str(path)
+
+def test_dotenv_prediction_cache_settings(tmp_path):
+    """Taille et TTL du cache de prédictions lues dans le .env."""
+    out = startup_with_dotenv(tmp_path, {"PREDICTION_CACHE_SIZE": 7, "PREDICTION_CACHE_TTL": 42},
+                              "(main.model_instance.prediction_cache.maxsize, main.model_instance.prediction_cache.ttl)")
+    assert out == "(7, 42.0)"
+
+def test_dotenv_model_lines_dir(quantile_models, tmp_path):
+    """Le registre de packs par ligne est activé par un MODEL_LINES_DIR du .env."""
+    import joblib
+    lines_dir = tmp_path / "lines"
+    lines_dir.mkdir()
+    joblib.dump(quantile_models, lines_dir / "541.pkl")
+
+    out = startup_with_dotenv(tmp_path, {"MODEL_LINES_DIR": lines_dir, "MODEL_REGISTRY_MAX_MB": 3},
+                              "(lambda s: (s['enabled'], s['available'], s['max_bytes']))(main.model_instance.registry.stats())")
+    assert out == f"(True, 1, {3 * 1024 * 1024.0})"
+
+def test_dotenv_fused_max_batch(tmp_path):
+    """Seuil du moteur aplati lu dans le .env."""
+    assert startup_with_dotenv(tmp_path, {"FUSED_MAX_BATCH": 7}, "__import__('app.model').model.FUSED_MAX_BATCH") == "7"
@@ -0,0 +1,31 @@
+from app.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_histogram_buckets_are_cumulative():
+    hist = Histogram("latence_seconds", "Latence.", ("stage",), buckets=[0.1, 1.0])
+    for value in (0.05, 0.5, 0.5, 2.0):
+        hist.observe(value, stage="meteo")
+
+    lines = hist.render()
+    assert 'latence_seconds_bucket{stage="meteo",le="0.1"} 1' in lines
+    assert 'latence_seconds_bucket{stage="meteo",le="1"} 3' in lines
+    assert 'latence_seconds_bucket{stage="meteo",le="+Inf"} 4' in lines
+    assert 'latence_seconds_sum{stage="meteo"} 3.05' in lines
+    assert 'latence_seconds_count{stage="meteo"} 4' in lines
+
+
+def test_registry_renders_metrics_and_collectors():
+    registry = Registry()
+    counter = registry.register(Counter("appels_total", "Appels.", ("source",)))
+    gauge = registry.register(Gauge("en_cours", "En cours."))
+    counter.inc(source='a"b')
+    counter.inc(2, source='a"b')
+    gauge.inc()
+    gauge.dec()
+    registry.add_collector(lambda: [("version_info", "gauge", "Version.", [({"version": "v1"}, 1)])])
+
+    text = registry.render()
+    assert "# TYPE appels_total counter" in text
+    assert 'appels_total{source="a\\"b"} 3' in text
+    assert "en_cours 0" in text
+    assert 'version_info{version="v1"} 1' in text
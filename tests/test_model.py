@@ -0,0 +1,179 @@
+from unittest.mock import patch
+
+import pytest
+
+from app.model import MLModel
+from tests.conftest import reference_frame
+
+
+@pytest.fixture
+def ml_model(quantile_models):
+    return MLModel(models=quantile_models)
+
+
+def test_predict_matches_training_preprocessing(ml_model, quantile_models, sample_features):
+    """La prédiction unitaire doit correspondre aux modèles appliqués sur la matrice d'entraînement."""
+    result = ml_model.predict(dict(sample_features))
+    expected = reference_frame(sample_features)
+
+    assert result["prediction_P50"] == pytest.approx(quantile_models["P50_Median"].predict(expected)[0])
+    assert result["prediction_P80"] == pytest.approx(quantile_models["P80_Pessimist"].predict(expected)[0])
+    assert result["prediction_P90"] == pytest.approx(quantile_models["P90_Extreme"].predict(expected)[0])
+
+
+def test_predict_batch_matches_unit_predictions(ml_model, sample_features):
+    """Le chemin vectorisé doit donner les mêmes résultats que des appels unitaires."""
+    rows = []
+    for hour, direction, code in [(0, 0, 3), (8, 1, 71), (17, 0, 2), (23, 1, 99)]:
+        rows.append({**sample_features, "hour": hour, "direction_id": direction, "weather_code": code})
+
+    batch = ml_model.predict_batch([dict(r) for r in rows])
+    unit = [ml_model.predict(dict(r)) for r in rows]
+
+    assert len(batch) == len(rows)
+    for b, u in zip(batch, unit):
+        assert b == pytest.approx(u)
+
+
+def test_predict_without_models_raises():
+    from app.model_registry import BundleRegistry
+    model = MLModel.__new__(MLModel)
+    model.bundle = None
+    model.registry = BundleRegistry(None, 0, loader=None)
+    with pytest.raises(ValueError):
+        model.predict({"hour": 1})
+    with pytest.raises(ValueError):
+        model.predict_batch([{"hour": 1}])
+
+
+def test_fused_and_sklearn_paths_agree(ml_model, sample_features, monkeypatch):
+    """Les petits lots passent par le moteur aplati, les gros par sklearn : mêmes résultats."""
+    import app.model
+
+    rows = [{**sample_features, "hour": h % 24, "stop_sequence": h} for h in range(40)]
+    monkeypatch.setattr(app.model, "FUSED_MAX_BATCH", 1000)
+    fused = ml_model.predict_batch(rows)
+    ml_model.clear_prediction_cache()
+    monkeypatch.setattr(app.model, "FUSED_MAX_BATCH", 0)
+    sklearn_preds = ml_model.predict_batch(rows)
+
+    for f, s in zip(fused, sklearn_preds):
+        assert f == pytest.approx(s, rel=1e-9)
+
+
+def test_prediction_cache(ml_model, sample_features):
+    """Un vecteur de features déjà vu est servi par le cache, sans réévaluer les arbres."""
+    first = ml_model.predict(dict(sample_features))
+    with patch.object(ml_model.engine, "predict", wraps=ml_model.engine.predict) as engine_predict:
+        assert ml_model.predict(dict(sample_features)) == first
+        engine_predict.assert_not_called()
+
+        # Lot mixte : seule la ligne inconnue est évaluée
+        other = {**sample_features, "hour": 7}
+        batch = ml_model.predict_batch([dict(sample_features), other])
+        assert batch[0] == first
+        assert engine_predict.call_count == 1
+        assert engine_predict.call_args.args[0].shape[0] == 1
+
+    stats = ml_model.prediction_cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_prediction_cache_cleared_on_new_bundle(ml_model, quantile_models, sample_features):
+    ml_model.predict(dict(sample_features))
+    assert len(ml_model.prediction_cache) == 1
+    ml_model._set_models(quantile_models)
+    assert len(ml_model.prediction_cache) == 0
+
+
+def test_mmap_bundle_matches_joblib(ml_model, quantile_models, sample_features, tmp_path):
+    """Un pack exporté (arbres projetés en mémoire, sans sklearn) prédit comme le .pkl."""
+    import joblib
+    from app.model import ModelBundle, FUSED_MAX_BATCH
+    from app.model_store import export_bundle
+
+    pkl_path = tmp_path / "models.pkl"
+    joblib.dump(quantile_models, pkl_path)
+    version = export_bundle(str(pkl_path), str(tmp_path / "fused"))
+
+    mmap_model = MLModel(models=quantile_models)
+    mmap_model.swap(ModelBundle.load(str(tmp_path / "fused")))
+    mmap_model.bundle.warmup()
+    assert mmap_model.info()["format"] == "mmap"
+    assert mmap_model.version == version
+    assert not mmap_model.needs_reload(str(tmp_path / "fused"))
+
+    # Au-delà de FUSED_MAX_BATCH, le moteur aplati reste utilisé faute de modèles sklearn
+    rows = [{**sample_features, "hour": i % 24, "direction_id": i % 2} for i in range(FUSED_MAX_BATCH + 10)]
+    expected = ml_model.predict_batch([dict(r) for r in rows])
+    for res, ref in zip(mmap_model.predict_batch([dict(r) for r in rows]), expected):
+        assert res == pytest.approx(ref)
+
+
+@pytest.fixture
+def line_models(quantile_models, tmp_path):
+    """Répertoire de packs par ligne : 541 (.pkl), 176 (exporté) et un cluster pour 177 et 178."""
+    import joblib
+    import json
+    from app.model_store import export_bundle
+
+    lines_dir = tmp_path / "lines"
+    lines_dir.mkdir()
+    joblib.dump(quantile_models, lines_dir / "541.pkl")
+    export_bundle(str(lines_dir / "541.pkl"), str(lines_dir / "176"))
+    joblib.dump(quantile_models, lines_dir / "nord.pkl")
+    (lines_dir / "lines.json").write_text(json.dumps({"177": "nord", "178": "nord"}))
+    return str(lines_dir)
+
+
+def test_line_bundles_loaded_on_first_use(quantile_models, line_models, sample_features):
+    model = MLModel(models=quantile_models, lines_dir=line_models)
+    registry = model.registry
+    assert registry.stats()["available"] == 3
+    assert registry.stats()["loads"] == 0
+
+    assert model.bundle_for("541") is not model.bundle
+    assert model.bundle_for("541") is model.bundle_for("541")
+    # Même pack pour les lignes d'un cluster
+    assert model.bundle_for("177") is model.bundle_for("178")
+    # Ligne sans pack dédié : pack par défaut
+    assert model.bundle_for("999") is model.bundle
+    assert model.version_for("999") == model.version
+
+    stats = registry.stats()
+    assert stats["loads"] == 2
+    assert stats["fallbacks"] == 1
+    assert model.bundle_for("176").format == "mmap"
+
+    # Même pack sous-jacent : mêmes prédictions pour toutes les lignes, lot mixte compris
+    rows = [{**sample_features, "bus_nbr": line} for line in ("541", "176", "177", "999")]
+    expected = MLModel(models=quantile_models).predict(dict(sample_features))
+    for res in model.predict_batch([dict(r) for r in rows]):
+        assert res == pytest.approx(expected)
+
+
+def test_line_bundles_evicted_under_memory_budget(quantile_models, line_models):
+    model = MLModel(models=quantile_models, lines_dir=line_models)
+    registry = model.registry
+    first = model.bundle_for("541")
+    # Budget d'un seul pack : chaque nouveau chargement évince le moins récemment utilisé
+    registry.max_bytes = first.nbytes
+
+    model.bundle_for("176")
+    assert registry.stats()["resident"] == ["176"]
+    assert model.version_for("541") is None
+    model.bundle_for("541")
+    assert registry.stats()["resident"] == ["541"]
+    assert registry.stats()["evictions"] == 2
+    assert registry.stats()["loads"] == 3
+
+
+def test_broken_line_bundle_falls_back_to_default(quantile_models, tmp_path):
+    (tmp_path / "541.pkl").write_bytes(b"pas un pickle")
+    model = MLModel(models=quantile_models, lines_dir=str(tmp_path))
+
+    assert model.bundle_for("541") is model.bundle
+    assert model.registry.stats()["failures"] == 1
+    # Le pack défaillant n'est plus retenté avant le prochain rechargement
+    assert not model.registry.needs_load("541")
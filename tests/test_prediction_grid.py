@@ -0,0 +1,66 @@
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.model import MLModel
+from app.prediction_grid import PredictionGrid
+from app.weather_store import WeatherStore, WEATHER_FEATURES
+from app.weather_utils import get_calendar_features
+
+
+@pytest.fixture
+def grid(quantile_models):
+    today = date.today()
+    store = WeatherStore()
+    df = pd.DataFrame({name: np.arange(24, dtype=float) % 5 for name in WEATHER_FEATURES})
+    df["timestamp_rounded"] = pd.date_range(datetime(today.year, today.month, today.day), periods=24, freq="h")
+    store.load_frame(df)
+
+    grid = PredictionGrid(MLModel(models=quantile_models), store, n_days=1, lines=["541"], max_stop=3)
+    grid.build(today)
+    return grid
+
+
+def live_features(grid, **overrides):
+    today = date.today()
+    features = {"bus_nbr": "541", "direction_id": 1, "stop_sequence": 2, "month": today.month,
+                "day": today.day, "hour": 17, "day_of_week": today.weekday(), **overrides}
+    features.update(get_calendar_features(features["month"], features["day"], features["day_of_week"]))
+    features.update(grid.store.lookup(datetime(today.year, today.month, today.day, features["hour"])))
+    return features
+
+
+def test_grid_matches_live_scoring(grid):
+    """Une prédiction servie par la grille est identique au calcul en direct."""
+    for hour, direction, stop in [(0, 0, 1), (17, 1, 2), (23, 1, 3)]:
+        features = live_features(grid, hour=hour, direction_id=direction, stop_sequence=stop)
+        expected = grid.model.predict(dict(features))
+        result = grid.lookup(features)
+        assert result == pytest.approx(expected)
+    assert grid.stats()["hits"] == 3
+    assert grid.stats()["hours"] == 24
+
+
+def test_grid_misses_fall_back(grid):
+    # Hors grille : arrêt, ligne, jour de semaine incohérent avec la date
+    assert grid.lookup(live_features(grid, stop_sequence=4)) is None
+    assert grid.lookup(live_features(grid, bus_nbr="999")) is None
+    assert grid.lookup(live_features(grid, day_of_week=(date.today().weekday() + 1) % 7)) is None
+    assert grid.stats()["misses"] == 3
+
+
+def test_grid_invalidated_by_new_weather_or_model(grid, quantile_models):
+    features = live_features(grid)
+    assert grid.lookup(features) is not None
+
+    bundle = grid.model.bundle
+    grid.model.swap(MLModel(models=quantile_models).bundle)
+    grid.model.bundle.version = "autre"
+    assert grid.lookup(features) is None
+
+    grid.model.swap(bundle)
+    assert grid.lookup(features) is not None
+    grid.store.load_frame(pd.DataFrame())
+    assert grid.lookup(features) is None
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from app.data_structure import ShadowPredictionLog
+from app.log_writer import PredictionLogWriter
+from app.model import MLModel, ModelBundle
+from app.shadow import ShadowEvaluator
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def shadow_writer():
+    return PredictionLogWriter(TestingSessionLocal, max_queue=100, batch_size=50, flush_interval=60,
+                               table=ShadowPredictionLog)
+
+
+def make_evaluator(quantile_models, writer, overloaded=lambda: False, max_queue=100):
+    primary = MLModel(models=quantile_models)
+    evaluator = ShadowEvaluator(primary, writer, window=0.01, max_rows=4, max_queue=max_queue, overloaded=overloaded)
+    evaluator.bundle = ModelBundle(quantile_models, version="candidat")
+    return primary, evaluator
+
+
+def test_shadow_logged_next_to_primary(quantile_models, sample_features, shadow_writer, db_session):
+    primary, evaluator = make_evaluator(quantile_models, shadow_writer)
+    rows = [{**sample_features, "stop_sequence": s} for s in range(1, 11)]
+    predictions = primary.predict_batch([dict(r) for r in rows])
+
+    evaluator.submit(rows, predictions)
+    asyncio.run(evaluator.drain())
+    shadow_writer.flush()
+
+    logs = db_session.query(ShadowPredictionLog).order_by(ShadowPredictionLog.stop_sequence).all()
+    assert len(logs) == 10
+    # Micro-lots de max_rows lignes
+    assert evaluator.stats()["batches"] == 3
+    for log, preds in zip(logs, predictions):
+        assert log.primary_version == primary.version
+        assert log.shadow_version == "candidat"
+        assert log.prediction_P50 == pytest.approx(preds["prediction_P50"])
+        # Même pack des deux côtés : mêmes prédictions
+        assert log.shadow_P50 == pytest.approx(log.prediction_P50)
+        assert log.shadow_P90 == pytest.approx(log.prediction_P90)
+
+
+def test_shadow_dropped_first_under_load(quantile_models, sample_features, shadow_writer):
+    load = {"saturated": True}
+    _, evaluator = make_evaluator(quantile_models, shadow_writer, overloaded=lambda: load["saturated"])
+    preds = {"prediction_P50": 1.0, "prediction_P80": 2.0, "prediction_P90": 3.0}
+
+    evaluator.submit([sample_features], [preds])
+    assert evaluator.stats()["queued"] == 0
+
+    # Charge apparue après le dépôt : le lot est écarté au moment de l'évaluation
+    load["saturated"] = False
+    evaluator.submit([sample_features] * 2, [preds] * 2)
+    load["saturated"] = True
+    asyncio.run(evaluator.drain())
+
+    stats = evaluator.stats()
+    assert stats["dropped_load"] == 3
+    assert stats["scored"] == 0
+    assert shadow_writer.stats()["queued"] == 0
+
+
+def test_shadow_queue_bounded(quantile_models, sample_features, shadow_writer):
+    _, evaluator = make_evaluator(quantile_models, shadow_writer, max_queue=3)
+    preds = {"prediction_P50": 1.0, "prediction_P80": 2.0, "prediction_P90": 3.0}
+
+    evaluator.submit([sample_features] * 2, [preds] * 2)
+    evaluator.submit([sample_features] * 2, [preds] * 2)
+
+    assert evaluator.stats()["queued"] == 2
+    assert evaluator.stats()["dropped_full"] == 2
+
+
+def test_shadow_disabled_without_bundle(sample_features, shadow_writer):
+    evaluator = ShadowEvaluator(None, shadow_writer, window=0.01, max_rows=4, max_queue=10)
+    evaluator.submit([sample_features], [{}])
+    assert evaluator.stats()["queued"] == 0
+    assert not evaluator.stats()["enabled"]
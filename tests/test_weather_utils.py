@@ -0,0 +1,412 @@
+import asyncio
+from datetime import datetime
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+import httpx
+from sqlalchemy import create_engine
+
+from app import weather_utils
+from app.cache import TTLCache
+from app.circuit_breaker import CircuitBreaker
+from app.climatology import climatology
+from app.weather_utils import WeatherClient
+from app.weather_store import WeatherStore, weather_store, WEATHER_FEATURES
+
+
+def fake_day(date_str: str) -> dict:
+    """Réponse Open-Meteo d'une journée (24 valeurs horaires)."""
+    return {
+        "hourly": {
+            "temperature_2m": [float(h) - 5 for h in range(24)],
+            "precipitation": [0.0] * 24,
+            "rain": [0.0] * 24,
+            "snowfall": [0.5] * 24,
+            "weather_code": [71] * 24,
+            "cloud_cover": [80] * 24,
+            "dew_point_2m": [-6.0] * 24,
+            "wind_speed_10m": [10.0] * 24,
+            "wind_gusts_10m": [20.0] * 24,
+            "wind_direction_10m": [180] * 24,
+        },
+        "daily": {"sunrise": [f"{date_str}T08:00"], "sunset": [f"{date_str}T16:00"]},
+    }
+
+
+@pytest.fixture(autouse=True)
+def empty_weather_cache():
+    weather_utils.weather_cache.clear()
+    weather_utils.weather_last_good.clear()
+    weather_utils.weather_breaker.reset()
+    yield
+    weather_utils.weather_cache.clear()
+    weather_utils.weather_last_good.clear()
+    weather_utils.weather_breaker.reset()
+
+
+def test_ttl_cache_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" devient la plus récemment utilisée
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expiration():
+    cache = TTLCache(maxsize=10, ttl=60)
+    with patch("app.cache.time.monotonic", return_value=1000.0):
+        cache.set("k", "v", ttl=5)
+    with patch("app.cache.time.monotonic", return_value=1004.0):
+        assert cache.get("k") == "v"
+    with patch("app.cache.time.monotonic", return_value=1006.0):
+        assert cache.get("k") is None
+
+
+@patch("app.weather_utils._fetch_weather_day")
+def test_weather_day_fetched_once_per_date(mock_fetch):
+    """Toutes les heures d'une même journée sont servies par un seul appel Open-Meteo."""
+    mock_fetch.side_effect = lambda date_str, is_archive: fake_day(date_str)
+    month, day = 1, 8
+
+    h3 = asyncio.run(weather_utils.get_weather_features(month, day, 3))
+    h12 = asyncio.run(weather_utils.get_weather_features(month, day, 12))
+
+    assert mock_fetch.call_count == 1
+    assert h3["temperature_2m"] == -2.0
+    assert h3["soleil_leve"] == 0 and h3["risque_gel_neige"] == 1
+    assert h12["temperature_2m"] == 7.0
+    assert h12["soleil_leve"] == 1 and h12["neige_fondue"] == 1
+
+
+@patch("app.weather_utils._fetch_weather_day")
+def test_weather_cache_ttl_depends_on_endpoint(mock_fetch):
+    mock_fetch.side_effect = lambda date_str, is_archive: fake_day(date_str)
+    year = datetime.now().year
+
+    with patch.object(weather_utils.weather_cache, "set", wraps=weather_utils.weather_cache.set) as mock_set:
+        asyncio.run(weather_utils._get_weather_day(f"{year}-01-01", is_archive=True))
+        asyncio.run(weather_utils._get_weather_day(f"{year}-01-02", is_archive=False))
+
+    assert mock_set.call_args_list[0].args[0] == (f"{year}-01-01", "archive")
+    assert mock_set.call_args_list[0].kwargs["ttl"] == weather_utils.WEATHER_ARCHIVE_TTL
+    assert mock_set.call_args_list[1].args[0] == (f"{year}-01-02", "forecast")
+    assert mock_set.call_args_list[1].kwargs["ttl"] == weather_utils.WEATHER_FORECAST_TTL
+
+
+@patch("app.weather_utils._fetch_weather_day")
+def test_weather_errors_are_not_cached(mock_fetch):
+    mock_fetch.side_effect = Exception("timeout")
+    with pytest.raises(Exception, match="Impossible de récupérer les données météo"):
+        asyncio.run(weather_utils.get_weather_features(1, 8, 3))
+
+    mock_fetch.side_effect = lambda date_str, is_archive: fake_day(date_str)
+    assert asyncio.run(weather_utils.get_weather_features(1, 8, 3))["weather_code"] == 71
+
+
+def test_weather_store_lookup(tmp_path):
+    """Le feature store est chargé depuis les tables stg_weather_* et consulté par index horaire."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'weather.db'}")
+    hours = pd.date_range("2025-01-08 00:00", periods=48, freq="h")
+    archive = pd.DataFrame({name: 1.0 for name in WEATHER_FEATURES}, index=range(48))
+    archive["timestamp_rounded"] = hours
+    archive["temperature_2m"] = range(48)
+    forecast = archive.iloc[24:].copy()
+    forecast["timestamp_rounded"] = forecast["timestamp_rounded"] + pd.Timedelta(hours=24)
+    forecast["temperature_2m"] = -1.0
+    archive.to_sql("stg_weather_archive", engine, index=False)
+    forecast.to_sql("stg_weather_forecast", engine, index=False)
+
+    store = WeatherStore()
+    assert store.refresh(engine) == 72
+
+    res = store.lookup(datetime(2025, 1, 9, 5))
+    assert res["temperature_2m"] == 29.0  # l'archive prime sur la prévision
+    assert res["weather_code"] == 1 and isinstance(res["weather_code"], int)
+    assert store.lookup(datetime(2025, 1, 10, 5))["temperature_2m"] == -1.0
+    assert store.lookup(datetime(2025, 1, 7, 23)) is None
+    assert store.lookup(datetime(2025, 1, 11, 0)) is None
+
+
+@patch("app.weather_utils._fetch_weather_day")
+def test_weather_store_hit_skips_http(mock_fetch):
+    year = datetime.now().year
+    df = pd.DataFrame({name: [0.0] for name in WEATHER_FEATURES})
+    df["timestamp_rounded"] = [datetime(year, 3, 2, 10)]
+    weather_store.load_frame(df)
+    try:
+        assert asyncio.run(weather_utils.get_weather_features(3, 2, 10))["temperature_2m"] == 0.0
+        mock_fetch.assert_not_called()
+
+        mock_fetch.side_effect = lambda date_str, is_archive: fake_day(date_str)
+        assert asyncio.run(weather_utils.get_weather_features(3, 2, 11))["temperature_2m"] == 6.0
+        mock_fetch.assert_called_once()
+    finally:
+        weather_store.load_frame(pd.DataFrame())
+
+
+def test_weather_client_bounds_concurrency():
+    """Les appels simultanés vers Open-Meteo ne dépassent pas max_concurrency."""
+    in_flight, peak = 0, 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json={"start_date": request.url.params["start_date"]})
+
+    client = WeatherClient(timeout=1, connect_timeout=1, max_connections=5, max_concurrency=2,
+                           transport=httpx.MockTransport(handler))
+
+    async def run():
+        try:
+            return await asyncio.gather(*[
+                client.get_json("https://api.open-meteo.com/v1/forecast", {"start_date": f"2025-01-0{i}"})
+                for i in range(1, 7)
+            ])
+        finally:
+            await client.aclose()
+
+    results = asyncio.run(run())
+    assert [r["start_date"] for r in results] == [f"2025-01-0{i}" for i in range(1, 7)]
+    assert peak == 2
+
+
+def test_weather_client_raises_on_http_error():
+    client = WeatherClient(timeout=1, connect_timeout=1, max_connections=1, max_concurrency=1,
+                           transport=httpx.MockTransport(lambda request: httpx.Response(503)))
+
+    async def run():
+        try:
+            await client.get_json("https://api.open-meteo.com/v1/forecast", {})
+        finally:
+            await client.aclose()
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(run())
+
+
+@patch("app.weather_utils._fetch_weather_day")
+def test_concurrent_lookups_share_one_fetch(mock_fetch):
+    """Une rafale de requêtes sur la même journée ne déclenche qu'un appel Open-Meteo."""
+    async def slow_fetch(date_str, is_archive):
+        await asyncio.sleep(0.01)
+        return fake_day(date_str)
+
+    mock_fetch.side_effect = slow_fetch
+    coalesced_before = weather_utils.weather_single_flight.coalesced
+
+    async def burst():
+        return await asyncio.gather(*[weather_utils.get_weather_features(1, 8, h) for h in range(10)])
+
+    results = asyncio.run(burst())
+
+    assert mock_fetch.call_count == 1
+    assert [r["temperature_2m"] for r in results] == [float(h) - 5 for h in range(10)]
+    assert weather_utils.weather_single_flight.coalesced - coalesced_before == 9
+    assert weather_utils.weather_single_flight.stats()["in_flight"] == 0
+
+
+@patch("app.weather_utils._fetch_weather_day")
+def test_coalesced_callers_share_errors(mock_fetch):
+    async def failing_fetch(date_str, is_archive):
+        await asyncio.sleep(0.01)
+        raise httpx.ConnectError("down")
+
+    mock_fetch.side_effect = failing_fetch
+
+    async def burst():
+        return await asyncio.gather(
+            *[weather_utils.get_weather_features(1, 8, h) for h in range(3)], return_exceptions=True
+        )
+
+    results = asyncio.run(burst())
+    assert mock_fetch.call_count == 1
+    assert all("Impossible de récupérer les données météo" in str(r) for r in results)
+
+
+def test_circuit_breaker_states():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    with patch("app.circuit_breaker.time.monotonic", return_value=100.0):
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow()
+
+    with patch("app.circuit_breaker.time.monotonic", return_value=131.0):
+        # Semi-ouvert : un seul essai à la fois ; son échec rouvre le disjoncteur
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+    with patch("app.circuit_breaker.time.monotonic", return_value=162.0):
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed"
+    assert breaker.stats()["opens"] == 2
+
+
+@patch("app.weather_utils._fetch_weather_day")
+def test_weather_falls_back_to_last_good_day(mock_fetch):
+    """Open-Meteo en échec : la dernière réponse valide de la journée est servie, marquée dégradée."""
+    mock_fetch.side_effect = lambda date_str, is_archive: fake_day(date_str)
+    fresh = asyncio.run(weather_utils.get_weather_features(1, 8, 3))
+    assert "weather_degraded" not in fresh
+
+    weather_utils.weather_cache.clear()
+    mock_fetch.side_effect = httpx.ConnectError("down")
+    res = asyncio.run(weather_utils.get_weather_features(1, 8, 3))
+    assert res == {**fresh, "weather_degraded": True}
+
+
+@patch("app.weather_utils._fetch_weather_day")
+def test_open_breaker_serves_climatology_without_calling(mock_fetch):
+    mock_fetch.side_effect = httpx.ConnectError("down")
+    year = datetime.now().year
+    store = WeatherStore()
+    df = pd.DataFrame({name: [1.0, 3.0, 5.0] for name in WEATHER_FEATURES})
+    df["timestamp_rounded"] = [datetime(year - 1, 1, d, 3) for d in (1, 2, 3)]
+    store.load_frame(df)
+    climatology.build(store)
+
+    try:
+        for _ in range(weather_utils.weather_breaker.failure_threshold):
+            with pytest.raises(Exception):
+                asyncio.run(weather_utils.get_weather_features(1, 9, 4))
+        assert weather_utils.weather_breaker.state == "open"
+        calls = mock_fetch.call_count
+
+        res = asyncio.run(weather_utils.get_weather_features(1, 5, 3))
+        assert mock_fetch.call_count == calls
+        assert res["weather_degraded"] is True
+        assert res["temperature_2m"] == 3.0  # moyenne sur la fenêtre autour du 5 janvier
+        assert res["weather_code"] == 1  # valeur la plus fréquente
+    finally:
+        climatology.build(WeatherStore())
+
+
+@patch("app.weather_utils._fetch_weather_day")
+def test_slow_weather_bounded_by_budget(mock_fetch, monkeypatch):
+    """Au-delà du budget, la requête n'attend plus Open-Meteo ; l'appel finit en arrière-plan."""
+    monkeypatch.setattr(weather_utils, "WEATHER_FETCH_BUDGET", 0.02)
+
+    async def slow_fetch(date_str, is_archive):
+        await asyncio.sleep(0.1)
+        return fake_day(date_str)
+
+    mock_fetch.side_effect = lambda date_str, is_archive: fake_day(date_str)
+    asyncio.run(weather_utils.get_weather_features(1, 8, 3))
+    weather_utils.weather_cache.clear()
+    mock_fetch.side_effect = slow_fetch
+
+    async def run():
+        res = await weather_utils.get_weather_features(1, 8, 3)
+        await asyncio.sleep(0.15)
+        return res
+
+    assert asyncio.run(run())["weather_degraded"] is True
+    # L'appel lent a tout de même rempli le cache, mais compte comme un échec
+    assert weather_utils.weather_cache.get((f"{datetime.now().year}-01-08", "archive")) is not None or \
+        weather_utils.weather_cache.get((f"{datetime.now().year}-01-08", "forecast")) is not None
+    assert weather_utils.weather_breaker.stats()["consecutive_failures"] == 1
+
+
+@patch("app.weather_utils._fetch_weather_day")
+def test_slow_weather_awaited_without_fallback(mock_fetch, monkeypatch):
+    """Sans météo de repli, le budget ne s'applique pas : Open-Meteo est attendu jusqu'au délai HTTP."""
+    monkeypatch.setattr(weather_utils, "WEATHER_FETCH_BUDGET", 0.02)
+
+    async def slow_fetch(date_str, is_archive):
+        await asyncio.sleep(0.1)
+        return fake_day(date_str)
+
+    mock_fetch.side_effect = slow_fetch
+    res = asyncio.run(weather_utils.get_weather_features(1, 8, 3))
+    assert "weather_degraded" not in res
+    assert res["temperature_2m"] == -2.0
+
+    # Au-delà du délai HTTP, l'erreur indique le dépassement
+    weather_utils.weather_cache.clear()
+    weather_utils.weather_last_good.clear()
+    monkeypatch.setattr(weather_utils, "WEATHER_HTTP_TIMEOUT", 0.02)
+    with pytest.raises(Exception, match="pas de réponse d'Open-Meteo en 0.02 s"):
+        asyncio.run(weather_utils.get_weather_features(1, 8, 3))
+
+
+@patch("app.weather_utils._fetch_weather_day")
+def test_healthy_requests_do_not_touch_fallbacks(mock_fetch):
+    """La météo de repli n'est ni lue ni comptée tant qu'Open-Meteo répond."""
+    mock_fetch.side_effect = lambda date_str, is_archive: fake_day(date_str)
+    last_good_hits, climatology_hits = weather_utils.weather_last_good.hits, climatology.hits
+
+    for hour in range(10):
+        assert "weather_degraded" not in asyncio.run(weather_utils.get_weather_features(1, 8, hour))
+
+    assert mock_fetch.call_count == 1
+    assert weather_utils.weather_last_good.hits == last_good_hits
+    assert climatology.hits == climatology_hits
+
+
+def test_climatology_by_day_of_year_from_archives():
+    """La climatologie n'utilise que les archives, par jour de l'année lissé sur une fenêtre."""
+    store = WeatherStore()
+    archive = pd.DataFrame({name: 0.0 for name in WEATHER_FEATURES}, index=range(4))
+    archive["timestamp_rounded"] = [datetime(2024, 6, 1, 12), datetime(2025, 6, 3, 12),
+                                    datetime(2025, 1, 1, 12), datetime(2025, 12, 20, 12)]
+    archive["temperature_2m"] = [20.0, 24.0, -4.0, -10.0]
+    archive["weather_code"] = [3, 3, 71, 71]
+    archive["observed"] = True
+    forecast = archive.iloc[:1].copy()
+    forecast["timestamp_rounded"] = [datetime(2025, 6, 2, 12)]
+    forecast["temperature_2m"] = 100.0
+    forecast["observed"] = False
+    store.load_frame(pd.concat([forecast, archive], ignore_index=True))
+
+    clim = climatology.__class__(window_days=3)
+    assert clim.build(store) > 0
+    june = clim.lookup(datetime(2026, 6, 2, 12))
+    assert june["temperature_2m"] == 22.0  # prévision écartée
+    assert june["weather_code"] == 3
+    # Fenêtre circulaire : le 31 décembre voit le 1er janvier, pas le 20 décembre
+    assert clim.lookup(datetime(2026, 12, 31, 12))["temperature_2m"] == -4.0
+    assert clim.lookup(datetime(2026, 3, 1, 12)) is None
+
+
+@patch("app.weather_utils._fetch_weather_day")
+def test_out_of_horizon_dates_use_climatology(mock_fetch, monkeypatch):
+    """Au-delà de l'horizon des prévisions, aucune requête réseau n'est faite."""
+    monkeypatch.setattr(weather_utils, "WEATHER_FORECAST_HORIZON_DAYS", -1000)
+    store = WeatherStore()
+    df = pd.DataFrame({name: [2.0] for name in WEATHER_FEATURES})
+    df["timestamp_rounded"] = [datetime(datetime.now().year - 1, 1, 8, 3)]
+    store.load_frame(df)
+    climatology.build(store)
+
+    try:
+        res = asyncio.run(weather_utils.get_weather_features(1, 8, 3))
+        assert res["temperature_2m"] == 2.0
+        assert "weather_degraded" not in res
+        mock_fetch.assert_not_called()
+    finally:
+        climatology.build(WeatherStore())
+
+
+@patch("app.weather_utils._fetch_weather_day")
+def test_weather_range_fetches_each_day_once(mock_fetch):
+    """Un horizon qui passe minuit appelle Open-Meteo une fois par journée couverte."""
+    mock_fetch.side_effect = lambda date_str, is_archive: fake_day(date_str)
+    year = datetime.now().year
+
+    hours = asyncio.run(weather_utils.get_weather_range(datetime(year, 1, 8, 22), 6))
+
+    assert sorted(call.args[0] for call in mock_fetch.call_args_list) == [f"{year}-01-08", f"{year}-01-09"]
+    assert [h["temperature_2m"] for h in hours] == [17.0, 18.0, -5.0, -4.0, -3.0, -2.0]